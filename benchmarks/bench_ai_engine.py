@@ -0,0 +1,75 @@
+"""用本地模拟服务压测 AI 请求引擎：多个视频流同时调用 send_image_to_ai 的吞吐与连接复用情况。
+
+用法: python benchmarks/bench_ai_engine.py --streams 8 --requests 4 --latency 0.5 --concurrency 8
+引擎参数写入临时目录中的 ai_config.json（与 bench_pipeline 相同），不读取项目目录下的配置。
+"""
+import argparse
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from mock_ai_server import start_mock_server
+from src.ai_interface import send_image_to_ai
+
+FAKE_IMAGE = base64.b64encode(b'\xff\xd8' + b'\x00' * 2048 + b'\xff\xd9').decode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=4, help='每个视频流发送的请求数')
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rpm', type=int, default=6000, help='客户端令牌桶的每分钟请求数')
+    args = parser.parse_args()
+
+    server = start_mock_server(latency=args.latency)
+    directory = tempfile.mkdtemp(prefix='bench_ai_engine_')
+    shutil.copy(os.path.join(ROOT, 'prompt_templates.json'), directory)
+    with open(os.path.join(directory, 'ai_config.json'), 'w') as f:
+        json.dump({'ai_model': 'mock-model', 'api_key': 'mock-key', 'api_base': server.url, 'cache_enabled': False,
+                   'max_concurrency': args.concurrency, 'requests_per_minute': args.rpm,
+                   'rate_burst': args.concurrency}, f)
+    os.chdir(directory)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def run_stream(stream_id):
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            result = send_image_to_ai(FAKE_IMAGE, 'SAFETY_ANALYSIS_PROMPT', None,
+                                      'mock-model', 'mock-key', server.url, stream_id=stream_id)
+            with lock:
+                latencies.append((time.perf_counter() - start, result is not None))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_stream, args=(i,)) for i in range(args.streams)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = args.streams * args.requests
+    ok = sum(1 for _, success in latencies if success)
+    ordered = sorted(latency for latency, _ in latencies)
+    stats = server.stats()
+    print(f"requests: {ok}/{total} ok in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+    print(f"latency p50={ordered[len(ordered) // 2]:.3f}s max={ordered[-1]:.3f}s")
+    print(f"server: {stats['connections']} connections, max in flight {stats['max_in_flight']}")
+    server.shutdown()
+    os.chdir(ROOT)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
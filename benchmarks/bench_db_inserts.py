@@ -0,0 +1,88 @@
+"""对比"每条语句打开一次连接"与持久连接（WAL）两种写库方式的插入速度。
+
+用法: python benchmarks/bench_db_inserts.py --rows 2000 --threads 4
+在临时目录中建库，不会改动 video_streams.db。
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import db_handler
+
+RESULT = {"violation_detected": True, "description": "未佩戴安全帽", "people": [{"id": "p1", "features": "红色上衣"}]}
+
+
+def legacy_save_analysis_result(stream_id, analysis_result):
+    # 原实现：每次写入都新建连接、提交并关闭
+    conn = sqlite3.connect(db_handler.DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO analysis_results (stream_id, result, timestamp)
+        VALUES (?, ?, datetime('now'))
+    """, (stream_id, json.dumps(analysis_result)))
+    conn.commit()
+    conn.close()
+
+
+def run(save, rows, threads):
+    errors = []
+    per_thread = rows // threads
+
+    def worker(stream_id):
+        for _ in range(per_thread):
+            try:
+                save(stream_id, RESULT)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed, len(errors)
+
+
+def fresh_db(directory, name):
+    db_handler.close_db_connections()
+    db_handler.DB_PATH = os.path.join(directory, name)
+    db_handler.init_db()
+    db_handler.update_db_structure()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # 旧方式使用默认的 rollback journal
+        db_handler.DB_PATH = os.path.join(directory, 'legacy.db')
+        conn = sqlite3.connect(db_handler.DB_PATH)
+        conn.execute("CREATE TABLE analysis_results (id INTEGER PRIMARY KEY AUTOINCREMENT, stream_id INTEGER, "
+                     "timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, result JSON)")
+        conn.commit()
+        conn.close()
+        legacy_rate, legacy_errors = run(legacy_save_analysis_result, args.rows, args.threads)
+
+        fresh_db(directory, 'pooled.db')
+        pooled_rate, pooled_errors = run(db_handler.save_analysis_result, args.rows, args.threads)
+        db_handler.close_db_connections()
+
+    print(f"{args.rows} inserts, {args.threads} threads")
+    print(f"{'mode':<24}{'inserts/s':>12}{'errors':>8}")
+    print(f"{'connect per insert':<24}{legacy_rate:>12.0f}{legacy_errors:>8}")
+    print(f"{'persistent + WAL':<24}{pooled_rate:>12.0f}{pooled_errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""对比 stream_worker 在 full / grab 解码模式下每路视频流的 CPU 占用。
+
+用法: python benchmarks/bench_decode_modes.py --width 1920 --height 1080 --seconds 10
+会在临时目录生成一段合成视频（或用 --video 指定文件），每种模式各启动一个采集进程，
+按文件帧率读取，统计采集进程的 CPU 时间和写入缓冲区的帧数。
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.frame_buffer import SharedFrameBuffer
+from src.capture import stream_worker
+
+
+def make_video(path, width, height, fps, seconds):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(int(fps * seconds)):
+        frame = background.copy()
+        # 移动的色块，避免编码器把帧压成几乎为空的 P 帧
+        x = (i * 16) % max(1, width - 200)
+        frame[height // 3:height // 3 + 200, x:x + 200] = (0, 0, 255)
+        cv2.putText(frame, str(i), (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 5)
+        writer.write(frame)
+    writer.release()
+
+
+def measure(video, width, height, seconds, options, consumer_fps):
+    manager = multiprocessing.Manager()
+    status = manager.dict()
+    stop_event = multiprocessing.Event()
+    frame_buffer = SharedFrameBuffer(width, height)
+    process = multiprocessing.Process(target=stream_worker,
+                                      args=(0, video, status, stop_event, frame_buffer, 'safety', options))
+    process.start()
+    proc = psutil.Process(process.pid)
+    # 等待采集进程打开视频
+    deadline = time.time() + 10
+    while status.get(0) != 'streaming' and time.time() < deadline:
+        time.sleep(0.05)
+    start_cpu = sum(proc.cpu_times()[:2])
+    start_seq = frame_buffer.seq
+    start = time.perf_counter()
+    # 模拟预览等消费方按 consumer_fps 请求新帧
+    while time.perf_counter() - start < seconds:
+        if consumer_fps:
+            frame_buffer.request_frame()
+            time.sleep(1.0 / consumer_fps)
+        else:
+            time.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    cpu = sum(proc.cpu_times()[:2]) - start_cpu
+    frames = frame_buffer.seq - start_seq
+    stop_event.set()
+    process.join(5)
+    if process.is_alive():
+        process.terminate()
+    frame_buffer.close()
+    frame_buffer.unlink()
+    manager.shutdown()
+    return cpu / elapsed * 100, frames / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', help='使用已有视频文件，默认生成合成视频')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    modes = [
+        ('full', {'decode_mode': 'full'}, 0),
+        ('grab, 1 fps', {'decode_mode': 'grab', 'retrieve_fps': 1.0}, 0),
+        ('grab, on demand', {'decode_mode': 'grab', 'retrieve_fps': 0}, 0),
+        ('grab + preview 10 fps', {'decode_mode': 'grab', 'retrieve_fps': 1.0}, 10),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        video = args.video
+        if video is None:
+            video = os.path.join(directory, 'synthetic.mp4')
+            # 视频比测量时长多几秒，留出进程启动时间
+            make_video(video, args.width, args.height, args.fps, args.seconds + 5)
+        print(f"{args.width}x{args.height} @ {args.fps} fps, {args.seconds:.0f} s per mode")
+        print(f"{'mode':<24}{'CPU %':>8}{'frames/s':>10}")
+        for name, options, consumer_fps in modes:
+            cpu, fps = measure(video, args.width, args.height, args.seconds, options, consumer_fps)
+            print(f"{name:<24}{cpu:>8.1f}{fps:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
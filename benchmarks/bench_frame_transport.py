@@ -0,0 +1,129 @@
+"""对比 Manager().Queue 与共享内存环形缓冲区两种帧传输方式的开销。
+
+用法: python benchmarks/bench_frame_transport.py --width 1920 --height 1080 --frames 300
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.frame_buffer import SharedFrameBuffer
+
+
+def make_frames(width, height, count=8):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def queue_producer(frame_queue, width, height, frames, result_queue):
+    samples = make_frames(width, height)
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    for i in range(frames):
+        frame = samples[i % len(samples)]
+        # 与原 stream_worker 相同的"丢弃旧帧"逻辑
+        try:
+            frame_queue.put(frame, block=False)
+        except queue.Full:
+            try:
+                frame_queue.get_nowait()
+                frame_queue.put(frame, block=False)
+            except queue.Empty:
+                pass
+    result_queue.put((time.perf_counter() - start, time.process_time() - start_cpu))
+
+
+def shm_producer(frame_buffer, width, height, frames, result_queue):
+    samples = make_frames(width, height)
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    for i in range(frames):
+        frame_buffer.write(samples[i % len(samples)])
+    result_queue.put((time.perf_counter() - start, time.process_time() - start_cpu))
+    frame_buffer.close()
+
+
+def consume(get_frame, producer, duration_limit=120):
+    received = 0
+    start_cpu = time.process_time()
+    deadline = time.time() + duration_limit
+    while producer.is_alive() and time.time() < deadline:
+        frame = get_frame()
+        if frame is not None:
+            # 模拟消费方读取像素
+            int(frame[0, 0, 0])
+            received += 1
+        time.sleep(0.001)
+    return received, time.process_time() - start_cpu
+
+
+def run_queue(width, height, frames):
+    manager = multiprocessing.Manager()
+    manager_proc = psutil.Process(manager._process.pid)
+    manager_cpu_start = sum(manager_proc.cpu_times()[:2])
+    frame_queue = manager.Queue(maxsize=1)
+    result_queue = multiprocessing.Queue()
+    producer = multiprocessing.Process(target=queue_producer, args=(frame_queue, width, height, frames, result_queue))
+    producer.start()
+
+    def get_frame():
+        try:
+            return frame_queue.get(block=False)
+        except queue.Empty:
+            return None
+
+    received, consumer_cpu = consume(get_frame, producer)
+    wall, producer_cpu = result_queue.get()
+    producer.join()
+    manager_cpu = sum(manager_proc.cpu_times()[:2]) - manager_cpu_start
+    manager.shutdown()
+    return wall, producer_cpu, consumer_cpu, manager_cpu, received
+
+
+def run_shm(width, height, frames):
+    frame_buffer = SharedFrameBuffer(width, height)
+    result_queue = multiprocessing.Queue()
+    producer = multiprocessing.Process(target=shm_producer, args=(frame_buffer, width, height, frames, result_queue))
+    producer.start()
+    last_seq = [0]
+
+    def get_frame():
+        if frame_buffer.seq == last_seq[0]:
+            return None
+        latest = frame_buffer.read_latest()
+        if latest is None:
+            return None
+        last_seq[0] = latest[0]
+        return latest[1]
+
+    received, consumer_cpu = consume(get_frame, producer)
+    wall, producer_cpu = result_queue.get()
+    producer.join()
+    frame_buffer.close()
+    frame_buffer.unlink()
+    return wall, producer_cpu, consumer_cpu, 0.0, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"{args.frames} frames @ {args.width}x{args.height}")
+    print(f"{'transport':<12}{'fps':>10}{'producer cpu':>15}{'consumer cpu':>15}{'manager cpu':>14}{'received':>10}")
+    for name, runner in (('queue', run_queue), ('shm', run_shm)):
+        wall, producer_cpu, consumer_cpu, manager_cpu, received = runner(args.width, args.height, args.frames)
+        print(f"{name:<12}{args.frames / wall:>10.1f}{producer_cpu:>14.2f}s{consumer_cpu:>14.2f}s"
+              f"{manager_cpu:>13.2f}s{received:>10}")
+
+
+if __name__ == '__main__':
+    main()
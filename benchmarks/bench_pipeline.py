@@ -0,0 +1,263 @@
+"""端到端压测：合成视频源 + 本地模拟 AI 服务，测量 1 到数百路视频流时整条流水线的开销。
+
+用法: python benchmarks/bench_pipeline.py --streams 1,10,50,200 --duration 30 --width 1280 --height 720
+每个规模在独立的临时目录中以无界面模式（headless.py）运行，数据库、配置和日志互不影响。
+模拟服务运行在本进程中，不计入被测进程的 CPU 和内存。输出：
+- grab/decode fps: 所有流每秒读取和解码（写入帧缓冲区）的帧数；
+- analyses/s: 每秒成功的分析数，errors 和 retries(429/5xx) 为测量期间的失败和重试次数；
+- cpu %: 被测进程及其采集子进程的平均 CPU 占用（100 表示一个核），rss: 峰值常驻内存之和；
+- frame->result / ai: 帧从采集到结果入库的延迟和其中 AI 请求的耗时（来自 /trace）。
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from mock_ai_server import start_mock_server
+from synthetic_video import make_sources
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def prepare(directory, sources, args, api_base, metrics_port):
+    os.makedirs(os.path.join(directory, 'logs'))
+    with open(os.path.join(directory, 'settings.json'), 'w') as f:
+        json.dump({
+            'analysis_interval': args.analysis_interval,
+            'analysis_workers': args.analysis_workers,
+            'capture_backend': args.capture_backend,
+            'capture_pool_size': args.pool_size,
+            'loop_files': True,
+            'metrics_port': metrics_port,
+            'trace_capacity': 100000,
+        }, f)
+    with open(os.path.join(directory, 'ai_config.json'), 'w') as f:
+        json.dump({
+            'ai_model': 'bench', 'api_key': 'bench', 'api_base': api_base, 'cache_enabled': False,
+            'max_concurrency': args.ai_concurrency, 'requests_per_minute': args.rpm, 'rate_burst': args.ai_concurrency,
+            'request_timeout': 30, 'max_attempts': 3,
+        }, f)
+    shutil.copy(os.path.join(ROOT, 'prompt_templates.json'), directory)
+    subprocess.run([sys.executable, '-c',
+                    f"import sys; sys.path.insert(0, {ROOT!r}); from src import db_handler; db_handler.init_db()\n"
+                    f"for url in {sources!r}: db_handler.add_stream(url)"],
+                   cwd=directory, check=True, capture_output=True)
+
+
+def fetch(url, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read().decode('utf-8')
+
+
+def parse_metrics(text):
+    """把 Prometheus 文本解析为 [(名称, {标签}, 值)]。"""
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name_labels, value = line.rsplit(' ', 1)
+        name, _, labels = name_labels.partition('{')
+        pairs = dict(pair.split('=', 1) for pair in labels.rstrip('}').split(',') if pair)
+        samples.append((name, {key: value.strip('"') for key, value in pairs.items()}, float(value)))
+    return samples
+
+
+def total(samples, name, **labels):
+    return sum(value for sample_name, sample_labels, value in samples
+               if sample_name == name and all(sample_labels.get(key) == str(v) for key, v in labels.items()))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def trace_durations(trace, since):
+    """从 Chrome trace 中取测量期间完成的帧：返回 (整帧耗时列表, AI 阶段耗时列表)，单位为秒。"""
+    begins, frames, ai = {}, [], []
+    for event in trace['traceEvents']:
+        if event.get('ph') == 'b':
+            begins[(event['id'], event['name'])] = event['ts']
+        elif event.get('ph') == 'e':
+            start = begins.pop((event['id'], event['name']), None)
+            if start is None or event['ts'] < since * 1e6:
+                continue
+            if event['name'].startswith('frame '):
+                frames.append((event['ts'] - start) / 1e6)
+            elif event['name'] == 'ai':
+                ai.append((event['ts'] - start) / 1e6)
+    return frames, ai
+
+
+class ProcessTreeSampler:
+    """累计被测进程及其子进程的 CPU 时间，记录常驻内存之和的峰值。"""
+
+    def __init__(self, pid):
+        self.root = psutil.Process(pid)
+        self.cpu_times = {}  # pid: 最近一次的 user+system
+        self.peak_rss = 0
+        self.cpu_seconds = 0.0
+
+    def sample(self):
+        try:
+            processes = [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        rss = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    times = process.cpu_times()
+                    rss += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+            cpu = times.user + times.system
+            self.cpu_seconds += cpu - self.cpu_times.get(process.pid, cpu)
+            self.cpu_times[process.pid] = cpu
+        self.peak_rss = max(self.peak_rss, rss)
+
+
+def run_scale(count, sources, args, server):
+    directory = tempfile.mkdtemp(prefix=f'bench_pipeline_{count}_')
+    metrics_port = free_port()
+    prepare(directory, sources[:count], args, server.url, metrics_port)
+    metrics_url = f'http://127.0.0.1:{metrics_port}'
+    with open(os.path.join(directory, 'logs', 'headless.out'), 'w') as output:
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'headless.py'), '--settings', 'settings.json',
+                                    '--log-level', 'WARNING'], cwd=directory, stdout=output, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                fetch(f'{metrics_url}/metrics', timeout=1)
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"Pipeline with {count} streams did not start, see {directory}/logs")
+                time.sleep(0.2)
+
+        sampler = ProcessTreeSampler(process.pid)
+        sampler.sample()
+        time.sleep(args.warmup)
+        server_before = server.stats()['statuses']
+        before = parse_metrics(fetch(f'{metrics_url}/metrics'))
+        sampler.sample()
+        cpu_before, started, started_wall = sampler.cpu_seconds, time.monotonic(), time.time()
+        sampler.peak_rss = 0
+        while time.monotonic() - started < args.duration:
+            time.sleep(1)
+            sampler.sample()
+        elapsed = time.monotonic() - started
+        after = parse_metrics(fetch(f'{metrics_url}/metrics'))
+        server_after = server.stats()['statuses']
+        frames, ai = trace_durations(json.loads(fetch(f'{metrics_url}/trace', timeout=30)), started_wall)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def delta(name, **labels):
+        return total(after, name, **labels) - total(before, name, **labels)
+
+    result = {
+        'streams': count,
+        'grab_fps': delta('capture_frames_grabbed_total') / elapsed,
+        'decode_fps': delta('capture_frames_decoded_total') / elapsed,
+        'analyses_per_second': delta('ai_requests_total', outcome='success') / elapsed,
+        'errors': delta('ai_requests_total', outcome='error'),
+        'retries_rate_limited': delta('ai_retries_total', reason='rate_limited'),
+        'retries_server_error': delta('ai_retries_total', reason='server_error'),
+        'rows_written': delta('db_write_rows_total', table='analysis_results'),
+        'server_statuses': {status: server_after.get(status, 0) - server_before.get(status, 0) for status in server_after},
+        'cpu_percent': 100 * (sampler.cpu_seconds - cpu_before) / elapsed,
+        'peak_rss_mb': sampler.peak_rss / 2 ** 20,
+        'frames_traced': len(frames),
+    }
+    for p in (50, 95, 99):
+        result[f'frame_to_result_p{p}'] = percentile(frames, p)
+        result[f'ai_p{p}'] = percentile(ai, p)
+    if not args.keep:
+        shutil.rmtree(directory, ignore_errors=True)
+    else:
+        result['directory'] = directory
+    return result
+
+
+def format_ms(value):
+    return f"{value * 1000:.0f}" if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', default='1,10,50', help='逗号分隔的视频流数量，例如 1,10,50,200')
+    parser.add_argument('--duration', type=float, default=20, help='每个规模的测量时长（秒）')
+    parser.add_argument('--warmup', type=float, default=5, help='开始测量前的预热时间（秒）')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=360)
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--codec', default='MJPG')
+    parser.add_argument('--capture-backend', choices=('process', 'pooled'), default='pooled')
+    parser.add_argument('--pool-size', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--analysis-interval', type=float, default=5)
+    parser.add_argument('--analysis-workers', type=int, default=8)
+    parser.add_argument('--ai-concurrency', type=int, default=16)
+    parser.add_argument('--rpm', type=int, default=6000, help='客户端令牌桶的每分钟请求数')
+    parser.add_argument('--latency', type=float, default=0.5, help='模拟 AI 服务的平均耗时（秒）')
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--json', help='把结果写入该 JSON 文件')
+    parser.add_argument('--keep', action='store_true', help='保留各规模的临时目录（含日志）')
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.streams.split(',')]
+    server = start_mock_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               rate_limit_rate=args.rate_limit_rate, seed=0)
+    video_dir = tempfile.mkdtemp(prefix='bench_pipeline_videos_')
+    results = []
+    try:
+        # 视频时长为测量时间的一半，确保测量期间经历文件回绕
+        sources = make_sources(video_dir, max(counts), args.width, args.height, args.fps,
+                               max(2, args.duration / 2), args.codec)
+        print(f"{'streams':>7}{'grab fps':>10}{'decode fps':>11}{'analyses/s':>11}{'errors':>7}{'retries':>8}"
+              f"{'cpu %':>7}{'rss MB':>8}{'frame->result p50/p95 ms':>26}{'ai p50/p95 ms':>15}")
+        for count in counts:
+            result = run_scale(count, sources, args, server)
+            results.append(result)
+            retries = result['retries_rate_limited'] + result['retries_server_error']
+            print(f"{count:>7}{result['grab_fps']:>10.0f}{result['decode_fps']:>11.1f}"
+                  f"{result['analyses_per_second']:>11.2f}{result['errors']:>7.0f}{retries:>8.0f}"
+                  f"{result['cpu_percent']:>7.0f}{result['peak_rss_mb']:>8.0f}"
+                  f"{format_ms(result['frame_to_result_p50']) + '/' + format_ms(result['frame_to_result_p95']):>26}"
+                  f"{format_ms(result['ai_p50']) + '/' + format_ms(result['ai_p95']):>15}", flush=True)
+    finally:
+        server.shutdown()
+        shutil.rmtree(video_dir, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
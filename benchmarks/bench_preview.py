@@ -0,0 +1,187 @@
+"""比较不同摄像头分辨率下预览路径的开销：缩略图通道 vs 旧的轮询全分辨率帧。
+
+用法: python benchmarks/bench_preview.py --resolutions 640x360,1920x1080,3840x2160 --seconds 10
+      python benchmarks/bench_preview.py --wall 32 --resolutions 1280x720
+- thumbnail: 与 VideoThread 相同，get_preview() 等待采集进程写入的 RGB 缩略图，只在序号变化时处理；
+- legacy: 旧实现，每 10 毫秒 request_frame + get_latest_frame，再做 cvtColor 和缩放到 320x240。
+reader cpu 为预览线程所在进程的 CPU 占用，capture cpu 为采集进程的 CPU 占用（100 表示一个核）。
+--wall N 时以 offscreen 平台运行图形界面的 PreviewWall（N 路流，采集池模式），分别测量预览墙可见和隐藏
+（不再请求缩略图）时界面进程和采集进程的 CPU 占用，以及每秒重绘的格子数。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from synthetic_video import make_video
+from src.db_handler import init_db
+from src.stream_manager import StreamManager
+
+
+def read_thumbnails(manager, stream_id, deadline):
+    frames, last_seq = 0, 0
+    while time.monotonic() < deadline:
+        preview = manager.get_preview(stream_id, last_seq, wait=0.5)
+        if preview is not None:
+            last_seq, rgb_image = preview
+            frames += 1
+    return frames
+
+
+def read_legacy(manager, stream_id, deadline):
+    frames = 0
+    while time.monotonic() < deadline:
+        manager.request_frame(stream_id)
+        frame = manager.get_latest_frame(stream_id)
+        if frame is not None:
+            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            h, w = rgb_image.shape[:2]
+            scale = min(320 / w, 240 / h)
+            cv2.resize(rgb_image, (int(w * scale), int(h * scale)))
+            frames += 1
+        time.sleep(0.01)
+    return frames
+
+
+def measure(path, width, height, mode, seconds):
+    manager = StreamManager()
+    manager.initialize()
+    manager.frame_buffer_size = (max(1920, width), max(1080, height))
+    manager.configure({'loop_files': True, 'analysis_interval': 3600})
+    manager.add_stream(1, path)
+    manager.start_all_streams()
+    try:
+        # 等待第一帧，排除采集进程的启动开销
+        deadline = time.monotonic() + 10
+        while manager.get_preview(1, 0, wait=0.2) is None and time.monotonic() < deadline:
+            pass
+        capture = psutil.Process(manager.processes[1].pid)
+        reader = psutil.Process()
+        capture_start, reader_start = capture.cpu_times(), reader.cpu_times()
+        rss_before = reader.memory_info().rss
+        start = time.monotonic()
+        reader_fn = read_thumbnails if mode == 'thumbnail' else read_legacy
+        frames = reader_fn(manager, 1, start + seconds)
+        elapsed = time.monotonic() - start
+        capture_end, reader_end = capture.cpu_times(), reader.cpu_times()
+        rss_after = reader.memory_info().rss
+    finally:
+        manager.stop_all_streams().join()
+        manager.release_frame_buffers()
+
+    def cpu(before, after):
+        return 100 * (after.user + after.system - before.user - before.system) / elapsed
+
+    return frames / elapsed, cpu(reader_start, reader_end), cpu(capture_start, capture_end), (rss_after - rss_before) / 2 ** 20
+
+
+def measure_wall(path, count, seconds, visible):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QEventLoop, QTimer
+    sys.path.insert(0, ROOT)
+    from gui import PreviewWall
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    links = []
+    for i in range(count):
+        link = f'{path}.{i}.avi'  # 每路流一个路径，与 synthetic_video.make_sources 相同
+        if not os.path.exists(link):
+            os.symlink(path, link)
+        links.append(link)
+    manager = StreamManager()
+    manager.initialize()
+    manager.configure({'loop_files': True, 'analysis_interval': 3600, 'capture_backend': 'pooled',
+                       'capture_pool_size': os.cpu_count() or 4})
+    for i, link in enumerate(links):
+        manager.add_stream(i + 1, link)
+    manager.start_all_streams()
+    wall = PreviewWall(manager)
+    wall.resize(1280, 960)
+    wall.set_streams({stream_id: info['url'] for stream_id, info in manager.streams.items()})
+    wall.show()
+    wall.start()
+
+    def run_events(duration):
+        loop = QEventLoop()
+        QTimer.singleShot(int(duration * 1000), loop.quit)
+        loop.exec_()
+
+    try:
+        run_events(3)  # 等待所有采集线程启动
+        if not visible:
+            wall.hide()
+            run_events(1)
+        updates = [0]
+        original = wall.refresh
+
+        def counted_refresh():
+            before = dict(wall.last_seqs)
+            original()
+            updates[0] += sum(1 for stream_id, seq in wall.last_seqs.items() if before.get(stream_id) != seq)
+
+        wall.timer.timeout.disconnect()
+        wall.timer.timeout.connect(counted_refresh)
+        capture = [psutil.Process(process.pid) for process, _ in manager.capture_pool.workers]
+        reader = psutil.Process()
+        capture_start = sum(p.cpu_times().user + p.cpu_times().system for p in capture)
+        reader_start = reader.cpu_times()
+        start = time.monotonic()
+        run_events(seconds)
+        elapsed = time.monotonic() - start
+        capture_cpu = sum(p.cpu_times().user + p.cpu_times().system for p in capture) - capture_start
+        reader_end = reader.cpu_times()
+        reader_cpu = reader_end.user + reader_end.system - reader_start.user - reader_start.system
+    finally:
+        wall.stop()
+        wall.close()
+        manager.stop_all_streams().join()
+        manager.release_frame_buffers()
+    return updates[0] / elapsed, max(0.0, 100 * reader_cpu / elapsed), max(0.0, 100 * capture_cpu / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', default='640x360,1920x1080,3840x2160')
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--modes', default='thumbnail,legacy')
+    parser.add_argument('--wall', type=int, default=0, metavar='N', help='测量 N 路流的预览墙')
+    args = parser.parse_args()
+
+    if args.wall:
+        print(f"{'resolution':<12}{'wall':<9}{'tiles/s':>9}{'gui cpu %':>11}{'capture cpu %':>15}")
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            init_db()
+            for resolution in args.resolutions.split(','):
+                width, height = (int(value) for value in resolution.split('x'))
+                path = make_video(os.path.join(directory, f'{resolution}.avi'), width, height, args.fps, 4)
+                for visible in (True, False):
+                    tiles, gui_cpu, capture_cpu = measure_wall(path, args.wall, args.seconds, visible)
+                    print(f"{resolution:<12}{'visible' if visible else 'hidden':<9}{tiles:>9.1f}{gui_cpu:>11.1f}"
+                          f"{capture_cpu:>15.1f}", flush=True)
+        return
+
+    print(f"{'resolution':<12}{'mode':<11}{'preview fps':>12}{'reader cpu %':>14}{'capture cpu %':>15}{'rss delta MB':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # 日志和数据库文件写入临时目录
+        init_db()
+        for resolution in args.resolutions.split(','):
+            width, height = (int(value) for value in resolution.split('x'))
+            path = make_video(os.path.join(directory, f'{resolution}.avi'), width, height, args.fps, 4)
+            for mode in args.modes.split(','):
+                fps, reader_cpu, capture_cpu, rss = measure(path, width, height, mode, args.seconds)
+                print(f"{resolution:<12}{mode:<11}{fps:>12.1f}{reader_cpu:>14.1f}{capture_cpu:>15.1f}{rss:>14.1f}",
+                      flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""测量图形界面的启动开销：导入耗时（-X importtime）、窗口显示时间和第一帧时间。
+
+用法: python benchmarks/bench_startup.py --runs 3
+在临时目录中准备配置文件、一段合成视频和只含该视频的 video_streams.db，以 offscreen 平台
+启动 MainWindow（不需要显示器），时间均从启动 Python 解释器开始计算：
+- window: MainWindow 构造并 show() 完成；
+- first frame: 窗口显示后立即开始处理，直到第一帧写入共享内存缓冲区。
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import sys, time
+sys.path.insert(0, {root!r})
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+app = QApplication(sys.argv)
+from gui import MainWindow
+window = MainWindow()
+window.show()
+app.processEvents()
+print("WINDOW", time.time(), flush=True)
+window.start_processing()
+
+def poll():
+    buffers = window.stream_manager.frame_buffers
+    if any(frame_buffer.seq > 0 for frame_buffer in buffers.values()):
+        print("FIRST_FRAME", time.time(), flush=True)
+        window.stop_processing()
+        QTimer.singleShot(500, app.quit)
+    else:
+        QTimer.singleShot(5, poll)
+
+QTimer.singleShot(0, poll)
+QTimer.singleShot(30000, app.quit)
+app.exec_()
+'''
+
+
+def prepare(directory):
+    writer = cv2.VideoWriter(os.path.join(directory, 'video.avi'), cv2.VideoWriter_fourcc(*'MJPG'), 25, (640, 360))
+    for i in range(250):
+        frame = np.full((360, 640, 3), i % 255, np.uint8)
+        writer.write(frame)
+    writer.release()
+    with open(os.path.join(directory, 'settings.json'), 'w') as f:
+        json.dump({'analysis_interval': 3600}, f)
+    with open(os.path.join(directory, 'ai_config.json'), 'w') as f:
+        json.dump({'ai_model': 'bench', 'api_key': 'bench', 'api_base': 'http://127.0.0.1:9', 'cache_enabled': False}, f)
+    shutil.copy(os.path.join(ROOT, 'prompt_templates.json'), directory)
+    os.makedirs(os.path.join(directory, 'logs'), exist_ok=True)
+    subprocess.run([sys.executable, '-c',
+                    f"import sys; sys.path.insert(0, {ROOT!r}); from src import db_handler; "
+                    f"db_handler.init_db(); db_handler.add_stream({os.path.join(directory, 'video.avi')!r})"],
+                   cwd=directory, check=True, capture_output=True)
+
+
+def measure_startup(directory):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    start = time.time()
+    output = subprocess.run([sys.executable, '-c', PROBE.format(root=ROOT)], cwd=directory, env=env,
+                            capture_output=True, text=True, timeout=120).stdout
+    stamps = dict(re.findall(r'^(WINDOW|FIRST_FRAME) ([\d.]+)$', output, re.M))
+    window = float(stamps['WINDOW']) - start if 'WINDOW' in stamps else None
+    first_frame = float(stamps['FIRST_FRAME']) - start if 'FIRST_FRAME' in stamps else None
+    return window, first_frame
+
+
+def measure_imports(directory, top):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import sys; sys.path.insert(0, {ROOT!r}); import gui"],
+                            cwd=directory, capture_output=True, text=True).stderr
+    # -X importtime 先输出子模块再输出父模块，缩进表示嵌套层级
+    total, direct = 0, []
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)', line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)) // 2, match.group(4)
+        if depth == 0 and name == 'gui':
+            total = cumulative
+            break
+        if depth == 0:
+            direct = []  # 解释器启动时导入的其他顶层模块
+        elif depth == 1:
+            direct.append((cumulative, name))
+    return total, sorted(direct, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(directory)
+        total, direct = measure_imports(directory, args.top)
+        print(f"import gui: {total / 1000:.1f} ms")
+        for cumulative, name in direct:
+            print(f"  {name:<32}{cumulative / 1000:>8.1f} ms")
+
+        windows, first_frames = [], []
+        for _ in range(args.runs):
+            window, first_frame = measure_startup(directory)
+            if window is not None:
+                windows.append(window)
+            if first_frame is not None:
+                first_frames.append(first_frame)
+        if windows:
+            print(f"time to window:      {statistics.median(windows) * 1000:.0f} ms (median of {len(windows)})")
+        if first_frames:
+            print(f"time to first frame: {statistics.median(first_frames) * 1000:.0f} ms (median of {len(first_frames)})")
+
+
+if __name__ == '__main__':
+    main()
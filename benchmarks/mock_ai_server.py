@@ -0,0 +1,211 @@
+"""本地模拟的 /chat/completions 服务，用于在没有真实模型接口时测试和压测 AI 请求链路。
+
+用法: python benchmarks/mock_ai_server.py --port 8900 --latency 0.5 [--jitter 0.2] [--error-rate 0.01] [--rate-limit-rate 0.05]
+然后把 ai_config.json 的 api_base 指向 http://127.0.0.1:8900
+请求中 "stream": true 时以 SSE 分块返回，latency 为首个分块前的等待，之后每个分块间隔 token_delay 秒。
+error_rate 和 rate_limit_rate 为按概率注入 500 和 429（带 Retry-After）响应的比例，用于测试重试和限流。
+truncate_streams 为前若干个流式响应在 [DONE] 之前断开，用于测试截断重试。
+测试中可用 status_sequence 指定前几个请求依次返回的状态码，record_requests 为 True 时按到达顺序保存请求体。
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESULT = {
+    "violation_detected": False,
+    "description": "",
+    "people": [],
+}
+
+IMAGE_ID = re.compile(r'图片ID: (image_\d+)')
+
+
+class MockAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, result=None, token_delay=0.0, chunk_chars=8,
+                 jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=None, truncate_streams=0,
+                 status_sequence=(), record_requests=False):
+        super().__init__(address, MockAIHandler)
+        self.latency = latency
+        self.jitter = jitter  # 实际耗时在 latency ± jitter 内均匀分布
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.truncate_streams = truncate_streams
+        self.status_sequence = list(status_sequence)
+        self.record_requests = record_requests
+        self.received = []  # record_requests 为 True 时保存的请求体
+        self.random = random.Random(seed)
+        self.result = result or DEFAULT_RESULT
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.statuses = {}  # HTTP 状态码: 次数
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'connections': self.connections,
+                'max_in_flight': self.max_in_flight,
+                'statuses': dict(self.statuses),
+            }
+
+    def next_response(self):
+        """返回 (注入的状态码或 200, 模拟耗时)。"""
+        with self.lock:
+            roll = self.random.random()
+            latency = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            scripted = self.status_sequence.pop(0) if self.status_sequence else None
+        if scripted is not None:
+            return scripted, 0.0 if scripted == 429 else latency
+        if roll < self.rate_limit_rate:
+            return 429, 0.0  # 限流响应不经过模型，立即返回
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, latency
+        return 200, latency
+
+
+class MockAIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能保持 keep-alive 连接
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path.rstrip('/') != '/chat/completions':
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            request = json.loads(body or b'{}')
+            if server.record_requests:
+                with server.lock:
+                    server.received.append(request)
+            status, latency = server.next_response()
+            if latency:
+                time.sleep(latency)
+            if status == 429:
+                self.send_json(429, {"error": {"code": "1302", "message": "rate limited"}},
+                               {'Retry-After': str(server.retry_after)})
+                return
+            if status != 200:
+                self.send_json(status, {"error": {"message": "injected failure"}})
+                return
+            # 多图请求按图片ID分别返回结果
+            image_ids = IMAGE_ID.findall(json.dumps(request.get('messages', [])[-1:], ensure_ascii=False))
+            result = {image_id: server.result for image_id in image_ids} if image_ids else server.result
+            if request.get('stream'):
+                self.send_stream(request, json.dumps(result, ensure_ascii=False))
+                return
+            self.send_json(200, {
+                "id": request.get("request_id", ""),
+                "model": request.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps(result, ensure_ascii=False)},
+                    "finish_reason": "stop",
+                }],
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def send_stream(self, request, content):
+        self.count_status(200)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        step = self.server.chunk_chars
+        for offset in range(0, len(content), step):
+            if offset and self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            self.write_chunk({"id": request.get("request_id", ""), "model": request.get("model", "mock"),
+                              "choices": [{"index": 0, "delta": {"content": content[offset:offset + step]}}]})
+        with self.server.lock:
+            truncate = self.server.truncate_streams > 0
+            self.server.truncate_streams -= truncate
+        if not truncate:
+            self.write_chunk('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def count_status(self, status):
+        with self.server.lock:
+            self.server.statuses[status] = self.server.statuses.get(status, 0) + 1
+
+    def write_chunk(self, data):
+        text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+        event = f"data: {text}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, data, headers=None):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.count_status(status)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_mock_server(port=0, **options):
+    """在后台线程中启动模拟服务，返回 server（server.url 为 api_base）。"""
+    server = MockAIServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.5, help='每个请求的模拟耗时（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='耗时的随机波动范围（秒）')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='流式响应中每个分块的间隔（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 响应中的 Retry-After（秒）')
+    args = parser.parse_args()
+
+    server = MockAIServer(('127.0.0.1', args.port), latency=args.latency, token_delay=args.token_delay,
+                          jitter=args.jitter, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                          retry_after=args.retry_after)
+    print(f"Mock AI server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""生成压测用的合成视频源。
+
+用法: python benchmarks/synthetic_video.py OUTPUT_DIR --count 16 --width 1280 --height 720 --fps 25 --seconds 20
+画面为移动的色块和帧号（变化检测不会把它当作静止画面跳过）。多路视频流共用一个编码好的文件，
+其余路径为指向它的符号链接（不支持时复制），生成 200 路与生成 1 路的耗时相同。
+本地文件按文件帧率读取，配合 settings.json 中的 loop_files 循环播放，可代替真实摄像头或 RTSP 源。
+"""
+import argparse
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+
+def make_video(path, width=640, height=360, fps=25, seconds=10, codec='MJPG'):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write {path} with codec {codec}")
+    size = max(8, min(width, height) // 6)
+    frames = max(1, int(fps * seconds))
+    try:
+        for i in range(frames):
+            frame = np.full((height, width, 3), 40, np.uint8)
+            x = int((width - size) * (0.5 + 0.5 * np.sin(2 * np.pi * i / frames)))
+            y = int((height - size) * (0.5 + 0.5 * np.cos(4 * np.pi * i / frames)))
+            frame[y:y + size, x:x + size] = ((i * 7) % 255, 160, 255 - (i * 3) % 255)
+            cv2.putText(frame, f"{i:06d}", (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                        max(0.4, height / 720), (255, 255, 255), 2)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def make_sources(directory, count, width=640, height=360, fps=25, seconds=10, codec='MJPG'):
+    """返回 count 个不同的视频文件路径（数据库中的流 URL 不能重复）。"""
+    os.makedirs(directory, exist_ok=True)
+    base = make_video(os.path.join(directory, f'synthetic_{width}x{height}_{fps}.avi'), width, height, fps, seconds, codec)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'stream_{i + 1:03d}.avi')
+        if not os.path.exists(path):
+            try:
+                os.symlink(os.path.basename(base), path)
+            except OSError:
+                shutil.copy(base, path)
+        paths.append(os.path.abspath(path))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=360)
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--codec', default='MJPG', help='FourCC，例如 MJPG、XVID、mp4v')
+    args = parser.parse_args()
+    for path in make_sources(args.directory, args.count, args.width, args.height, args.fps, args.seconds, args.codec):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,25 +11,23 @@ import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLineEdit, 
                              QComboBox, QLabel, QTextEdit, QTableWidget, QTableWidgetItem, QDialog, QDialogButtonBox, 
                              QMessageBox, QCheckBox, QFormLayout, QSpinBox, QStyleFactory, QGridLayout, QSystemTrayIcon, 
-                             QMenu, QAction, QDesktopWidget, QGroupBox, QInputDialog, QTabWidget)
+                             QMenu, QAction, QDesktopWidget, QGroupBox, QInputDialog, QTabWidget, QScrollArea)
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThread, pyqtSlot
 from PyQt5.QtGui import QPalette, QColor, QImage, QPixmap, QIcon
-from src.db_handler import init_db, add_stream, remove_stream, get_all_streams, update_db_structure
+from src.db_handler import init_db, add_stream, remove_stream, get_all_streams
 from src.stream_manager import StreamManager
+from src import tracing
 import logging
 import json
 import time
 import threading
 import subprocess
-import psutil
 import os
-import cv2
 from utils import resource_path
-from PIL import Image
-import io
 import base64
+import math
 from datetime import datetime
-from src.ai_interface import send_image_to_ai, AIInterface
+# OpenCV、PIL、requests、flask 等较重的依赖在第一次用到时才导入，窗口可以尽快显示
 
 def update_ai_config_from_default():
     try:
@@ -146,19 +144,26 @@ class SettingsDialog(QDialog):
             pass
     
     def save_settings(self):
-        settings = {
+        # 保留 settings.json 中对话框未涉及的配置项（如 stream_intervals）
+        try:
+            with open(resource_path('settings.json'), 'r') as f:
+                settings = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            settings = {}
+        settings.update({
             'analysis_interval': self.analysis_interval.value(),
             'theme': self.theme_combo.currentText(),
-        }
+        })
         with open(resource_path('settings.json'), 'w') as f:
             json.dump(settings, f)
 
-        # 保存 AI 模型设置
-        ai_config = {
+        # 保存 AI 模型设置（保留 ai_config.json 中的其他配置项，如 max_concurrency）
+        ai_config = load_ai_config()
+        ai_config.update({
             'ai_model': self.ai_model.text(),
             'api_key': self.api_key.text(),
             'api_base': self.api_base.text()
-        }
+        })
         with open(resource_path('ai_config.json'), 'w') as f:
             json.dump(ai_config, f, indent=2)
 
@@ -166,56 +171,111 @@ class SettingsDialog(QDialog):
         self.save_settings()
         super().accept()
 
-class VideoThread(QThread):
-    change_pixmap_signal = pyqtSignal(QImage)
-    error_signal = pyqtSignal(str)
-
-    def __init__(self, stream_manager, source, is_camera=False):
-        super().__init__()
-        self.stream_manager = stream_manager
-        self.source = source
-        self.is_camera = is_camera
-        self._run_flag = True
-        self.logger = logging.getLogger(__name__)
-        self.last_frame_time = time.time()
-        self.retry_count = 0
-        self.max_retries = 20
-        self.retry_interval = 0.5  # 减少重试间隔
+class PreviewWall(QScrollArea):
+    """多路视频流的预览墙：一个 QTimer 批量读取各路流的缩略图，只重绘有新帧的格子。
 
-    def run(self):
-        self.logger.info(f"VideoThread started for source: {self.source}")
-        while self._run_flag:
-            try:
-                frame = self.stream_manager.get_latest_frame(self.source)
-                if frame is not None:
-                    rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    h, w, ch = rgb_image.shape
-                    bytes_per_line = ch * w
-                    convert_to_Qt_format = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                    p = convert_to_Qt_format.scaled(320, 240, Qt.KeepAspectRatio)
-                    self.change_pixmap_signal.emit(p)
-                    self.retry_count = 0  # 重置重试计数
-                else:
-                    self.retry_count += 1
-                    if self.retry_count > self.max_retries:
-                        self.error_signal.emit(f"无法获取源 {self.source} 的帧，已重试 {self.max_retries} 次")
-                        break
-                    time.sleep(self.retry_interval)  # 等待后重试
-            except Exception as e:
-                self.logger.error(f"Error in VideoThread for source {self.source}: {str(e)}")
-                self.error_signal.emit(f"视频线程错误 (源 {self.source}): {str(e)}")
-                self.retry_count += 1
-                if self.retry_count > self.max_retries:
-                    break
-                time.sleep(self.retry_interval)  # 等待后重试
-
-            time.sleep(0.01)  # 减少睡眠时间，提高帧率
+    缩略图由采集进程生成（见 StreamManager.get_preview）。只为可见的格子请求下一张缩略图，
+    滚动到视野外、窗口最小化或预览墙隐藏时，采集进程不再为这些流生成缩略图。
+    """
 
-        self.logger.info(f"VideoThread stopped for source: {self.source}")
+    def __init__(self, stream_manager, fps=10, stale_seconds=5, parent=None):
+        super().__init__(parent)
+        self.stream_manager = stream_manager
+        self.stale_seconds = stale_seconds  # 超过该时间没有新画面时在格子中提示
+        self.setWidgetResizable(True)
+        self.container = QWidget()
+        self.grid = QGridLayout(self.container)
+        self.grid.setContentsMargins(0, 0, 0, 0)
+        self.grid.setSpacing(2)
+        self.setWidget(self.container)
+        self.tiles = {}  # stream_id: QLabel
+        self.last_seqs = {}  # stream_id: 已显示的缩略图序号
+        self.last_update = {}  # stream_id: 最近一次更新的 time.monotonic()
+        self.stale = set()
+        self.columns = 1
+        self.running = False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        self.timer.setInterval(max(10, int(1000 / fps)) if fps > 0 else 1000)
+
+    def set_streams(self, streams):
+        """streams 为 {stream_id: url}，按流 ID 的顺序排成接近正方形的网格。"""
+        for tile in self.tiles.values():
+            self.grid.removeWidget(tile)
+            tile.deleteLater()
+        self.tiles.clear()
+        self.last_seqs.clear()
+        self.last_update.clear()
+        self.stale.clear()
+        self.columns = max(1, math.ceil(math.sqrt(len(streams))))
+        now = time.monotonic()
+        for index, (stream_id, url) in enumerate(streams.items()):
+            tile = QLabel(f"{stream_id}\n等待画面...")
+            tile.setAlignment(Qt.AlignCenter)
+            tile.setToolTip(f"{stream_id}: {url}")
+            tile.setStyleSheet("background-color: black; color: gray;")
+            self.grid.addWidget(tile, index // self.columns, index % self.columns)
+            self.tiles[stream_id] = tile
+            self.last_update[stream_id] = now
+        self.layout_tiles()
+
+    def layout_tiles(self):
+        # 格子按视口宽度等分，保持 4:3；行数多时在纵向滚动
+        width = self.viewport().width() - self.grid.spacing() * (self.columns - 1)
+        tile_width = max(80, width // self.columns)
+        for tile in self.tiles.values():
+            tile.setFixedSize(tile_width, tile_width * 3 // 4)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.layout_tiles()
+
+    def start(self):
+        self.running = True
+        self.timer.start()
 
     def stop(self):
-        self._run_flag = False
-        self.wait()
+        self.running = False
+        self.timer.stop()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.running:
+            self.timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def visible_streams(self):
+        if not self.isVisible() or self.window().isMinimized():
+            return []
+        return [stream_id for stream_id, tile in self.tiles.items() if not tile.visibleRegion().isEmpty()]
+
+    def refresh(self):
+        visible = self.visible_streams()
+        if not visible:
+            return
+        previews = self.stream_manager.read_previews({stream_id: self.last_seqs.get(stream_id, 0) for stream_id in visible})
+        now = time.monotonic()
+        for stream_id, (seq, rgb_image) in previews.items():
+            tile = self.tiles[stream_id]
+            h, w, ch = rgb_image.shape
+            # QPixmap.fromImage 会复制数据，此后不再引用 rgb_image
+            image = QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888)
+            tile.setPixmap(QPixmap.fromImage(image).scaled(tile.size(), Qt.KeepAspectRatio, Qt.FastTransformation))
+            self.last_seqs[stream_id] = seq
+            self.last_update[stream_id] = now
+            self.stale.discard(stream_id)
+        for stream_id in visible:
+            if stream_id not in self.stale and now - self.last_update[stream_id] > self.stale_seconds:
+                self.stale.add(stream_id)
+                self.tiles[stream_id].setText(f"{stream_id}\n无画面")
+        # 读完本轮的新图后再请求下一张，采集进程按 preview_fps 限制生成频率
+        self.stream_manager.request_previews(visible)
 
 class StopProcessingThread(QThread):
     finished = pyqtSignal()
@@ -241,12 +301,14 @@ class CameraTestWindow(QWidget):
         layout.addWidget(self.label)
         self.setLayout(layout)
 
+        import cv2
         self.capture = cv2.VideoCapture(self.camera_index)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_frame)
         self.timer.start(30)  # 更新频率约33FPS
 
     def update_frame(self):
+        import cv2
         ret, frame = self.capture.read()
         if ret:
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -291,6 +353,7 @@ class MainWindow(QMainWindow):
     update_analysis_result_signal = pyqtSignal(str)
     log_signal = pyqtSignal(str, int)
     update_detailed_info_signal = pyqtSignal(str, str, str, str)
+    violation_alert_signal = pyqtSignal(str, float)
 
     def __init__(self):
         super().__init__()
@@ -308,9 +371,10 @@ class MainWindow(QMainWindow):
         self.analysis_interval = 3
         self.theme = '跟随系统'
 
-        self.init_ui()
+        # 预览墙在 init_ui 中创建，需要先有 stream_manager
         self.stream_manager = StreamManager()
         self.stream_manager.initialize()
+        self.init_ui()
         self.load_existing_streams()
         self.load_settings()  # 加载设置
         self.log(f"初始设置加载完成。")
@@ -326,7 +390,6 @@ class MainWindow(QMainWindow):
         handler.setFormatter(formatter)
         logger.addHandler(handler)
 
-        self.stream_thread = None
         self.is_processing = False
 
         # 应用当前系统主题
@@ -350,7 +413,7 @@ class MainWindow(QMainWindow):
         # 在 MainWindow 类的 __init__ 方法中添加：
         self.total_analysis_count = 0
 
-        self.ai_interface = AIInterface(self.api_key, self.api_base, self.ai_model)
+        self.ai_interface = None  # 第一次清除记忆时创建
 
         # 连接信号到相应的槽
         self.update_analysis_count_signal.connect(self.update_analysis_count_slot)
@@ -358,6 +421,10 @@ class MainWindow(QMainWindow):
         self.update_analysis_result_signal.connect(self.display_analysis_result)
         self.log_signal.connect(self.log_slot)
         self.update_detailed_info_signal.connect(self.update_detailed_info_slot)
+        # 流式回复中一出现违规就提示，不等完整结果（在 AI 请求线程中触发，经信号转到界面线程）
+        self.violation_alert_signal.connect(self.show_violation_alert)
+        self.stream_manager.add_alert_listener(
+            lambda stream_id, source_info, elapsed: self.violation_alert_signal.emit(str(source_info), elapsed))
 
     def center(self):
         qr = self.frameGeometry()
@@ -424,6 +491,12 @@ class MainWindow(QMainWindow):
         stats_layout = QVBoxLayout()
         self.analysis_count_label = QLabel("累计分析次数: 0")
         stats_layout.addWidget(self.analysis_count_label)
+        self.motion_skip_label = QLabel("画面无变化跳过: 0")
+        stats_layout.addWidget(self.motion_skip_label)
+        self.cache_hit_label = QLabel("结果缓存命中率: 0%")
+        stats_layout.addWidget(self.cache_hit_label)
+        self.payload_size_label = QLabel("平均请求大小: 0 KB")
+        stats_layout.addWidget(self.payload_size_label)
         stats_group.setLayout(stats_layout)
         
         # 将统计区块添加到左侧布局中
@@ -463,11 +536,11 @@ class MainWindow(QMainWindow):
         self.right_widget = QWidget()
         self.right_layout = QVBoxLayout(self.right_widget)
         
-        # 视频流标签
-        self.stream_label = QLabel()
-        self.stream_label.setFixedSize(320, 240)
-        self.stream_label.hide()  # 初始时隐藏
-        self.right_layout.addWidget(self.stream_label)
+        # 所有视频流的预览墙
+        self.preview_wall = PreviewWall(self.stream_manager)
+        self.preview_wall.setMinimumSize(330, 250)
+        self.preview_wall.hide()  # 初始时隐藏
+        self.right_layout.addWidget(self.preview_wall)
 
         # 图集分析图片显示
         self.image_analysis_label = ClickableLabel()
@@ -513,6 +586,7 @@ class MainWindow(QMainWindow):
                 self.log(f"视频流已添加，ID为: {stream_id}")
                 self.stream_manager.add_stream(stream_id, url, prompt_template)
                 self.update_streams_table()
+                self.refresh_preview_wall()
                 self.url_input.clear()
         else:
             self.log("请输入有效的视频流地址", level=logging.WARNING)
@@ -535,8 +609,15 @@ class MainWindow(QMainWindow):
         self.stream_manager.remove_stream(stream_id)
         remove_stream(stream_id)  # 从数据库中删除
         self.update_streams_table()  # 更新UI
+        self.refresh_preview_wall()
         self.log(f"已删除视流 ID: {stream_id}")
 
+    def refresh_preview_wall(self):
+        # 预览进行中增删视频流时重建格子
+        if self.preview_wall.running:
+            self.preview_wall.set_streams({stream_id: stream_info['url']
+                                           for stream_id, stream_info in self.stream_manager.streams.items()})
+
     def toggle_stream_processing(self):
         if not self.is_processing:
             self.start_processing()
@@ -572,20 +653,15 @@ class MainWindow(QMainWindow):
             self.is_processing = False
 
     def start_analysis_thread(self):
-        self.analysis_thread = threading.Thread(target=self.run_analysis, daemon=True)
-        self.analysis_thread.start()
-
-    def run_analysis(self):
-        while self.is_processing:
-            for stream_id in self.stream_manager.streams:
-                frame = self.stream_manager.get_latest_frame(stream_id)
-                if frame is not None:
-                    source_info = f"Stream: {self.stream_manager.streams[stream_id]['url']}"
-                    prompt_template = self.stream_manager.streams[stream_id]['prompt_template']
-                    self.analyze_frame_thread(frame, source_info, stream_id, prompt_template)
-                else:
-                    self.log(f"无法获取视频帧 (源: {stream_id})", level=logging.WARNING)
-            time.sleep(10)  # 每次分析后等待10秒
+        # 由 StreamManager 的分析调度器按各流间隔取帧，并在有界线程池中执行
+        self.stream_manager.start_analysis(self.run_analysis, self.run_analysis_batch)
+
+    def run_analysis(self, stream_id, frame):
+        stream_info = self.stream_manager.streams.get(stream_id)
+        if stream_info is None:
+            return
+        source_info = f"Stream: {stream_info['url']}"
+        self.analyze_frame_thread(frame, source_info, stream_id, stream_info['prompt_template'])
 
     def stop_processing(self):
         try:
@@ -594,6 +670,7 @@ class MainWindow(QMainWindow):
             self.stop_thread = StopProcessingThread(self.stream_manager)
             self.stop_thread.finished.connect(self.on_stop_processing_finished)
             self.stop_thread.start()
+            self.stream_manager.stop_analysis()
             self.is_processing = False  # 停止分析线程
         except Exception as e:
             self.log(f"停止处理时发生错误: {str(e)}")
@@ -650,9 +727,16 @@ class MainWindow(QMainWindow):
             # 更新主题
             self.apply_theme(self.theme)
             
-            # 更新分析间隔
-            self.stream_manager.set_analysis_interval(self.analysis_interval)
+            # 更新分析间隔、线程池和画面变化过滤等配置
+            self.stream_manager.configure(dict(settings, analysis_interval=self.analysis_interval))
+            self.preview_wall.set_fps(self.stream_manager.capture_options['preview_fps'])
             self.log(f"分析间隔设置为 {self.analysis_interval} 秒")
+
+            # settings.json 中配置 metrics_port 时在本机提供 /metrics
+            if settings.get('metrics_port') and getattr(self, 'metrics_thread', None) is None:
+                from src.json_receiver import start_metrics_server
+                self.metrics_thread = start_metrics_server(settings.get('metrics_host', '127.0.0.1'),
+                                                           settings['metrics_port'])
             
             self.log("提示词模板已更新")
             self.log("AI模型设置已更新")
@@ -676,11 +760,12 @@ class MainWindow(QMainWindow):
 
     # 添加新方法来存 AI 配置
     def save_ai_config(self):
-        ai_config = {
+        ai_config = load_ai_config()
+        ai_config.update({
             "ai_model": self.ai_model,
             "api_key": self.api_key,
             "api_base": self.api_base
-        }
+        })
         with open(resource_path('ai_config.json'), 'w') as f:
             json.dump(ai_config, f, indent=2)
 
@@ -712,10 +797,10 @@ class MainWindow(QMainWindow):
                 self.update_styles_recursively(child)
 
     def show_video_labels(self):
-        self.stream_label.show()
+        self.preview_wall.show()
 
     def hide_video_labels(self):
-        self.stream_label.hide()
+        self.preview_wall.hide()
 
     def show_log_context_menu(self, position, log_widget):
         context_menu = QMenu()
@@ -804,32 +889,20 @@ class MainWindow(QMainWindow):
         QMessageBox.about(self, "关于 GAI Video", "GAI Video v1.0\n\n© 2023 Your Company Name")
 
     def start_stream(self):
-        if self.stream_thread is None and self.stream_manager.streams:
-            stream_id = next(iter(self.stream_manager.streams))
-            self.stream_thread = VideoThread(self.stream_manager, stream_id, is_camera=False)
-            self.stream_thread.change_pixmap_signal.connect(self.update_stream_image)
-            self.stream_thread.error_signal.connect(self.handle_stream_error)
-            self.stream_thread.start()
-            self.log(f"成功开始视频流 (ID: {stream_id})")
-            self.stream_label.show()
-            self.log("视频流标签示")
+        if not self.preview_wall.running and self.stream_manager.streams:
+            self.preview_wall.set_streams({stream_id: stream_info['url']
+                                           for stream_id, stream_info in self.stream_manager.streams.items()})
+            self.preview_wall.show()
+            self.preview_wall.start()
+            self.log(f"成功开始预览 {len(self.stream_manager.streams)} 路视频流")
         else:
             self.log("没有可用的频流或视频流已在运行", level=logging.WARNING)
 
-    def update_stream_image(self, image):
-        self.stream_label.setPixmap(QPixmap.fromImage(image))
-
-    def handle_stream_error(self, error_message):
-        self.log(f"视频流错误: {error_message}", level=logging.ERROR)
-        self.stop_stream()
-        QMessageBox.warning(self, "视频流错误", error_message)
-
     def stop_stream(self):
-        if self.stream_thread is not None:
-            self.stream_thread.stop()
-            self.stream_thread = None
-            self.stream_label.clear()
-            self.stream_label.hide()
+        if self.preview_wall.running:
+            self.preview_wall.stop()
+            self.preview_wall.set_streams({})
+            self.preview_wall.hide()
             self.log("视频流已停止")
 
     def toggle_image_analysis(self):
@@ -857,71 +930,39 @@ class MainWindow(QMainWindow):
         # self.analysis_result_text.hide()
 
     def analyze_image_directory(self):
+        from src.batch_analyzer import BatchAnalyzer
         image_dir = os.path.join(os.getcwd(), 'images')
         if not os.path.exists(image_dir):
             self.log_signal.emit(f"图片目录不存在: {image_dir}", logging.ERROR)
             self.stop_image_analysis()
             return
 
-        image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-        
-        if not image_files:
-            self.log_signal.emit("图片目录中没有找到图片文件", logging.WARNING)
-            self.stop_image_analysis()
-            return
-
-        for image_file in image_files:
-            if self.image_analysis_stop_event.is_set():
-                self.log_signal.emit("图集分析已停止", logging.INFO)
-                break
-
-            image_path = os.path.join(image_dir, image_file)
-            self.log_signal.emit(f"正在分析图片: {image_file}", logging.INFO)
-            
-            # 显示当前分析的图片
+        def on_start(image_path):
+            self.log_signal.emit(f"正在分析图片: {os.path.basename(image_path)}", logging.INFO)
             self.update_image_signal.emit(image_path)
-            
-            try:
-                with Image.open(image_path) as img:
-                    img = img.convert('RGB')
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG')
-                    base64_image = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-                
-                analysis_result = send_image_to_ai(base64_image, 'SAFETY_ANALYSIS_PROMPT', None, 
-                                                   self.ai_model, self.api_key, self.api_base)
-                
-                if analysis_result:
-                    self.log_image_analysis_result(image_file, analysis_result)
-                    self.update_analysis_count_signal.emit(self.total_analysis_count + 1)
-                    self.update_analysis_result_signal.emit(analysis_result)
-                    
-                    # 更新详细信息窗口
-                    self.update_detailed_info_signal.emit(image_path, analysis_result, "False", "image")
-                else:
-                    self.log_signal.emit(f"无法获取图片 {image_file} 的分析结果", logging.ERROR)
-            
-            except Exception as e:
-                self.log_signal.emit(f"分析图片 {image_file} 时发生错误: {str(e)}", logging.ERROR)
-
-            # 更新当前分析中的图片和结果
             self.update_detailed_info_signal.emit(image_path, "正在分析...", "True", "image")
 
-            if not self.image_analysis_stop_event.is_set():
-                time.sleep(30)  # 将等待时间改为30秒
-
-        if not self.image_analysis_stop_event.is_set():
-            self.log_signal.emit("图集分析完成", logging.INFO)
+        def on_result(image_path, analysis_result):
+            # 结果和检查点由 BatchAnalyzer 写入数据库
+            self.update_analysis_count_signal.emit(1)
+            self.update_analysis_result_signal.emit(analysis_result)
+            self.update_detailed_info_signal.emit(image_path, analysis_result, "False", "image")
+
+        # 并发分析，已分析过的图片（按内容哈希）自动跳过，中断后再次启动会接着分析
+        analyzer = BatchAnalyzer(image_dir, 'SAFETY_ANALYSIS_PROMPT', self.ai_config.get('batch_concurrency', 4),
+                                 self.ai_model, self.api_key, self.api_base, on_start, on_result,
+                                 stop_event=self.image_analysis_stop_event)
+        stats = analyzer.run()
+
+        if self.image_analysis_stop_event.is_set():
+            self.log_signal.emit("图集分析已停止", logging.INFO)
+        elif stats['scanned'] == 0:
+            self.log_signal.emit("图片目录中没有找到图片文件", logging.WARNING)
+        else:
+            self.log_signal.emit(f"图集分析完成: 分析 {stats['analyzed']} 张，跳过已分析 {stats['skipped']} 张，"
+                                 f"失败 {stats['failed']} 张", logging.INFO)
         self.stop_image_analysis()
 
-    def log_image_analysis_result(self, image_file, result):
-        log_file = os.path.join(os.getcwd(), 'logs', 'image_analysis.log')
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"--- 图片: {image_file} ---\n")
-            f.write(f"分析时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"分析结果: {result}\n\n")
-        self.log(f"图片 {image_file} 的分析结果已保存")
-
     def ensure_image_directory(self):
         image_dir = os.path.join(os.getcwd(), 'images')
         if not os.path.exists(image_dir):
@@ -935,51 +976,95 @@ class MainWindow(QMainWindow):
 
     # 在 analyze_frame 方法中调用更新统计信息的方法
     def analyze_frame(self, stream_id):
-        frame = self.stream_manager.get_latest_frame(stream_id)
-        if frame is not None:
-            source_info = f"Stream: {self.stream_manager.streams[stream_id]['url']}"
-            prompt_template = self.stream_manager.streams[stream_id]['prompt_template']
-            threading.Thread(target=self.analyze_frame_thread, args=(frame, source_info, stream_id, prompt_template)).start()
-        else:
-            self.logger.error(f"Failed to get frame for analysis from stream {stream_id}")
+        # 交给分析调度器的线程池执行，同一流未执行的旧任务会被新帧替换
+        self.stream_manager.analyze_frame(stream_id)
+
+    def encode_frame(self, frame, stream_id):
+        # 按模型的编码参数在内存中缩放、裁剪并编码
+        from src.frame_encoder import get_frame_encoder
+        return get_frame_encoder(self.ai_model, load_ai_config()).encode(
+            frame, self.stream_manager.stream_rois.get(stream_id))
 
     def analyze_frame_thread(self, frame, source_info, stream_id, prompt_template):
+        from src.ai_interface import send_image_to_ai
+        frame_path = None
         try:
-            # 将帧转换为base64编码
-            _, buffer = cv2.imencode('.jpg', frame)
-            base64_image = base64.b64encode(buffer).decode('utf-8')
+            with tracing.span('encode', stream_id):
+                jpeg = self.encode_frame(frame, stream_id)
+                base64_image = base64.b64encode(jpeg).decode('utf-8')
 
             # 发送图像到AI进行分析
-            analysis_result = send_image_to_ai(base64_image, prompt_template, None, 
-                                               self.ai_model, self.api_key, self.api_base)
-            
-            if analysis_result:
-                # 更新统计信息
-                self.update_analysis_count_signal.emit(self.total_analysis_count + 1)
-                
-                # 显示分析结果
-                self.update_analysis_result_signal.emit(analysis_result)
-                
-                # 记录分析结果
-                self.log(f"Analysis result for {source_info}: {analysis_result}")
-
-                # 保存帧为图片文件
-                frame_filename = f"frame_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                frame_path = os.path.join(os.getcwd(), 'frames', frame_filename)
-                cv2.imwrite(frame_path, frame)
-
-                # 更新详细信息窗口
-                self.update_detailed_info_signal.emit(frame_path, analysis_result, "False", "video")
-            else:
-                self.log(f"无法获取视频帧分析结果 (源: {source_info})", level=logging.ERROR)
+            with tracing.span('ai', stream_id):
+                analysis_result = send_image_to_ai(base64_image, prompt_template, None, 
+                                                   self.ai_model, self.api_key, self.api_base,
+                                                   stream_id=stream_id,
+                                                   on_alert=lambda alert_stream_id, elapsed:
+                                                       self.stream_manager.notify_alert(alert_stream_id, source_info, elapsed))
+            frame_path = self.show_frame_result(jpeg, analysis_result, source_info, stream_id)
         except Exception as e:
             self.log(f"分析视频帧时发生错误 (源: {source_info}): {str(e)}", level=logging.ERROR)
 
         # 更新当前分析中的图片和结果
-        self.update_detailed_info_signal.emit(frame_path, "正在分析...", "True", "video")
+        if frame_path:
+            self.update_detailed_info_signal.emit(frame_path, "正在分析...", "True", "video")
+
+    def run_analysis_batch(self, jobs):
+        # ai_batch_size 大于 1 时，同时到期的多路流合并为一个多图请求（只合并提示词模板相同的流）
+        from src.ai_interface import send_images_batch_to_ai
+        groups = {}
+        for stream_id, frame in jobs:
+            stream_info = self.stream_manager.streams.get(stream_id)
+            if stream_info is not None:
+                groups.setdefault(stream_info['prompt_template'], []).append(
+                    (stream_id, frame, f"Stream: {stream_info['url']}"))
+        for prompt_template, group in groups.items():
+            try:
+                jpegs = []
+                for stream_id, frame, _ in group:
+                    with tracing.span('encode', stream_id):
+                        jpegs.append(self.encode_frame(frame, stream_id))
+                images = [(base64.b64encode(jpeg).decode('utf-8'), None, stream_id)
+                          for jpeg, (stream_id, _, _) in zip(jpegs, group)]
+                sources = {stream_id: source_info for stream_id, _, source_info in group}
+                with tracing.span('ai'):
+                    results = send_images_batch_to_ai(images, prompt_template, self.ai_model, self.api_key, self.api_base,
+                                                      on_alert=lambda stream_id, elapsed:
+                                                          self.stream_manager.notify_alert(stream_id, sources.get(stream_id), elapsed))
+                for jpeg, (stream_id, _, source_info), analysis_result in zip(jpegs, group, results):
+                    self.show_frame_result(jpeg, analysis_result, source_info, stream_id)
+            except Exception as e:
+                self.log(f"多图分析时发生错误 ({len(group)} 路视频流): {str(e)}", level=logging.ERROR)
+
+    def show_frame_result(self, jpeg, analysis_result, source_info, stream_id):
+        """显示一帧的分析结果并把该帧保存到 frames 目录，返回保存的路径。"""
+        if not analysis_result:
+            self.log(f"无法获取视频帧分析结果 (源: {source_info})", level=logging.ERROR)
+            return None
+
+        # 更新统计信息
+        self.update_analysis_count_signal.emit(1)
+        
+        # 显示分析结果
+        self.update_analysis_result_signal.emit(analysis_result)
+        
+        # 记录分析结果
+        self.log(f"Analysis result for {source_info}: {analysis_result}")
+
+        # 保存帧为图片文件（文件名带上流 ID，多图请求中同一秒的多路帧不会互相覆盖）
+        frame_filename = f"frame_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{stream_id}.jpg"
+        frame_path = os.path.join(os.getcwd(), 'frames', frame_filename)
+        with open(frame_path, 'wb') as f:
+            f.write(jpeg)  # 直接保存已编码的数据，不再重复编码
+
+        # 更新详细信息窗口
+        self.update_detailed_info_signal.emit(frame_path, analysis_result, "False", "video")
+        return frame_path
 
     def clear_ai_memory(self):
         try:
+            if self.ai_interface is None:
+                from src.ai_interface import AIInterface
+                self.ai_interface = AIInterface(self.api_key, self.api_base, self.ai_model)
             self.ai_interface.clear_history()
             self.log("AI记忆已清除")
             QMessageBox.information(self, "操作成功", "AI记忆已成功清除")
@@ -1007,9 +1092,26 @@ class MainWindow(QMainWindow):
         self.analysis_result_text.setText(new_text)
         self.analysis_result_text.show()
 
-    def update_analysis_count_slot(self, count):
-        self.total_analysis_count = count
+    def update_analysis_count_slot(self, increment):
+        # 分析结果来自多个线程，信号只传增量，计数只在界面线程中累加
+        self.total_analysis_count += increment
         self.analysis_count_label.setText(f"累计分析次数: {self.total_analysis_count}")
+        motion_totals = self.stream_manager.motion_gate.totals()
+        self.motion_skip_label.setText(f"画面无变化跳过: {motion_totals['skipped']} / 已发送: {motion_totals['sent']}")
+        from src.ai_interface import get_cache, get_payload_stats
+        cache = get_cache()
+        if cache is not None:
+            cache_stats = cache.stats()
+            self.cache_hit_label.setText(f"结果缓存命中率: {cache_stats['hit_rate']:.0%} "
+                                         f"({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})")
+        payload_stats = get_payload_stats()
+        self.payload_size_label.setText(f"平均请求大小: {payload_stats['avg_bytes'] / 1024:.1f} KB "
+                                        f"(最大 {payload_stats['max_bytes'] / 1024:.1f} KB)")
+
+    def show_violation_alert(self, source_info, elapsed):
+        self.log(f"检测到安全违规：{source_info}（{elapsed:.1f} 秒内告警，完整结果仍在生成）", level=logging.WARNING)
+        if self.tray_icon.isVisible():
+            self.tray_icon.showMessage("安全违规告警", source_info, QSystemTrayIcon.Warning)
 
     def log_slot(self, message, level):
         logger = logging.getLogger()
@@ -1202,8 +1304,7 @@ class DetailedInfoWindow(QWidget):
             self.show_analyzed_result(self.current_index + 1)
 
 if __name__ == "__main__":
-    init_db()
-    update_db_structure()
+    init_db()  # 数据库版本与代码一致时不做任何迁移
     app = QApplication(sys.argv)
     app.setApplicationName("GAI Video")
     
@@ -0,0 +1,109 @@
+"""无界面服务模式：不导入 PyQt，直接运行视频流采集、分析调度和结果入库。
+
+用法: python main.py --headless [--metrics-port 9100] [--dump-metrics 60] [--trace-file trace.json]
+   或 python headless.py ...
+配置与图形界面相同，读取当前目录下的 settings.json 和 ai_config.json，视频流来自 video_streams.db。
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+from utils import resource_path
+
+
+def load_settings(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logging.warning(f"{path} not found, using default settings")
+        return {}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--settings', default=resource_path('settings.json'))
+    parser.add_argument('--metrics-port', type=int, help='在该端口提供 /metrics，默认取 settings.json 中的 metrics_port')
+    parser.add_argument('--metrics-host', help='默认 127.0.0.1')
+    parser.add_argument('--dump-metrics', type=float, default=0, metavar='SECONDS',
+                        help='每隔 SECONDS 秒把全部指标输出到标准输出，0 表示不输出')
+    parser.add_argument('--trace-file', help='退出时把最近各帧的延迟追踪写入该文件（Chrome trace 格式）并输出各阶段分位数')
+    parser.add_argument('--log-level', default='INFO')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs('logs', exist_ok=True)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO),
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler('logs/gai_video.log', encoding='utf-8'), logging.StreamHandler()])
+
+    # 与图形界面共用同一套模块，但这些模块都不依赖 Qt
+    from src.db_handler import init_db, get_all_streams
+    from src.db_writer import get_db_writer
+    from src.metrics import registry
+    from src.stream_manager import stream_manager
+    from src.ai_interface import load_ai_config
+
+    settings = load_settings(args.settings)
+    ai_config = load_ai_config()
+    init_db()
+
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logging.info(f"Received signal {signum}, shutting down")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    stream_manager.initialize()
+    stream_manager.set_ai_config(ai_config['ai_model'], ai_config['api_key'], ai_config['api_base'])
+    for stream in get_all_streams():
+        stream_manager.add_stream(stream['id'], stream['url'], stream['prompt_template'])
+    stream_manager.configure(settings)
+    if not stream_manager.streams:
+        logging.error("No streams configured in video_streams.db")
+        return 1
+
+    metrics_port = args.metrics_port or settings.get('metrics_port')
+    if metrics_port:
+        from src.json_receiver import start_metrics_server
+        start_metrics_server(args.metrics_host or settings.get('metrics_host', '127.0.0.1'), metrics_port)
+
+    stream_manager.start_all_streams()
+    stream_manager.start_analysis()
+    logging.info(f"Headless mode running {len(stream_manager.streams)} streams "
+                 f"({stream_manager.capture_backend} capture, {stream_manager.analysis_workers} analysis workers)")
+
+    try:
+        while not stop_event.wait(args.dump_metrics or 1.0):
+            if args.dump_metrics:
+                sys.stdout.write(registry.render())
+                sys.stdout.flush()
+    finally:
+        stream_manager.stop_analysis()
+        # stop_all_streams 会等待采集进程退出并把待写入的结果落库
+        stream_manager.stop_all_streams().join()
+        if not get_db_writer().flush(timeout=10):
+            logging.warning("Timed out flushing pending database writes")
+        if get_db_writer().dropped_rows:
+            logging.warning(f"{get_db_writer().dropped_rows} rows were dropped after failed database writes")
+        stream_manager.release_frame_buffers()
+        if args.trace_file:
+            stream_manager.tracer.export_chrome_trace(args.trace_file)
+            sys.stdout.write(stream_manager.tracer.format_summary() + '\n')
+            logging.info(f"Frame latency trace written to {args.trace_file}")
+        logging.info("Headless mode stopped")
+    return 0
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,10 +1,18 @@
 import logging
 import os
 import sys
+
+# 无界面模式在导入 PyQt 之前分流，服务器上无需显示环境和 Qt 的导入开销
+if __name__ == "__main__" and '--headless' in sys.argv[1:]:
+    import multiprocessing
+    multiprocessing.freeze_support()
+    from headless import main as headless_main
+    sys.exit(headless_main([arg for arg in sys.argv[1:] if arg != '--headless']))
+
 from PyQt5.QtWidgets import QApplication, QMessageBox
 from PyQt5.QtCore import QObject, Qt, QTimer
 from PyQt5.QtGui import QIcon
-from src.db_handler import init_db, update_db_structure
+from src.db_handler import init_db
 import multiprocessing
 import signal
 import traceback
@@ -43,8 +51,7 @@ def main():
     try:
         print("GAI Video 启动")
         logging.info("GAI Video 启动")
-        init_db()
-        update_db_structure()  # 确保这行在这里
+        init_db()  # 数据库版本与代码一致时不做任何迁移
         
         # 在创建 QApplication 之前设置高DPI缩放属性
         QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)
@@ -0,0 +1,262 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from src.rate_limiter import TokenBucket, parse_retry_after
+from src.metrics import AI_RETRIES, registry
+
+AI_IN_FLIGHT = registry.gauge('ai_requests_in_flight', 'AI HTTP requests currently in flight')
+AI_QUEUED = registry.gauge('ai_requests_queued', 'AI requests waiting for a concurrency slot or rate limit token')
+
+
+class IncompleteStreamError(requests.exceptions.RequestException):
+    """SSE 响应在 [DONE]（或 finish_reason）之前结束，按网络错误重试。"""
+
+
+def is_event_stream(response):
+    return response.headers.get('Content-Type', '').startswith('text/event-stream')
+
+
+class AIRequestEngine:
+    """在后台事件循环中调度 AI 请求。
+
+    - 复用 requests.Session 的 keep-alive 连接池，不再每次调用都新建 TCP/TLS 连接；
+    - 同时在途的请求数受 max_concurrency 限制；
+    - 每个视频流一个待发队列，按轮询顺序出队，单个流积压时不会饿死其他流；
+    - 发出前从共享令牌桶取令牌，429/5xx 由引擎统一重新排队重试，不阻塞任何线程。
+    """
+
+    def __init__(self, max_concurrency=4, timeout=60, limiter=None, max_attempts=3):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.limiter = limiter or TokenBucket()
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='ai-request')
+        self._pending = collections.OrderedDict()  # stream_key: deque[(url, headers, payload, stream_handler, future, attempt)]
+        self._queued = 0
+        self._in_flight = 0
+        self._outstanding = 0  # 已提交但结果尚未返回的请求（含等待重试的）及 run() 中的协程
+        self._loop = None
+        self._thread = None
+        self._slots = None
+        self._wakeup = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='ai-engine', daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run_loop(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._loop.create_task(self._dispatch())
+        ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._shutdown_loop)
+            self._thread.join(5)
+            self._thread = None
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _shutdown_loop(self):
+        # 先取消调度协程等任务，避免事件循环停止后留下挂起的任务
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+        self._loop.call_soon(self._loop.stop)
+
+    def run(self, coro):
+        """在引擎事件循环中执行协程，并在调用线程中阻塞等待结果。"""
+        self.start()
+        with self._lock:
+            self._outstanding += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        future.add_done_callback(self._on_done)
+        return future.result()
+
+    def submit(self, stream_key, url, headers, payload, stream_handler=None):
+        """排队一个 POST 请求，返回 concurrent.futures.Future（结果为 requests.Response）。
+
+        传入 stream_handler 时按流式请求发送：SSE 响应在请求线程中逐行交给 stream_handler.feed()，
+        读完后才释放并发名额，返回的 Response 正文已被读取（内容以 stream_handler.text 为准）；
+        流在完成前中断时按网络错误重试。
+        """
+        self.start()
+        future = Future()
+        with self._lock:
+            self._outstanding += 1
+        future.add_done_callback(self._on_done)
+        self._loop.call_soon_threadsafe(self._enqueue, stream_key, (url, headers, payload, stream_handler, future, 0))
+        return future
+
+    def _on_done(self, future):
+        with self._lock:
+            self._outstanding -= 1
+
+    def stop_when_idle(self, poll_interval=0.5):
+        """在后台等待已提交的请求和 run() 中的协程全部完成后停止，用于配置变化时替换引擎。"""
+        def wait_and_stop():
+            while self._outstanding:
+                time.sleep(poll_interval)
+            self.stop()
+        threading.Thread(target=wait_and_stop, name='ai-engine-drain', daemon=True).start()
+
+    async def request(self, stream_key, url, headers, payload, stream_handler=None):
+        """可在任意事件循环中 await 的请求接口。"""
+        return await asyncio.wrap_future(self.submit(stream_key, url, headers, payload, stream_handler))
+
+    def _enqueue(self, stream_key, job, front=False):
+        jobs = self._pending.setdefault(stream_key, collections.deque())
+        if front:
+            jobs.appendleft(job)
+        else:
+            jobs.append(job)
+        self._queued += 1
+        self._wakeup.set()
+
+    def _retry(self, stream_key, job, delay):
+        # 重试请求放回该流队首，延迟由事件循环计时，不占用线程
+        url, headers, payload, stream_handler, future, attempt = job
+        self._loop.call_later(delay, self._enqueue, stream_key,
+                              (url, headers, payload, stream_handler, future, attempt + 1), True)
+
+    def _next_job(self):
+        # 取出队首视频流的一个请求，若该流仍有积压则移到队尾，实现轮询
+        stream_key, jobs = next(iter(self._pending.items()))
+        job = jobs.popleft()
+        if jobs:
+            self._pending.move_to_end(stream_key)
+        else:
+            del self._pending[stream_key]
+        self._queued -= 1
+        return stream_key, job
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await self.limiter.acquire()
+            stream_key, job = self._next_job()
+            self._loop.create_task(self._execute(stream_key, job))
+
+    async def _execute(self, stream_key, job):
+        url, headers, payload, stream_handler, future, attempt = job
+        try:
+            if attempt == 0 and not future.set_running_or_notify_cancel():
+                return  # 调用方已取消
+            retryable = attempt + 1 < self.max_attempts
+            self._in_flight += 1
+            try:
+                response = await self._loop.run_in_executor(self._executor, self._post, url, headers, payload,
+                                                            stream_handler)
+            except requests.exceptions.RequestException as e:
+                if retryable:
+                    self.logger.warning(f"AI request for stream {stream_key} failed ({e}), retrying (attempt {attempt + 2}/{self.max_attempts})")
+                    AI_RETRIES.inc('network')
+                    self._retry(stream_key, job, 2 ** attempt)
+                else:
+                    future.set_exception(e)
+                return
+            except Exception as e:
+                future.set_exception(e)
+                return
+            finally:
+                self._in_flight -= 1
+
+            if response.status_code == 429:
+                retry_after = self.limiter.on_rate_limited(parse_retry_after(response.headers.get('Retry-After')))
+                self.logger.warning(f"AI rate limit hit, pausing for {retry_after:.1f}s; limiter: {self.limiter.stats()}")
+                if retryable:
+                    AI_RETRIES.inc('rate_limited')
+                    self._retry(stream_key, job, 0)
+                    return
+            elif response.status_code >= 500:
+                if retryable:
+                    self.logger.warning(f"AI service returned {response.status_code} for stream {stream_key}, retrying (attempt {attempt + 2}/{self.max_attempts})")
+                    AI_RETRIES.inc('server_error')
+                    self._retry(stream_key, job, 2 ** attempt)
+                    return
+            else:
+                self.limiter.on_success()
+            future.set_result(response)
+        finally:
+            self._slots.release()
+
+    def _post(self, url, headers, payload, stream_handler=None):
+        if stream_handler is None:
+            return self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+        response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout, stream=True)
+        # 服务端不支持流式时会直接返回 JSON，交给调用方按普通响应处理
+        if response.status_code == 200 and is_event_stream(response):
+            response.encoding = 'utf-8'  # SSE 规定为 UTF-8，requests 默认会按 ISO-8859-1 解码
+            stream_handler.start()
+            for line in response.iter_lines(decode_unicode=True):
+                stream_handler.feed(line)
+            if not stream_handler.done:
+                # 正文已读完，调用方无法再回退到 response.json()
+                raise IncompleteStreamError(f"Event stream ended before completion "
+                                            f"({len(stream_handler.text)} characters received)")
+        return response
+
+    def stats(self):
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self._in_flight,
+            'queued': self._queued,
+            'limiter': self.limiter.stats(),
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+_engine_params = None
+
+
+def get_ai_engine(max_concurrency=4, timeout=60, rate_per_minute=6, burst=1, max_attempts=3):
+    """返回进程内共享的请求引擎；参数与当前引擎不同时新建引擎，旧引擎处理完已提交的请求后停止。"""
+    global _engine, _engine_params
+    params = (max_concurrency, timeout, rate_per_minute, burst, max_attempts)
+    with _engine_lock:
+        if _engine is None or params != _engine_params:
+            if _engine is not None:
+                logging.getLogger(__name__).info(f"AI engine settings changed to {params}, replacing engine")
+                _engine.stop_when_idle()
+            limiter = TokenBucket(rate_per_minute, burst)
+            _engine = AIRequestEngine(max_concurrency, timeout, limiter, max_attempts)
+            _engine_params = params
+        return _engine
+
+
+def _collect_metrics():
+    # 只导出当前引擎的状态；被替换的引擎不再覆盖这两个指标
+    engine = _engine
+    AI_IN_FLIGHT.set(value=engine._in_flight if engine else 0)
+    AI_QUEUED.set(value=engine._queued if engine else 0)
+
+
+registry.add_collector(_collect_metrics)
@@ -4,76 +4,136 @@ import base64
 import logging
 import time
 import uuid
-from ratelimit import limits, sleep_and_retry
+import asyncio
+import os
+import threading
+from src.ai_engine import get_ai_engine, is_event_stream
+from src.result_cache import get_result_cache, make_prompt_key
+from src.utils import dhash_base64_jpeg
+from src.metrics import AI_REQUESTS, AI_LATENCY, AI_TIME_TO_ALERT, AI_PAYLOAD_BYTES, AI_REQUEST_IMAGES, CACHE_LOOKUPS
+from src.prompt_builder import build_messages, build_reid_context, strip_images, estimate_tokens, payload_size
+from src.streaming import StreamingResponse
+
+DEFAULT_PROMPT_TOKEN_BUDGET = 4000  # 整个请求（含图片）的估算 token 上限
+DEFAULT_REID_TOKEN_BUDGET = 600  # 提示词中人员特征部分的估算 token 上限
+# 按提示词模板设置的缓存有效期（秒），未列出的使用 cache_ttl_seconds；ai_config.json 中 cache_ttl_by_prompt 可覆盖
+# 安全分析的画面可能只有细微差别（例如有人走进危险区域），缓存结果只短时间复用
+DEFAULT_CACHE_TTL_BY_PROMPT = {'SAFETY_ANALYSIS_PROMPT': 120}
+
+# 多图请求：所有图片共用一份提示词，要求模型按图片ID分别返回结果
+BATCH_INSTRUCTION = ("\n\n本次请求包含 {count} 张来自不同摄像头的图片，每张图片前标注了图片ID。"
+                     "请对每张图片分别按上述要求进行分析，返回一个JSON对象：键为图片ID，值为该图片的分析结果JSON对象。"
+                     "只需返回这个JSON对象，不要有任何其他回复或解释。")
+
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "你是一个专业的工地安全分析AI助手，能够分析图片并提供安全建议。"
+}
+
+# 请求体大小统计，用于观察提示词压缩的效果
+_payload_stats = {'requests': 0, 'total_bytes': 0, 'last_bytes': 0, 'max_bytes': 0}
+_payload_stats_lock = threading.Lock()
+
+def _record_payload(size):
+    AI_PAYLOAD_BYTES.observe(value=size)
+    with _payload_stats_lock:
+        _payload_stats['requests'] += 1
+        _payload_stats['total_bytes'] += size
+        _payload_stats['last_bytes'] = size
+        _payload_stats['max_bytes'] = max(_payload_stats['max_bytes'], size)
+
+def get_payload_stats():
+    with _payload_stats_lock:
+        stats = dict(_payload_stats)
+    stats['avg_bytes'] = stats['total_bytes'] // stats['requests'] if stats['requests'] else 0
+    return stats
+
+def image_part(base64_image):
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
 
 class AIInterface:
-    def __init__(self, api_key, api_base, model):
+    def __init__(self, api_key, api_base, model, stream_id=None, token_budget=DEFAULT_PROMPT_TOKEN_BUDGET,
+                 streaming=False):
         self.api_key = api_key
         self.api_base = api_base
         self.model = model
+        self.stream_id = stream_id  # 用于请求引擎按视频流公平调度
+        self.token_budget = token_budget
+        self.streaming = streaming  # 以 SSE 流式接收回复，边生成边检测违规
+        self.last_payload_bytes = 0
         self.logger = logging.getLogger(__name__)
         self.conversation_history = []
         self.user_id = str(uuid.uuid4())  # 生成唯一的用户ID
 
-    @sleep_and_retry
-    @limits(calls=1, period=10)  # 限制为每10秒1次调用
     def send_request(self, prompt, image_base64=None):
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # 添加系统角色消息
-        system_message = {
-            "role": "system",
-            "content": "你是一个专业的工地安全分析AI助手，能够分析图片并提供安全建议。"
-        }
-        
+        return get_engine().run(self.send_request_async(prompt, image_base64))
+
+    async def send_request_async(self, prompt, image_base64=None, on_alert=None):
         # 创建用户消息
         user_message = {
             "role": "user",
             "content": [{"type": "text", "text": prompt}]
         }
         if image_base64:
-            user_message["content"].append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-            })
-        
-        # 更新对话历史
-        self.conversation_history.append(system_message)
-        self.conversation_history.append(user_message)
-        
+            user_message["content"].append(image_part(image_base64))
+        return await self.send_message_async(user_message, on_alert)
+
+    async def send_message_async(self, user_message, on_alert=None):
+        """发送一条用户消息（可含多张图片），返回模型回复文本，失败时返回 None。
+
+        streaming 为 True 时，回复中一出现违规就调用 on_alert(image_id)（单图为 None），不等回复结束。
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        prompt = '\n'.join(part['text'] for part in user_message['content'] if part.get('type') == 'text')
+
+        # 系统消息只发送一次，历史按预算截断，且历史中的图片已去掉
         payload = {
             "model": self.model,
-            "messages": self.conversation_history,
+            "messages": build_messages(SYSTEM_MESSAGE, self.conversation_history, user_message, self.token_budget),
             "request_id": str(uuid.uuid4()),  # 生成唯一的请求ID
             "user_id": self.user_id
         }
+        stream_handler = None
+        if self.streaming:
+            payload["stream"] = True
+            stream_handler = StreamingResponse(on_alert)
+        self.last_payload_bytes = payload_size(payload)
+        _record_payload(self.last_payload_bytes)
+        AI_REQUEST_IMAGES.observe(value=sum(1 for part in user_message['content'] if part.get('type') == 'image_url'))
+        self.logger.debug(f"Request payload: {self.last_payload_bytes} bytes, "
+                          f"{len(payload['messages'])} messages, ~{estimate_tokens(prompt)} prompt tokens")
         
+        response = None
         try:
-            response = requests.post(f"{self.api_base}/chat/completions", headers=headers, json=payload)
+            response = await get_engine().request(self.stream_id, f"{self.api_base}/chat/completions", headers, payload,
+                                                  stream_handler)
             response.raise_for_status()
-            ai_response = response.json()['choices'][0]['message']['content']
+            # 流式响应的正文已被引擎读取，只有服务端按普通 JSON 回复时才解析正文
+            if stream_handler is not None and is_event_stream(response):
+                ai_response = stream_handler.text
+            else:
+                ai_response = response.json()['choices'][0]['message']['content']
             
-            # 将AI的回复添加到对话历史
+            # 将本轮问答添加到对话历史（不含图片）
+            self.conversation_history.append(strip_images(user_message))
             self.conversation_history.append({
                 "role": "assistant",
                 "content": ai_response
             })
             
-            # 保持对话历史在合理的长度内
+            # 保持对话历史在合理的长度内（发送时还会按 token 预算截断）
             if len(self.conversation_history) > 10:
                 self.conversation_history = self.conversation_history[-10:]
             
             return ai_response
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Error sending request to AI service: {str(e)}")
+            if response is None:
+                return None
             self.logger.error(f"Response content: {response.text}")
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 60))
-                self.logger.info(f"Rate limit exceeded. Retrying after {retry_after} seconds.")
-                time.sleep(retry_after)
             return None
         except Exception as e:
             self.logger.error(f"Unexpected error in send_request: {str(e)}")
@@ -83,43 +143,246 @@ class AIInterface:
         prompt = prompt_template.format(frame_description=frame_description)
         return self.send_request(prompt, image_base64)
 
+    async def analyze_frame_async(self, frame_description, prompt_template, image_base64=None, on_alert=None):
+        prompt = prompt_template.format(frame_description=frame_description)
+        return await self.send_request_async(prompt, image_base64, on_alert)
+
     def clear_history(self):
         self.conversation_history = []
         self.logger.info("Conversation history cleared.")
 
+# ai_config.json 按修改时间缓存，每次请求只需 stat 一次
+_config_cache = (None, None)
+_config_lock = threading.Lock()
+
 def load_ai_config():
+    global _config_cache
     try:
-        with open('ai_config.json', 'r') as f:
-            return json.load(f)
+        mtime = os.stat('ai_config.json').st_mtime_ns
+        with _config_lock:
+            if _config_cache[0] != mtime:
+                with open('ai_config.json', 'r') as f:
+                    _config_cache = (mtime, json.load(f))
+            return dict(_config_cache[1])
     except FileNotFoundError:
         raise FileNotFoundError("ai_config.json file not found. Please ensure it exists in the root directory.")
 
-def send_image_to_ai(base64_image, prompt_type, reid_data, ai_model=None, api_key=None, api_base=None):
+def get_engine():
+    # 默认每分钟 6 个请求、不突发，与原先每 10 秒发送一次的节奏相同；并发路数较多时在 ai_config.json 中调高
+    # requests_per_minute 和 rate_burst。这些参数变化时重建引擎，旧引擎处理完已提交的请求后停止
+    config = load_ai_config()
+    return get_ai_engine(config.get('max_concurrency', 4), config.get('request_timeout', 60),
+                         config.get('requests_per_minute', 6), config.get('rate_burst', 1),
+                         config.get('max_attempts', 3))
+
+def send_image_to_ai(base64_image, prompt_type, reid_data, ai_model=None, api_key=None, api_base=None, stream_id=None,
+                     on_alert=None):
+    return get_engine().run(send_image_to_ai_async(base64_image, prompt_type, reid_data,
+                                                   ai_model, api_key, api_base, stream_id, on_alert))
+
+def _alert_timer(start, on_alert, stream_id=None, stream_ids=None):
+    # 记录 time-to-alert 后调用 on_alert(stream_id, 秒)；多图请求按 stream_ids 把图片ID换算为视频流
+    def alert(image_id):
+        if stream_ids is not None:
+            if image_id not in stream_ids:
+                return
+            alert_stream_id = stream_ids[image_id]
+        else:
+            alert_stream_id = stream_id
+        elapsed = time.perf_counter() - start
+        AI_TIME_TO_ALERT.observe(alert_stream_id, value=elapsed)
+        if on_alert is not None:
+            on_alert(alert_stream_id, elapsed)
+    return alert
+
+async def send_image_to_ai_async(base64_image, prompt_type, reid_data, ai_model=None, api_key=None, api_base=None, stream_id=None,
+                                 on_alert=None):
+    """on_alert(stream_id, 秒)：ai_config.json 中 stream_responses 为 true 时，回复中一出现违规即调用。"""
+    start = time.perf_counter()
     config = load_ai_config()
     ai_model = ai_model or config['ai_model']
     api_key = api_key or config['api_key']
     api_base = api_base or config['api_base']
 
-    ai_interface = AIInterface(api_key, api_base, ai_model)
+    ai_interface = AIInterface(api_key, api_base, ai_model, stream_id,
+                               config.get('prompt_token_budget', DEFAULT_PROMPT_TOKEN_BUDGET),
+                               config.get('stream_responses', False))
 
     # 加载提示词模板
     templates = load_prompt_templates()
     prompt = templates.get(prompt_type, templates.get('GENERAL_ANALYSIS_PROMPT'))
 
-    if reid_data:
-        prompt += f"\n\n以下是之前识别到的人员特征数据，请在分析时考虑这些信息：\n{json.dumps(reid_data, ensure_ascii=False)}"
+    # 相同或几乎相同的画面直接返回缓存结果（键：感知哈希 + 提示词模板 + 模型）
+    cache = get_cache(config)
+    cache_key, cached = await _lookup_cache(cache, base64_image, make_prompt_key(ai_model, prompt, stream_id), stream_id,
+                                            cache_ttl(config, prompt_type))
+    if cached is not None:
+        return cached
+
+    # 人员特征按最近出现顺序压缩到预算内，超出的只给出数量
+    prompt += build_reid_context(reid_data, config.get('reid_token_budget', DEFAULT_REID_TOKEN_BUDGET))
+
+    # 429/5xx 重试由请求引擎统一处理，这里只发送一次
+    result = await ai_interface.analyze_frame_async(prompt, "{frame_description}", base64_image,
+                                                    _alert_timer(start, on_alert, stream_id))
+    AI_LATENCY.observe(stream_id, value=time.perf_counter() - start)
+    if result is None:
+        logging.error("未能获取分析结果")
+        AI_REQUESTS.inc(stream_id, 'error')
+        return result
+    AI_REQUESTS.inc(stream_id, 'success')
+    if cache_key is not None:
+        await asyncio.to_thread(cache.put, *cache_key, result)
+    return result
+
+async def _lookup_cache(cache, base64_image, prompt_key, stream_id, ttl_seconds=None):
+    # 返回 (cache_key, 缓存结果)；未启用缓存或无法计算哈希时 cache_key 为 None
+    if cache is None:
+        return None, None
+    phash = await asyncio.to_thread(dhash_base64_jpeg, base64_image)
+    if phash is None:
+        return None, None
+    cache_key = (phash, prompt_key)
+    cached = await asyncio.to_thread(cache.get, *cache_key, ttl_seconds)
+    CACHE_LOOKUPS.inc('miss' if cached is None else 'hit')
+    if cached is not None:
+        logging.info(f"命中分析结果缓存 (stream: {stream_id})")
+        AI_REQUESTS.inc(stream_id, 'cache_hit')
+    return cache_key, cached
+
+def send_images_batch_to_ai(images, prompt_type, ai_model=None, api_key=None, api_base=None, on_alert=None):
+    return get_engine().run(send_images_batch_to_ai_async(images, prompt_type, ai_model, api_key, api_base, on_alert))
+
+async def send_images_batch_to_ai_async(images, prompt_type, ai_model=None, api_key=None, api_base=None, on_alert=None):
+    """把多路视频流的帧放进一个多图请求，提示词只发送一次。
+
+    images 为 [(base64_image, reid_data, stream_id)]，返回与之一一对应的结果文本列表，
+    某张图片没有结果时对应 None。命中缓存的图片不再发送；只剩一张时按单图请求发送。
+    回复中缺少某张图片的结果时，该图片再按单图请求补发一次。
+    """
+    start = time.perf_counter()
+    config = load_ai_config()
+    ai_model = ai_model or config['ai_model']
+    api_key = api_key or config['api_key']
+    api_base = api_base or config['api_base']
+    templates = load_prompt_templates()
+    prompt = templates.get(prompt_type, templates.get('GENERAL_ANALYSIS_PROMPT'))
+
+    results = [None] * len(images)
+    cache = get_cache(config)
+    ttl_seconds = cache_ttl(config, prompt_type)
+    pending = []  # (下标, cache_key)
+    for index, (base64_image, reid_data, stream_id) in enumerate(images):
+        cache_key, cached = await _lookup_cache(cache, base64_image, make_prompt_key(ai_model, prompt, stream_id),
+                                                stream_id, ttl_seconds)
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending.append((index, cache_key))
+    if len(pending) == 1:
+        index = pending[0][0]
+        base64_image, reid_data, stream_id = images[index]
+        results[index] = await send_image_to_ai_async(base64_image, prompt_type, reid_data,
+                                                      ai_model, api_key, api_base, stream_id, on_alert)
+        return results
+    if not pending:
+        return results
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        result = ai_interface.analyze_frame(prompt, "{frame_description}", base64_image)
-        if result is not None:
-            return result
-        if attempt < max_retries - 1:
-            logging.warning(f"重试分析 (尝试 {attempt + 2}/{max_retries})")
-            time.sleep(5)  # 等待5秒后重试
+    # 每张图片前标注图片ID和该流的人员特征，人员特征预算按图片数平分
+    reid_budget = config.get('reid_token_budget', DEFAULT_REID_TOKEN_BUDGET) // len(pending)
+    content = [{"type": "text", "text": prompt + BATCH_INSTRUCTION.format(count=len(pending))}]
+    image_ids = []
+    for number, (index, _) in enumerate(pending, 1):
+        base64_image, reid_data, stream_id = images[index]
+        image_id = f"image_{number}"
+        image_ids.append(image_id)
+        content.append({"type": "text", "text": f"图片ID: {image_id}" + build_reid_context(reid_data, reid_budget)})
+        content.append(image_part(base64_image))
 
-    logging.error(f"在 {max_retries} 次尝试后未能获取分析结果")
-    return None
+    # 多图请求排在第一张图片所属视频流的队列中，与该流的单图请求一起参与轮询
+    ai_interface = AIInterface(api_key, api_base, ai_model, images[pending[0][0]][2],
+                               config.get('prompt_token_budget', DEFAULT_PROMPT_TOKEN_BUDGET),
+                               config.get('stream_responses', False))
+    stream_ids = {image_id: images[index][2] for image_id, (index, _) in zip(image_ids, pending)}
+    response = await ai_interface.send_message_async({"role": "user", "content": content},
+                                                     _alert_timer(start, on_alert, stream_ids=stream_ids))
+    split = split_batch_result(response, image_ids) if response is not None else {}
+    elapsed = time.perf_counter() - start
+    missing = []  # 回复中缺失的图片下标
+    for image_id, (index, cache_key) in zip(image_ids, pending):
+        stream_id = images[index][2]
+        result = split.get(image_id)
+        if result is None and response is not None:
+            # 请求成功但模型漏掉了这张图片，按单图请求补发（耗时和成败由单图请求记录）
+            logging.warning(f"多图请求的回复中缺少 {image_id} 的分析结果，单独重新发送 (stream: {stream_id})")
+            missing.append(index)
+            continue
+        AI_LATENCY.observe(stream_id, value=elapsed)
+        if result is None:
+            logging.error(f"多图请求中未能获取 {image_id} 的分析结果 (stream: {stream_id})")
+            AI_REQUESTS.inc(stream_id, 'error')
+            continue
+        AI_REQUESTS.inc(stream_id, 'success')
+        results[index] = result
+        if cache_key is not None:
+            await asyncio.to_thread(cache.put, *cache_key, result)
+    if missing:
+        resent = await asyncio.gather(*(send_image_to_ai_async(images[index][0], prompt_type, images[index][1], ai_model,
+                                                               api_key, api_base, images[index][2], on_alert)
+                                        for index in missing))
+        for index, result in zip(missing, resent):
+            results[index] = result
+    return results
+
+def split_batch_result(response, image_ids):
+    """把多图请求的回复拆成 {图片ID: 单张图片的结果文本}，缺失或格式不对的图片不在其中。
+
+    兼容 {"image_1": {...}} 和 [{"image_id": "image_1", ...}]（或包在 "results" 中）两种格式。
+    """
+    parsed = parse_analysis_result(response)
+    if isinstance(parsed, dict) and isinstance(parsed.get('results'), list):
+        parsed = parsed['results']
+    if isinstance(parsed, list):
+        parsed = {str(item.get('image_id')): {key: value for key, value in item.items() if key != 'image_id'}
+                  for item in parsed if isinstance(item, dict)}
+    if not isinstance(parsed, dict):
+        return {}
+    # 与单图请求一致，返回 JSON 文本，由调用方用 parse_analysis_result 解析
+    return {image_id: json.dumps(parsed[image_id], ensure_ascii=False)
+            for image_id in image_ids if isinstance(parsed.get(image_id), dict)}
+
+def get_cache(config=None):
+    # 返回共享的结果缓存，ai_config.json 中 cache_enabled 为 false 时返回 None
+    config = config or load_ai_config()
+    if not config.get('cache_enabled', True):
+        return None
+    return get_result_cache(config.get('cache_max_distance', 3), config.get('cache_ttl_seconds', 3600),
+                            config.get('cache_max_entries', 5000))
+
+def cache_ttl(config, prompt_type):
+    # 返回该提示词模板的缓存有效期，None 表示使用 cache_ttl_seconds
+    ttls = dict(DEFAULT_CACHE_TTL_BY_PROMPT, **config.get('cache_ttl_by_prompt', {}))
+    return ttls.get(prompt_type)
+
+def parse_analysis_result(result):
+    """把模型返回的文本解析为 dict（兼容 ```json 代码块包裹），无法解析时原样返回。"""
+    if not isinstance(result, str):
+        return result
+    text = result.strip()
+    if text.startswith('```'):
+        text = text.strip('`').strip()
+        if text.lower().startswith('json'):
+            text = text[4:]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find('{'), text.rfind('}')
+        if 0 <= start < end:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+    return result
 
 # 添加这个函数来加载提示词模板
 def load_prompt_templates():
@@ -0,0 +1,256 @@
+import heapq
+import logging
+import threading
+import time
+from src import tracing
+
+
+class AnalysisScheduler:
+    """按视频流调度帧分析任务。
+
+    - 固定数量的工作线程，替代"每帧一个线程"；
+    - 待处理任务按截止时间排在优先队列中，每个流同一时刻最多一个任务在执行；
+    - 同一流的新帧会替换尚未执行的旧任务（保留旧任务的排队位置），不会在其后排队；
+    - 每个流有独立的分析间隔，调度线程按间隔为到期的流提交取帧任务（frame 为 None），由工作线程调用
+      frame_source 取帧，取帧时的等待不会拖慢其他流的调度；
+    - batch_size 大于 1 且设置了 batch_handler 时，工作线程取到任务后把已排队的其他流一起交给
+      batch_handler，用于多图请求；只有其他流将在 batch_wait 秒内到期时才等待，否则立即发送；
+    - 设置了 tracer 时，调度线程为每个取帧任务开始一个 FrameTrace，随任务传到工作线程（tracing.activate），
+      记录排队耗时；handler 返回后结束追踪，除非结果已交给写库线程（由其在提交后结束）。
+    """
+
+    def __init__(self, handler, frame_source=None, max_workers=4, default_interval=10,
+                 batch_handler=None, batch_size=1, batch_wait=0.5, tracer=None):
+        self.handler = handler  # handler(stream_id, frame)
+        self.frame_source = frame_source  # frame_source(stream_id) -> frame 或 None
+        self.max_workers = max_workers
+        self.default_interval = default_interval
+        self.batch_handler = batch_handler  # batch_handler([(stream_id, frame), ...])
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.tracer = tracer
+        self.logger = logging.getLogger(__name__)
+        self.intervals = {}  # stream_id: 秒，None 表示使用默认间隔
+        self.next_due = {}  # stream_id: time.monotonic() 时间点
+        self._heap = []  # (deadline, seq, stream_id)
+        self._pending = {}  # stream_id: (seq, frame, deadline, trace, 提交时间)
+        self._running = set()
+        self._collecting = 0  # 正在凑批的工作线程数，期间新任务留给它，其他线程不取
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._workers = []
+        self._ticker = None
+        self._generation = 0  # stop() 后递增，旧线程据此退出
+        self.submitted_count = 0
+        self.replaced_count = 0
+        self.completed_count = 0
+        self.batch_count = 0
+
+    def add_stream(self, stream_id, interval=None):
+        with self._cond:
+            self.intervals[stream_id] = interval
+            self.next_due.setdefault(stream_id, time.monotonic())
+
+    def remove_stream(self, stream_id):
+        with self._cond:
+            self.intervals.pop(stream_id, None)
+            self.next_due.pop(stream_id, None)
+            self._discard_pending(self._pending.pop(stream_id, None))
+
+    def set_interval(self, stream_id, interval):
+        with self._cond:
+            if stream_id in self.intervals:
+                self.intervals[stream_id] = interval
+
+    def get_interval(self, stream_id):
+        interval = self.intervals.get(stream_id)
+        return interval if interval else self.default_interval
+
+    def submit(self, stream_id, frame, deadline=None, trace=None):
+        if deadline is None:
+            deadline = time.monotonic()
+        self._ensure_workers()
+        with self._cond:
+            self._seq += 1
+            self.submitted_count += 1
+            previous = self._pending.get(stream_id)
+            if previous is not None:
+                # 最新帧优先：替换旧任务，沿用更早的截止时间
+                self.replaced_count += 1
+                deadline = min(deadline, previous[2])
+            self._pending[stream_id] = (self._seq, frame, deadline, trace, time.time())
+            if stream_id not in self._running:
+                heapq.heappush(self._heap, (deadline, self._seq, stream_id))
+                self._notify()
+
+    def start(self):
+        self._ensure_workers()
+        with self._cond:
+            if self.frame_source is not None and self._ticker is None:
+                self._ticker = threading.Thread(target=self._tick_loop, args=(self._generation,),
+                                                name='analysis-ticker', daemon=True)
+                self._ticker.start()
+
+    def stop(self, wait=False):
+        with self._cond:
+            self._generation += 1
+            for pending in self._pending.values():
+                self._discard_pending(pending)
+            self._pending.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+            threads = self._workers + ([self._ticker] if self._ticker else [])
+            self._workers = []
+            self._ticker = None
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _discard_pending(self, pending):
+        # 未执行就被丢弃的任务同样结束追踪，和没有结果的帧一样只记录已有的阶段
+        if pending is not None and pending[3] is not None:
+            pending[3].finish()
+
+    def _ensure_workers(self):
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._worker_loop, args=(self._generation,),
+                                          name=f'analysis-worker-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _tick_loop(self, generation):
+        while generation == self._generation:
+            now = time.monotonic()
+            with self._cond:
+                due = [stream_id for stream_id, when in self.next_due.items() if when <= now]
+                for stream_id in due:
+                    self.next_due[stream_id] = now + self.get_interval(stream_id)
+            for stream_id in due:
+                trace = self.tracer.start(stream_id) if self.tracer is not None else None
+                self.submit(stream_id, None, deadline=now + self.get_interval(stream_id), trace=trace)
+            time.sleep(0.2)
+
+    def _fetch_frames(self, jobs):
+        # 在工作线程中为取帧任务取帧；frame_source 可通过 tracing.current_trace() 记录采集和取帧阶段
+        fetched = []
+        for stream_id, frame, trace in jobs:
+            if frame is None:
+                try:
+                    with tracing.activate([trace]):
+                        frame = self.frame_source(stream_id)
+                except Exception as e:
+                    self.logger.error(f"Error getting frame for analysis from stream {stream_id}: {str(e)}")
+                    continue
+                if frame is None:
+                    # 没有新帧，或画面无明显变化被预过滤跳过
+                    continue
+            fetched.append((stream_id, frame, trace))
+        return fetched
+
+    def _next_job(self):
+        # 调用方需持有 self._cond；跳过已被替换或所属流正在执行的过期条目
+        while self._heap:
+            deadline, seq, stream_id = heapq.heappop(self._heap)
+            pending = self._pending.get(stream_id)
+            if pending is None or pending[0] != seq or stream_id in self._running:
+                continue
+            del self._pending[stream_id]
+            self._running.add(stream_id)
+            trace = pending[3]
+            if trace is not None:
+                trace.add_span('queue', pending[4], time.time())
+            return stream_id, pending[1], trace
+        return None
+
+    def _notify(self):
+        # 调用方需持有 self._cond；有线程正在凑批时必须唤醒它，其他线程醒来后会继续等待
+        if self._collecting:
+            self._cond.notify_all()
+        else:
+            self._cond.notify()
+
+    def _due_before(self, jobs, deadline):
+        # 调用方需持有 self._cond；是否有可加入本批的其他流在 deadline 之前由调度线程取帧
+        if self._ticker is None:
+            return False
+        batched = {stream_id for stream_id, _, _ in jobs}
+        return any(when <= deadline for stream_id, when in self.next_due.items()
+                   if stream_id not in batched and stream_id not in self._running)
+
+    def _collect_batch(self, generation, jobs):
+        # 调用方需持有 self._cond；取已排队的其他流的任务，凑满 batch_size 为止；
+        # 队列取空后只在有流即将到期时等待，最多等到取到第一个任务后 batch_wait 秒
+        deadline = time.monotonic() + self.batch_wait
+        self._collecting += 1
+        try:
+            while len(jobs) < self.batch_size and generation == self._generation:
+                job = self._next_job()
+                if job is not None:
+                    jobs.append(job)
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or not self._due_before(jobs, deadline):
+                    break
+                self._cond.wait(timeout)
+        finally:
+            self._collecting -= 1
+            if self._heap:
+                self._cond.notify_all()  # 本批已满，剩余任务交给其他线程
+        return jobs
+
+    def _worker_loop(self, generation):
+        while True:
+            with self._cond:
+                if generation != self._generation:
+                    return
+                job = None if self._collecting else self._next_job()
+                while job is None:
+                    if generation != self._generation:
+                        return
+                    self._cond.wait()
+                    job = None if self._collecting else self._next_job()
+                jobs = [job]
+                if self.batch_handler is not None and self.batch_size > 1:
+                    self._collect_batch(generation, jobs)
+                if len(jobs) > 1:
+                    self.batch_count += 1
+            stream_ids = [stream_id for stream_id, _, _ in jobs]
+            traces = []
+            try:
+                jobs = self._fetch_frames(jobs)
+                traces = [trace for _, _, trace in jobs if trace is not None]
+                jobs = [(stream_id, frame) for stream_id, frame, _ in jobs]
+                with tracing.activate(traces):
+                    if len(jobs) > 1:
+                        self.batch_handler(jobs)
+                    elif jobs:
+                        self.handler(*jobs[0])
+            except Exception as e:
+                self.logger.error(f"Error analyzing frames from streams {stream_ids}: {str(e)}")
+            finally:
+                for trace in traces:
+                    if not trace.handed_off:
+                        trace.finish()
+                with self._cond:
+                    for stream_id in stream_ids:
+                        self._running.discard(stream_id)
+                        self.completed_count += 1
+                        pending = self._pending.get(stream_id)
+                        if pending is not None:
+                            heapq.heappush(self._heap, (pending[2], pending[0], stream_id))
+                            self._notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': len(self._workers),
+                'pending': len(self._pending),
+                'running': len(self._running),
+                'submitted': self.submitted_count,
+                'replaced': self.replaced_count,
+                'completed': self.completed_count,
+                'batches': self.batch_count,
+            }
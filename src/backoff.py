@@ -0,0 +1,23 @@
+import random
+
+
+class Backoff:
+    """带随机抖动的指数退避：第 n 次重试等待 min(max_delay, base * factor**n) 乘以 [1 - jitter, 1] 间的随机数。
+
+    抖动使同时断开的大量连接（例如交换机重启）不会在同一时刻一起重连。
+    """
+
+    def __init__(self, base=1.0, max_delay=60.0, factor=2.0, jitter=0.5):
+        self.base = base
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.max_delay, self.base * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
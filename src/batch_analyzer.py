@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.db_handler import is_image_analyzed
+from src.db_writer import get_db_writer
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+def iter_images(directory, extensions=IMAGE_EXTENSIONS):
+    """用 os.scandir 逐个产出目录（含子目录）中的图片路径，不预先列出整个目录。"""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and entry.name.lower().endswith(extensions):
+                        yield entry.path
+        except OSError as e:
+            logging.warning(f"Cannot scan {current}: {str(e)}")
+
+
+def decode_image(data):
+    """把图片文件内容解码为 BGR 数组；OpenCV 不支持的格式（如 GIF）交给 PIL。"""
+    import cv2
+    import numpy as np
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is not None:
+        return image
+    import io
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        return cv2.cvtColor(np.array(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+class BatchAnalyzer:
+    """并发分析图片目录，结果写入 analysis_results（stream_id 为空，source 为图片路径）。
+
+    文件按 os.scandir 的顺序流式读取，同时在途的分析不超过 concurrency 个，请求速率由
+    AI 请求引擎的令牌桶统一控制。每张图片按内容 SHA-1 记录检查点，与结果在同一事务中
+    落库：中断后重新运行会跳过已分析的图片，内容相同的重复文件也只分析一次。
+    """
+
+    stream_key = 'batch'  # AI 请求引擎中的队列名，与视频流轮询出队，不会挤占实时分析
+
+    def __init__(self, directory, prompt_type='SAFETY_ANALYSIS_PROMPT', concurrency=4,
+                 ai_model=None, api_key=None, api_base=None, on_start=None, on_result=None, stop_event=None):
+        self.directory = directory
+        self.prompt_type = prompt_type
+        self.concurrency = max(1, concurrency)
+        self.ai_model = ai_model
+        self.api_key = api_key
+        self.api_base = api_base
+        self.on_start = on_start  # on_start(path)：开始分析一张图片
+        self.on_result = on_result  # on_result(path, result)：result 为模型返回的原始文本
+        self.logger = logging.getLogger(__name__)
+        self.stop_event = stop_event or threading.Event()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._seen = set()  # 本次已提交的内容哈希，结果落库前重复的文件也只发送一次
+        self._lock = threading.Lock()
+        self._stats = {'scanned': 0, 'skipped': 0, 'analyzed': 0, 'failed': 0}
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def run(self):
+        """阻塞直到目录分析完成或 stop() 被调用，返回统计信息。"""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch-analyzer') as executor:
+            for path in iter_images(self.directory):
+                # 先占用并发名额再读文件，目录很大时内存中只有 concurrency 张图片
+                if not self._acquire_slot():
+                    break
+                self._count('scanned')
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    self.logger.error(f"Cannot read {path}: {str(e)}")
+                    self._count('failed')
+                    self._slots.release()
+                    continue
+                content_hash = hashlib.sha1(data).hexdigest()
+                with self._lock:
+                    duplicate = content_hash in self._seen
+                    self._seen.add(content_hash)
+                if duplicate or is_image_analyzed(content_hash):
+                    self._count('skipped')
+                    self._slots.release()
+                    continue
+                executor.submit(self._analyze, path, data, content_hash)
+        # 等待结果和检查点落库，下次运行才能据此跳过
+        get_db_writer().flush(timeout=10)
+        stats = self.stats()
+        self.logger.info(f"Batch analysis of {self.directory} finished: {stats}")
+        return stats
+
+    def _acquire_slot(self):
+        while not self._slots.acquire(timeout=0.5):
+            if self.stop_event.is_set():
+                return False
+        if self.stop_event.is_set():
+            self._slots.release()
+            return False
+        return True
+
+    def _analyze(self, path, data, content_hash):
+        from src.ai_interface import load_ai_config, send_image_to_ai, parse_analysis_result
+        from src.frame_encoder import get_frame_encoder
+        try:
+            if self.stop_event.is_set():
+                self._forget(content_hash)
+                return
+            if self.on_start:
+                self.on_start(path)
+            # 与视频帧相同的编码参数：超过模型分辨率上限的照片先缩小，减少请求体积
+            config = load_ai_config()
+            encoder = get_frame_encoder(self.ai_model or config.get('ai_model'), config)
+            base64_image = base64.b64encode(encoder.encode(decode_image(data))).decode('utf-8')
+            result = send_image_to_ai(base64_image, self.prompt_type, None, self.ai_model, self.api_key,
+                                      self.api_base, stream_id=self.stream_key)
+            if result is None:
+                self.logger.error(f"No analysis result for {path}")
+                self._count('failed')
+                self._forget(content_hash)
+                return
+            get_db_writer().save_image_result(content_hash, path, parse_analysis_result(result))
+            self._count('analyzed')
+            if self.on_result:
+                self.on_result(path, result)
+        except Exception as e:
+            self.logger.error(f"Failed to analyze {path}: {str(e)}")
+            self._count('failed')
+            self._forget(content_hash)
+        finally:
+            self._slots.release()
+
+    def _forget(self, content_hash):
+        # 未成功的图片不记录，同一批次中内容相同的文件仍可再试
+        with self._lock:
+            self._seen.discard(content_hash)
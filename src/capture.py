@@ -0,0 +1,243 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+# 采集参数默认值，可在 settings.json 中覆盖
+DEFAULT_CAPTURE_OPTIONS = {
+    'decode_mode': 'grab',  # 'full': 每帧都解码；'grab': 只拉流，按需或按 retrieve_fps 解码
+    'retrieve_fps': 1.0,  # grab 模式下无人请求时的解码频率
+    'hw_decode': False,  # 请求 OpenCV 使用任意可用的硬件解码
+    'max_read_failures': 10,  # 连续读取失败达到该次数后退出，由 StreamSupervisor 退避后重连
+    'loop_files': False,  # 本地视频文件读完后从头播放，用于压测和演示
+    'preview_fps': 10.0,  # 有人预览时写入缩略图的最高频率，无人预览时不生成缩略图
+}
+
+def open_capture(url, options):
+    import cv2
+    if options.get('hw_decode') and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        cap = cv2.VideoCapture(url, cv2.CAP_ANY, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+        if cap.isOpened():
+            return cap
+        logging.warning(f"Hardware decoding unavailable for {url}, falling back to software")
+    return cv2.VideoCapture(url)
+
+def capture_loop(stream_id, url, status_dict, stop_event, frame_buffer, options=None):
+    """采集一路视频流写入帧缓冲区，直到 stop_event 被设置；stop_event 可以是线程或进程事件。
+
+    每次成功读取都会更新缓冲区中的心跳；打不开流或连续读取失败 max_read_failures 次时
+    状态置为 'error' 并退出，此时心跳标记为 -1。
+    """
+    options = dict(DEFAULT_CAPTURE_OPTIONS, **(options or {}))
+    frame_buffer.heartbeat()
+    try:
+        cap = open_capture(url, options)
+        if not cap.isOpened():
+            status_dict[stream_id] = 'error'
+            logging.error(f"Failed to open stream {url}")
+            return
+        try:
+            _read_frames(stream_id, url, status_dict, stop_event, frame_buffer, cap, options)
+        finally:
+            cap.release()
+    finally:
+        # 被要求停止（包括重启时被替换）的采集不标记退出，以免覆盖新采集的心跳
+        if not stop_event.is_set():
+            frame_buffer.mark_exited()
+
+def _read_frames(stream_id, url, status_dict, stop_event, frame_buffer, cap, options):
+    import cv2
+    full_decode = options['decode_mode'] == 'full'
+    retrieve_interval = 1.0 / options['retrieve_fps'] if options['retrieve_fps'] > 0 else float('inf')
+    # 本地视频文件没有网络节拍，按文件帧率读取，否则 grab 会以远超实时的速度读完文件
+    frame_interval = 0
+    if os.path.isfile(url):
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = 1.0 / fps if fps and fps > 0 else 0.04
+    served_request = frame_buffer.request_seq
+    next_retrieve = 0
+    preview_interval = 1.0 / options['preview_fps'] if options['preview_fps'] > 0 else float('inf')
+    served_preview = frame_buffer.preview_request_seq
+    next_preview = 0
+    next_frame = time.monotonic()
+    failures = 0
+    rewound = False
+
+    while not stop_event.is_set():
+        if failures >= options['max_read_failures']:
+            status_dict[stream_id] = 'error'
+            logging.error(f"Giving up on stream {url} after {failures} consecutive read failures")
+            return
+        try:
+            # grab 读取数据包保持流是最新的（FFmpeg 后端在此解码），颜色转换和拷贝在 retrieve 中进行
+            if not cap.grab():
+                # 只在上次回到开头后读到过帧时再回绕，损坏的文件仍按读取失败处理
+                if frame_interval and options['loop_files'] and not rewound:
+                    rewound = cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    if rewound:
+                        continue
+                frame_buffer.record_failure()
+                failures += 1
+                status_dict[stream_id] = 'error'
+                logging.warning(f"Failed to read frame from stream {url}")
+                time.sleep(1)  # 等待1秒后重试
+                continue
+            grabbed_at = time.time()
+            failures = 0
+            rewound = False
+            status_dict[stream_id] = 'streaming'
+            frame_buffer.record_grab()
+
+            now = time.monotonic()
+            request_seq = frame_buffer.request_seq
+            preview_request = frame_buffer.preview_request_seq
+            want_frame = full_decode or request_seq != served_request or now >= next_retrieve
+            want_preview = preview_request != served_preview and now >= next_preview
+            if want_frame or want_preview:
+                ret, frame = cap.retrieve()
+                if ret and want_frame:
+                    # 更新最新帧（写入共享内存环形缓冲区），分析始终使用全分辨率，预览另有缩略图
+                    frame_buffer.write(frame, grabbed_at=grabbed_at)
+                    served_request = request_seq
+                    next_retrieve = now + retrieve_interval
+                if ret and want_preview:
+                    # 预览只需要缩略图，不写入全分辨率的槽位
+                    frame_buffer.write_preview(frame)
+                    served_preview = preview_request
+                    next_preview = now + preview_interval
+
+            if frame_interval:
+                next_frame = max(next_frame + frame_interval, now)  # 落后时不追帧
+                time.sleep(max(0, next_frame - time.monotonic()))
+        
+        except Exception as e:
+            frame_buffer.record_failure()
+            failures += 1
+            status_dict[stream_id] = 'error'
+            logging.error(f"Error in stream worker for {url}: {str(e)}")
+            time.sleep(1)  # 出错后等待1秒再重试
+
+    status_dict[stream_id] = 'stopped'
+
+def stream_worker(stream_id, url, status_dict, stop_event, frame_buffer, prompt_type='safety', options=None):
+    # 每路视频流一个进程（capture_backend 为 "process"）
+    try:
+        capture_loop(stream_id, url, status_dict, stop_event, frame_buffer, options)
+    finally:
+        frame_buffer.close()
+
+def capture_pool_worker(worker_index, command_queue, status_dict, stop_event):
+    """采集池进程：每路视频流一个线程，通过 command_queue 接收 add/remove 命令。
+
+    OpenCV 的拉流和解码会释放 GIL，同一进程内的多个采集线程可以并行工作。
+    """
+    captures = {}  # stream_id: (线程, 停止事件, 帧缓冲区)
+    retired = []  # 已通知停止、尚未退出的采集线程（例如卡在网络读取中）
+
+    def stop_capture(stream_id, wait=True):
+        thread, capture_stop, frame_buffer = captures.pop(stream_id)
+        capture_stop.set()
+        if wait:
+            thread.join(10)
+            if thread.is_alive():
+                logging.warning(f"Capture thread for stream {stream_id} did not stop in pool worker {worker_index}")
+                return
+            frame_buffer.close()
+        else:
+            retired.append((thread, frame_buffer))
+
+    while not stop_event.is_set():
+        for entry in [entry for entry in retired if not entry[0].is_alive()]:
+            retired.remove(entry)
+            entry[1].close()
+        try:
+            command = command_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if command[0] == 'add':
+            _, stream_id, url, frame_buffer, options = command
+            if stream_id in captures:
+                # 重启时不等待旧线程，它在下一次读取返回后自行退出
+                stop_capture(stream_id, wait=False)
+            capture_stop = threading.Event()
+            thread = threading.Thread(target=capture_loop, name=f'capture-{stream_id}', daemon=True,
+                                      args=(stream_id, url, status_dict, capture_stop, frame_buffer, options))
+            thread.start()
+            captures[stream_id] = (thread, capture_stop, frame_buffer)
+        elif command[0] == 'remove':
+            if command[1] in captures:
+                stop_capture(command[1])
+        elif command[0] == 'stop':
+            break
+
+    for _, capture_stop, _ in captures.values():
+        capture_stop.set()
+    for stream_id in list(captures):
+        stop_capture(stream_id)
+
+class CapturePool:
+    """固定数量的采集进程，视频流按负载分配到各进程（capture_backend 为 "pooled"）。"""
+
+    def __init__(self, size=4):
+        self.size = size
+        self.workers = []  # [(Process, 命令队列)]
+        self.assignments = {}  # stream_id: 进程序号
+
+    def start(self, status_dict, stop_event):
+        if self.workers and all(process.is_alive() for process, _ in self.workers):
+            return
+        self.stop(timeout=5)
+        self.workers = [self._spawn(index, status_dict, stop_event) for index in range(self.size)]
+        logging.info(f"Started capture pool with {self.size} processes")
+
+    def _spawn(self, index, status_dict, stop_event):
+        command_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=capture_pool_worker, name=f'capture-pool-{index}',
+                                          args=(index, command_queue, status_dict, stop_event))
+        process.start()
+        return process, command_queue
+
+    def add_stream(self, stream_id, url, frame_buffer, options=None):
+        index = self.assignments.get(stream_id)
+        if index is None:
+            # 分配给当前流数最少的进程
+            loads = [0] * len(self.workers)
+            for assigned in self.assignments.values():
+                loads[assigned] += 1
+            index = loads.index(min(loads))
+            self.assignments[stream_id] = index
+        self.workers[index][1].put(('add', stream_id, url, frame_buffer, options))
+
+    def remove_stream(self, stream_id):
+        index = self.assignments.pop(stream_id, None)
+        if index is not None and index < len(self.workers):
+            self.workers[index][1].put(('remove', stream_id))
+
+    def is_running(self, stream_id):
+        index = self.assignments.get(stream_id)
+        return index is not None and index < len(self.workers) and self.workers[index][0].is_alive()
+
+    def ensure_worker(self, stream_id, status_dict, stop_event):
+        """分配给该流的采集进程已退出时重新启动该进程，其上的其他流由监督器逐个重连。"""
+        index = self.assignments.get(stream_id)
+        if index is None or index >= len(self.workers) or self.workers[index][0].is_alive():
+            return
+        self.workers[index][1].close()
+        self.workers[index] = self._spawn(index, status_dict, stop_event)
+        logging.warning(f"Restarted capture pool process {index}")
+
+    def stop(self, timeout=10):
+        for process, command_queue in self.workers:
+            if process.is_alive():
+                command_queue.put(('stop',))
+        for process, command_queue in self.workers:
+            process.join(timeout)
+            if process.is_alive():
+                logging.warning(f"Capture pool process {process.name} did not stop gracefully, terminating...")
+                process.terminate()
+                process.join(5)
+            command_queue.close()
+        self.workers = []
+        self.assignments.clear()
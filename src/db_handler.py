@@ -1,19 +1,73 @@
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 import time
+import threading
 
 DB_PATH = 'video_streams.db'
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# 每个线程一个长连接：避免每条语句都重新打开数据库，并复用连接内的预编译语句缓存
+_local = threading.local()
+_connections = {}  # thread ident: (thread, connection)
+_connections_lock = threading.Lock()
+_generation = 0  # close_db_connections() 后递增，各线程据此重新打开连接
+
+def _configure_connection(conn):
+    # WAL 模式下读写互不阻塞；synchronous=NORMAL 时提交不再每次 fsync
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-16000")  # 约 16MB 页缓存
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=30000")
+
+def _prune_dead_connections():
+    # 调用方需持有 _connections_lock；关闭已退出线程遗留的连接
+    for ident, (thread, conn) in list(_connections.items()):
+        if not thread.is_alive():
+            conn.close()
+            del _connections[ident]
+
+def get_db_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.key == (DB_PATH, _generation):
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=30, cached_statements=256, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    _configure_connection(conn)
+    _local.conn = conn
+    _local.key = (DB_PATH, _generation)
+    with _connections_lock:
+        _prune_dead_connections()
+        previous = _connections.get(threading.get_ident())
+        if previous is not None:
+            previous[1].close()
+        _connections[threading.get_ident()] = (threading.current_thread(), conn)
+    return conn
+
+def close_db_connections():
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for thread, conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+# 数据库结构版本，记录在 PRAGMA user_version 中；新增结构变更时在 MIGRATIONS 末尾追加迁移函数
+SCHEMA_VERSION = 4
+
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+def _migrate_base_schema(cursor):
+    # 版本 1：基础表结构，并补齐旧版本数据库缺失的列
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS streams (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             url TEXT NOT NULL UNIQUE,
-            added_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            added_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            prompt_template TEXT DEFAULT 'DEFAULT_PROMPT_TEMPLATE'
         )
     ''')
     cursor.execute('''
@@ -35,91 +89,134 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    conn.commit()
-    conn.close()
 
-def update_db_structure():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 检查 added_time 列是否存在
-    cursor.execute("PRAGMA table_info(streams)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
+    # ALTER TABLE 只能添加常量默认值，时间列先添加再回填（新记录由写入方给出时间）
+    columns = _table_columns(cursor, 'streams')
     if 'added_time' not in columns:
-        print("正在更新数据库结构...")
-        cursor.execute("ALTER TABLE streams ADD COLUMN added_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-        # 为现有记录设置 added_time
+        cursor.execute("ALTER TABLE streams ADD COLUMN added_time TIMESTAMP")
         cursor.execute("UPDATE streams SET added_time = CURRENT_TIMESTAMP WHERE added_time IS NULL")
-        print("streams 表结构更新完成")
-    
-    # 检查 prompt_template 列是否存在
     if 'prompt_template' not in columns:
-        print("正在添加 prompt_template 列...")
         cursor.execute("ALTER TABLE streams ADD COLUMN prompt_template TEXT DEFAULT 'DEFAULT_PROMPT_TEMPLATE'")
-        print("prompt_template 列添加完成")
-    
-    # 确保 person_features 表存在并有正确的结构
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS person_features (
-            id TEXT PRIMARY KEY,
-            features TEXT,
-            position TEXT,
-            action TEXT,
-            last_seen TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    
-    print("数据库结构更新完成")
 
-def update_person_features_table():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 检查 position, action 和 created_at 列是否存在
-    cursor.execute("PRAGMA table_info(person_features)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
+    columns = _table_columns(cursor, 'person_features')
     if 'position' not in columns:
         cursor.execute("ALTER TABLE person_features ADD COLUMN position TEXT")
-    
     if 'action' not in columns:
         cursor.execute("ALTER TABLE person_features ADD COLUMN action TEXT")
-    
     if 'created_at' not in columns:
-        cursor.execute("ALTER TABLE person_features ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-    
-    conn.commit()
-    conn.close()
-    print("person_features 表结构已更新")
+        cursor.execute("ALTER TABLE person_features ADD COLUMN created_at TIMESTAMP")
+        # 与 upsert_person_features 一致记为时间戳，按 created_at 清理和加载时才能比较
+        cursor.execute("UPDATE person_features SET created_at = CAST(strftime('%s', 'now') AS REAL) "
+                       "WHERE created_at IS NULL")
+
+def _migrate_analysis_columns(cursor):
+    # 版本 2：从 JSON 结果中提取违规标记和人数为独立列，并建立按流和时间查询的索引
+    columns = _table_columns(cursor, 'analysis_results')
+    if 'violation_detected' not in columns:
+        cursor.execute("ALTER TABLE analysis_results ADD COLUMN violation_detected INTEGER")
+    if 'people_count' not in columns:
+        cursor.execute("ALTER TABLE analysis_results ADD COLUMN people_count INTEGER")
+    cursor.execute("""
+        UPDATE analysis_results SET
+            violation_detected = CASE
+                WHEN json_type(result, '$.violation_detected') = 'true' THEN 1
+                WHEN json_array_length(result, '$."安全隐患"') > 0 THEN 1
+                ELSE 0 END,
+            people_count = json_array_length(result, '$.people')
+        WHERE json_valid(result) AND json_type(result) = 'object'
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_results_stream_time "
+                   "ON analysis_results (stream_id, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_results_time ON analysis_results (timestamp)")
+    # 部分索引只包含违规记录，违规查询不受正常记录数量影响
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_results_violations "
+                   "ON analysis_results (stream_id, timestamp) WHERE violation_detected = 1")
+
+def _migrate_person_features_stream(cursor):
+    # 版本 3：记录人员最后出现的视频流，按 created_at（最后写入时间）清理和加载
+    if 'stream_id' not in _table_columns(cursor, 'person_features'):
+        cursor.execute("ALTER TABLE person_features ADD COLUMN stream_id INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_person_features_created_at ON person_features (created_at)")
+
+def _migrate_image_checkpoints(cursor):
+    # 版本 4：图集分析结果与视频流共用 analysis_results（source 记录图片路径），
+    # 已分析图片按内容哈希记录，中断后重新运行时跳过
+    if 'source' not in _table_columns(cursor, 'analysis_results'):
+        cursor.execute("ALTER TABLE analysis_results ADD COLUMN source TEXT")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_checkpoints (
+            content_hash TEXT PRIMARY KEY,
+            path TEXT,
+            result_id INTEGER,
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (result_id) REFERENCES analysis_results(id)
+        )
+    ''')
+
+MIGRATIONS = [
+    (1, _migrate_base_schema),
+    (2, _migrate_analysis_columns),
+    (3, _migrate_person_features_stream),
+    (4, _migrate_image_checkpoints),
+]
+
+def get_schema_version():
+    return get_db_connection().execute("PRAGMA user_version").fetchone()[0]
+
+def migrate():
+    """把数据库升级到 SCHEMA_VERSION，版本已匹配时只读取一次 user_version。"""
+    conn = get_db_connection()
+    version = get_schema_version()
+    if version >= SCHEMA_VERSION:
+        return version
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        print(f"正在更新数据库结构到版本 {target}...")
+        # 显式开启事务，使 ALTER/CREATE 与版本号更新一起提交或回滚
+        conn.execute("BEGIN")
+        try:
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    print("数据库结构更新完成")
+    return version
+
+def init_db():
+    migrate()
+
+def update_db_structure():
+    migrate()
+
+def update_person_features_table():
+    migrate()
 
 def add_stream(url, prompt_template='DEFAULT_PROMPT_TEMPLATE'):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO streams (url, added_time, prompt_template) VALUES (?, ?, ?)", 
-                   (url, datetime.now(), prompt_template))
-    conn.commit()
+    # 连接按线程长期复用，语句失败时必须回滚，否则未结束的事务会带到该线程后续的写入中
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO streams (url, added_time, prompt_template) VALUES (?, ?, ?)", 
+                       (url, datetime.now(), prompt_template))
     stream_id = cursor.lastrowid
-    conn.close()
     return stream_id
 
 def remove_stream(id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM streams WHERE id = ?", (id,))
+    conn = get_db_connection()
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM streams WHERE id = ?", (id,))
     if cursor.rowcount > 0:
         print(f"成功删除视频流 ID: {id}")
     else:
         print(f"未找到视频流 ID: {id}")
-    conn.commit()
-    conn.close()
 
 def get_all_streams():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT id, url, added_time, prompt_template FROM streams")
@@ -136,55 +233,124 @@ def get_all_streams():
             stream['prompt_template'] = 'DEFAULT_PROMPT_TEMPLATE'
         streams.append(stream)
     
-    conn.close()
     return streams
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def extract_result_fields(analysis_result):
+    """返回 (violation_detected, people_count)，与迁移 2 中的回填规则一致。"""
+    if not isinstance(analysis_result, dict):
+        return None, None
+    violation = analysis_result.get('violation_detected') is True or bool(analysis_result.get('安全隐患'))
+    people = analysis_result.get('people')
+    return int(violation), len(people) if isinstance(people, list) else None
+
+def insert_analysis_results(cursor, records):
+    # records: [(stream_id, analysis_result, timestamp)]，由调用方负责提交事务
+    cursor.executemany("""
+        INSERT INTO analysis_results (stream_id, result, timestamp, violation_detected, people_count)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(stream_id, json.dumps(analysis_result), timestamp, *extract_result_fields(analysis_result))
+          for stream_id, analysis_result, timestamp in records])
+
+def insert_image_results(cursor, records):
+    # records: [(content_hash, path, analysis_result, timestamp)]，结果与检查点在同一事务中写入，由调用方负责提交
+    for content_hash, path, analysis_result, timestamp in records:
+        cursor.execute("""
+            INSERT INTO analysis_results (stream_id, result, timestamp, violation_detected, people_count, source)
+            VALUES (NULL, ?, ?, ?, ?, ?)
+        """, (json.dumps(analysis_result), timestamp, *extract_result_fields(analysis_result), path))
+        cursor.execute("INSERT OR REPLACE INTO image_checkpoints (content_hash, path, result_id, analyzed_at) "
+                       "VALUES (?, ?, ?, ?)", (content_hash, path, cursor.lastrowid, timestamp))
+
+def is_image_analyzed(content_hash):
+    cursor = get_db_connection().execute("SELECT 1 FROM image_checkpoints WHERE content_hash = ?", (content_hash,))
+    return cursor.fetchone() is not None
+
+def upsert_person_features(cursor, people):
+    # people: [person_data]，由调用方负责提交事务
+    current_time = time.time()
+    cursor.executemany("""
+        INSERT OR REPLACE INTO person_features (id, features, position, action, last_seen, created_at, stream_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(person_data['id'], json.dumps(person_data['features']), 
+           person_data['position'], person_data['action'], person_data['last_seen'],
+           current_time, person_data.get('stream_id')) for person_data in people])
+
+def delete_person_features_before(cursor, before):
+    # 删除 before（时间戳）之前最后写入的人员特征，由调用方负责提交事务
+    cursor.execute("DELETE FROM person_features WHERE created_at < ?", (before,))
+
+def utc_timestamp():
+    # 与 SQLite datetime('now') 相同的格式（UTC）
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
 def save_analysis_result(stream_id, analysis_result):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO analysis_results (stream_id, result, timestamp)
-        VALUES (?, ?, datetime('now'))
-    """, (stream_id, json.dumps(analysis_result)))
-    conn.commit()
-    conn.close()
+    with conn:
+        insert_analysis_results(conn.cursor(), [(stream_id, analysis_result, utc_timestamp())])
 
 def save_person_features(person_data):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    current_time = time.time()
-    cursor.execute("""
-        INSERT OR REPLACE INTO person_features (id, features, position, action, last_seen, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (person_data['id'], json.dumps(person_data['features']), 
-          person_data['position'], person_data['action'], person_data['last_seen'],
-          current_time))
-    conn.commit()
-    conn.close()
-
-def get_person_features():
+    with conn:
+        upsert_person_features(conn.cursor(), [person_data])
+
+def get_person_features(since=None):
+    """读取人员特征，since 为时间戳时只返回此后写入的记录。过期数据由 ReID 存储定期清理。"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    current_time = time.time()
-    two_hours_ago = current_time - (2 * 60 * 60)  # 2小时前的时间戳
-    
-    # 删除超过2小时的Reid数据
-    cursor.execute("DELETE FROM person_features WHERE created_at < ?", (two_hours_ago,))
-    
-    cursor.execute("SELECT id, features, position, action, last_seen, created_at FROM person_features")
-    features = [{
+    if since is None:
+        cursor.execute("SELECT id, features, position, action, last_seen, created_at, stream_id FROM person_features")
+    else:
+        cursor.execute("SELECT id, features, position, action, last_seen, created_at, stream_id FROM person_features "
+                       "WHERE created_at >= ? ORDER BY created_at", (since,))
+    return [{
         "id": row['id'],
         "features": json.loads(row['features']),
         "position": row['position'],
         "action": row['action'],
         "last_seen": row['last_seen'],
-        "created_at": row['created_at']
+        "created_at": row['created_at'],
+        "stream_id": row['stream_id']
+    } for row in cursor.fetchall()]
+
+def _format_timestamp(value):
+    # 库中时间为 UTC 的 'YYYY-MM-DD HH:MM:SS' 字符串；datetime 先转换为 UTC（不带时区的按本地时间处理）
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+def _query_analysis_results(stream_id, start, end, limit, violations_only):
+    conditions = ["stream_id = ?"]
+    params = [stream_id]
+    if violations_only:
+        # 条件需与部分索引的 WHERE 完全一致才能命中该索引
+        conditions.append("violation_detected = 1")
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(_format_timestamp(start))
+    if end is not None:
+        conditions.append("timestamp < ?")
+        params.append(_format_timestamp(end))
+    params.append(limit)
+    cursor = get_db_connection().execute(f"""
+        SELECT id, stream_id, timestamp, result, violation_detected, people_count
+        FROM analysis_results
+        WHERE {' AND '.join(conditions)}
+        ORDER BY timestamp DESC
+        LIMIT ?
+    """, params)
+    return [{
+        "id": row['id'],
+        "stream_id": row['stream_id'],
+        "timestamp": row['timestamp'],
+        "result": json.loads(row['result']) if row['result'] else None,
+        "violation_detected": bool(row['violation_detected']),
+        "people_count": row['people_count']
     } for row in cursor.fetchall()]
-    conn.commit()
-    conn.close()
-    return features
\ No newline at end of file
+
+def get_analysis_results(stream_id, start=None, end=None, limit=100):
+    """查询某视频流在 [start, end) 内的分析结果，按时间倒序。"""
+    return _query_analysis_results(stream_id, start, end, limit, violations_only=False)
+
+def get_violations(stream_id, start=None, end=None, limit=100):
+    """查询某视频流在 [start, end) 内检测到违规的分析结果，按时间倒序。"""
+    return _query_analysis_results(stream_id, start, end, limit, violations_only=True)
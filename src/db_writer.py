@@ -0,0 +1,166 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from src.metrics import DB_WRITE_SECONDS, DB_WRITE_ROWS, DB_WRITE_ERRORS, DB_DROPPED_ROWS
+from src.tracing import current_trace
+from src.db_handler import (get_db_connection, insert_analysis_results, insert_image_results,
+                            upsert_person_features, delete_person_features_before, utc_timestamp)
+
+
+class BatchWriter:
+    """后台批量写库线程。
+
+    分析结果和人员特征先进入内存队列，由单个写线程攒批后在一个事务中提交：
+    攒够 max_batch 条或距本批第一条超过 flush_interval 秒即提交。同一批内同一人员
+    只保留最后一次更新。flush() 会阻塞到此前入队的数据全部落库。
+    提交失败（例如数据库被锁）时按 retry_delay 指数退避重试，共 max_attempts 次，仍失败才丢弃该批，
+    丢弃的行数记在 dropped_rows 中。
+    在分析线程中追踪的帧随结果一起入队，提交后记录排队和写入两个阶段并结束追踪。
+    """
+
+    def __init__(self, max_batch=500, flush_interval=1.0, max_attempts=4, retry_delay=0.5):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.logger = logging.getLogger(__name__)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written_batches = 0
+        self.written_rows = 0
+        self.dropped_rows = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def save_analysis_result(self, stream_id, analysis_result):
+        self.start()
+        trace = current_trace(stream_id)
+        traced = (trace.hand_off(), time.time()) if trace is not None else None
+        self._queue.put(('analysis', ((stream_id, analysis_result, utc_timestamp()), traced)))
+
+    def save_image_result(self, content_hash, path, analysis_result):
+        # 图集分析结果，检查点随结果一起提交
+        self.start()
+        self._queue.put(('image', (content_hash, path, analysis_result, utc_timestamp())))
+
+    def save_person_features(self, people):
+        self.start()
+        for person_data in people:
+            self._queue.put(('person', person_data))
+
+    def delete_person_features_before(self, before):
+        # 与写入走同一队列，保证清理不会删掉之后才入队的更新
+        self.start()
+        self._queue.put(('prune', before))
+
+    def flush(self, timeout=None):
+        """等待此前入队的所有写入提交完成，超时返回 False。"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            kind, item = self._queue.get()
+            analysis_rows = []
+            traces = []  # (FrameTrace, 入队时间)
+            image_rows = []
+            people = {}
+            prune_before = None
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if kind == 'analysis':
+                    row, traced = item
+                    analysis_rows.append(row)
+                    if traced is not None:
+                        traces.append(traced)
+                elif kind == 'image':
+                    image_rows.append(item)
+                elif kind == 'person':
+                    people[item['id']] = item
+                elif kind == 'prune':
+                    prune_before = max(prune_before or item, item)
+                elif kind == 'flush':
+                    waiters.append(item)
+                    break
+                if len(analysis_rows) + len(image_rows) + len(people) >= self.max_batch:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    kind, item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            write_start = time.time()
+            self._write(analysis_rows, list(people.values()), prune_before, image_rows)
+            write_end = time.time()
+            for trace, queued_at in traces:
+                trace.add_span('db_queue', queued_at, write_start)
+                trace.add_span('db_write', write_start, write_end)
+                trace.finish()
+            for done in waiters:
+                done.set()
+
+    def _write(self, analysis_rows, people, prune_before=None, image_rows=()):
+        if not analysis_rows and not image_rows and not people and prune_before is None:
+            return
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                self._commit(analysis_rows, people, prune_before, image_rows)
+                return
+            except Exception as e:
+                DB_WRITE_ERRORS.inc()
+                self.logger.warning(f"Failed to write batch of {len(analysis_rows) + len(image_rows)} results "
+                                    f"and {len(people)} people (attempt {attempt + 1}/{self.max_attempts}): {str(e)}")
+        self.dropped_rows += len(analysis_rows) + len(image_rows) + len(people)
+        DB_DROPPED_ROWS.inc('analysis_results', amount=len(analysis_rows) + len(image_rows))
+        DB_DROPPED_ROWS.inc('person_features', amount=len(people))
+        self.logger.error(f"Dropped batch of {len(analysis_rows) + len(image_rows)} results and {len(people)} people "
+                          f"after {self.max_attempts} attempts ({self.dropped_rows} rows dropped in total)")
+
+    def _commit(self, analysis_rows, people, prune_before, image_rows):
+        start = time.perf_counter()
+        conn = get_db_connection()
+        with conn:
+            cursor = conn.cursor()
+            if analysis_rows:
+                insert_analysis_results(cursor, analysis_rows)
+            if image_rows:
+                insert_image_results(cursor, image_rows)
+            if prune_before is not None:
+                delete_person_features_before(cursor, prune_before)
+            if people:
+                upsert_person_features(cursor, people)
+        DB_WRITE_SECONDS.observe(value=time.perf_counter() - start)
+        DB_WRITE_ROWS.inc('analysis_results', amount=len(analysis_rows) + len(image_rows))
+        DB_WRITE_ROWS.inc('person_features', amount=len(people))
+        self.written_batches += 1
+        self.written_rows += len(analysis_rows) + len(image_rows) + len(people)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_db_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BatchWriter()
+            atexit.register(_writer.flush, 10)
+        return _writer
@@ -0,0 +1,272 @@
+import time
+import logging
+import numpy as np
+from multiprocessing import shared_memory
+
+# 控制区（int64）字段索引
+SEQ = 0           # 最新已发布帧的序号，0 表示尚无帧
+LATEST_SLOT = 1   # 最新帧所在槽位
+REQUEST_SEQ = 2   # 读取方请求新帧时递增，grab 模式的采集进程据此决定是否解码
+HEARTBEAT = 3     # 采集方最近一次成功读取的时间（毫秒），-1 表示采集已退出
+FRAMES_GRABBED = 4  # 采集方累计读取（grab）的帧数
+READ_FAILURES = 5   # 采集方累计读取失败次数
+PREVIEW_SEQ = 6     # 最新预览缩略图的序号
+PREVIEW_SLOT = 7
+PREVIEW_REQUEST_SEQ = 8  # 预览方请求下一张缩略图时递增
+CTRL_FIELDS = 16
+
+# 每个槽位的元数据（int64）：序号、高、宽、通道数
+META_SEQ = 0
+META_HEIGHT = 1
+META_WIDTH = 2
+META_CHANNELS = 3
+META_FIELDS = 4
+PREVIEW_SLOTS = 2
+
+
+class SharedFrameBuffer:
+    """基于 multiprocessing.shared_memory 的单写多读帧环形缓冲区。
+
+    写入方（采集进程）把帧依次写入固定数量的槽位并递增序号，读取方直接拿到最新槽位的
+    numpy 视图，不经过 pickle 和 Manager 进程。视图在写入方绕完一圈槽位后会被覆盖，
+    需要长时间持有帧的调用方应使用 copy=True。
+
+    另有一个独立的预览区：采集方按请求写入缩小到 preview_size 以内的 RGB 缩略图，
+    界面只读取这些小图，预览开销与摄像头分辨率基本无关。
+    """
+
+    def __init__(self, max_width=1920, max_height=1080, channels=3, slots=3, name=None, preview_size=(320, 240)):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.channels = channels
+        self.slots = slots
+        self.preview_size = tuple(preview_size)
+        self.slot_bytes = max_width * max_height * channels
+        self.preview_slot_bytes = self.preview_size[0] * self.preview_size[1] * 3
+        self._ctrl_bytes = CTRL_FIELDS * 8
+        self._meta_bytes = (slots + PREVIEW_SLOTS) * META_FIELDS * 8
+        self._times_bytes = slots * 8 * 2  # 发布时间和读取（grab）时间
+        self._header_bytes = self._ctrl_bytes + self._meta_bytes + self._times_bytes
+        size = self._header_bytes + slots * self.slot_bytes + PREVIEW_SLOTS * self.preview_slot_bytes
+
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._map_views()
+        if self._owner:
+            self.ctrl[:] = 0
+            self.meta[:] = 0
+            self.preview_meta[:] = 0
+            self.times[:] = 0
+            self.grab_times[:] = 0
+
+    def _map_views(self):
+        buf = self.shm.buf
+        offset = 0
+        self.ctrl = np.ndarray((CTRL_FIELDS,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += self._ctrl_bytes
+        self.meta = np.ndarray((self.slots, META_FIELDS), dtype=np.int64, buffer=buf, offset=offset)
+        self.preview_meta = np.ndarray((PREVIEW_SLOTS, META_FIELDS), dtype=np.int64, buffer=buf,
+                                       offset=offset + self.slots * META_FIELDS * 8)
+        offset += self._meta_bytes
+        self.times = np.ndarray((self.slots,), dtype=np.float64, buffer=buf, offset=offset)
+        self.grab_times = np.ndarray((self.slots,), dtype=np.float64, buffer=buf, offset=offset + self.slots * 8)
+        offset += self._times_bytes
+        self.data = np.ndarray((self.slots, self.slot_bytes), dtype=np.uint8, buffer=buf, offset=offset)
+        offset += self.slots * self.slot_bytes
+        self.preview_data = np.ndarray((PREVIEW_SLOTS, self.preview_slot_bytes), dtype=np.uint8, buffer=buf, offset=offset)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __reduce__(self):
+        # 传给子进程时只传共享内存名称，由子进程重新挂载
+        return (SharedFrameBuffer, (self.max_width, self.max_height, self.channels, self.slots, self.shm.name,
+                                    self.preview_size))
+
+    @property
+    def seq(self):
+        return int(self.ctrl[SEQ])
+
+    @property
+    def request_seq(self):
+        return int(self.ctrl[REQUEST_SEQ])
+
+    def request_frame(self):
+        """请求采集进程尽快解码一帧（多个读取方并发请求时只需计数发生变化）。"""
+        self.ctrl[REQUEST_SEQ] += 1
+
+    @property
+    def preview_seq(self):
+        return int(self.ctrl[PREVIEW_SEQ])
+
+    @property
+    def preview_request_seq(self):
+        return int(self.ctrl[PREVIEW_REQUEST_SEQ])
+
+    def request_preview(self):
+        """请求采集进程写入下一张缩略图，采集方按 preview_fps 限制频率。"""
+        self.ctrl[PREVIEW_REQUEST_SEQ] += 1
+
+    def heartbeat(self):
+        self.ctrl[HEARTBEAT] = int(time.time() * 1000)
+
+    def record_grab(self):
+        self.ctrl[FRAMES_GRABBED] += 1
+        self.heartbeat()
+
+    def record_failure(self):
+        self.ctrl[READ_FAILURES] += 1
+
+    def counters(self):
+        """采集进程写入的累计计数，供指标导出。"""
+        return {
+            'grabbed': int(self.ctrl[FRAMES_GRABBED]),
+            'decoded': int(self.ctrl[SEQ]),
+            'read_failures': int(self.ctrl[READ_FAILURES]),
+        }
+
+    def mark_exited(self):
+        self.ctrl[HEARTBEAT] = -1
+
+    @property
+    def last_heartbeat(self):
+        """返回 (是否已退出, 最近一次心跳的时间戳或 None)。"""
+        value = int(self.ctrl[HEARTBEAT])
+        return value == -1, (value / 1000 if value > 0 else None)
+
+    def wait_for_frame(self, after_seq, timeout):
+        """等待序号超过 after_seq 的帧发布，超时返回 False。"""
+        deadline = time.monotonic() + timeout
+        while int(self.ctrl[SEQ]) <= after_seq:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def fit_frame(self, frame):
+        h, w = frame.shape[:2]
+        if w <= self.max_width and h <= self.max_height:
+            return frame
+        import cv2
+        scale = min(self.max_width / w, self.max_height / h)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def write(self, frame, timestamp=None, grabbed_at=None):
+        # grabbed_at：采集方读到该帧数据包的时间，与发布时间之差即 retrieve、缩放和写入的耗时
+        frame = self.fit_frame(frame)
+        if frame.ndim == 2:
+            frame = frame[:, :, None]
+        h, w, c = frame.shape
+        if c > self.channels:
+            raise ValueError(f"Frame has {c} channels, buffer supports {self.channels}")
+
+        seq = int(self.ctrl[SEQ]) + 1
+        slot = seq % self.slots
+        # 先把槽位标记为写入中，读取方会据此放弃该槽位
+        self.meta[slot, META_SEQ] = -1
+        self.data[slot, :h * w * c] = np.ascontiguousarray(frame).reshape(-1)
+        self.meta[slot, META_HEIGHT] = h
+        self.meta[slot, META_WIDTH] = w
+        self.meta[slot, META_CHANNELS] = c
+        self.times[slot] = timestamp if timestamp is not None else time.time()
+        self.grab_times[slot] = grabbed_at if grabbed_at is not None else self.times[slot]
+        self.meta[slot, META_SEQ] = seq
+        self.ctrl[LATEST_SLOT] = slot
+        self.ctrl[SEQ] = seq
+        return seq
+
+    def write_preview(self, frame):
+        """把 BGR 帧缩小到 preview_size 以内并转换为 RGB 后写入预览区。"""
+        import cv2
+        h, w = frame.shape[:2]
+        scale = min(self.preview_size[0] / w, self.preview_size[1] / h, 1.0)
+        if scale < 1:
+            frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        if frame.ndim == 2:
+            thumbnail = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+        else:
+            thumbnail = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w = thumbnail.shape[:2]
+
+        seq = int(self.ctrl[PREVIEW_SEQ]) + 1
+        slot = seq % PREVIEW_SLOTS
+        self.preview_meta[slot, META_SEQ] = -1
+        self.preview_data[slot, :h * w * 3] = thumbnail.reshape(-1)
+        self.preview_meta[slot, META_HEIGHT] = h
+        self.preview_meta[slot, META_WIDTH] = w
+        self.preview_meta[slot, META_CHANNELS] = 3
+        self.preview_meta[slot, META_SEQ] = seq
+        self.ctrl[PREVIEW_SLOT] = slot
+        self.ctrl[PREVIEW_SEQ] = seq
+        return seq
+
+    def wait_for_preview(self, after_seq, timeout):
+        deadline = time.monotonic() + timeout
+        while int(self.ctrl[PREVIEW_SEQ]) <= after_seq:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def read_preview(self):
+        """返回最新缩略图的 (seq, RGB 数组副本)，尚无缩略图时返回 None。"""
+        for _ in range(3):
+            seq = int(self.ctrl[PREVIEW_SEQ])
+            if seq == 0:
+                return None
+            slot = int(self.ctrl[PREVIEW_SLOT])
+            if int(self.preview_meta[slot, META_SEQ]) != seq:
+                continue
+            h, w = int(self.preview_meta[slot, META_HEIGHT]), int(self.preview_meta[slot, META_WIDTH])
+            thumbnail = self.preview_data[slot, :h * w * 3].reshape(h, w, 3).copy()
+            if int(self.preview_meta[slot, META_SEQ]) == seq:
+                return seq, thumbnail
+        return None
+
+    def read_latest(self, copy=False):
+        """返回 (seq, frame, timestamp)，尚无可用帧时返回 None。"""
+        for _ in range(3):
+            seq = int(self.ctrl[SEQ])
+            if seq == 0:
+                return None
+            slot = int(self.ctrl[LATEST_SLOT])
+            if int(self.meta[slot, META_SEQ]) != seq:
+                continue  # 写入方刚好发布了下一帧，重新读取
+            h, w, c = (int(v) for v in self.meta[slot, META_HEIGHT:META_CHANNELS + 1])
+            timestamp = float(self.times[slot])
+            frame = self.data[slot, :h * w * c].reshape(h, w, c)
+            if not copy:
+                return seq, frame, timestamp
+            frame = frame.copy()
+            if int(self.meta[slot, META_SEQ]) == seq:
+                return seq, frame, timestamp
+        return None
+
+    def grab_time(self, seq):
+        """返回序号为 seq 的帧的读取时间，该槽位已被覆盖时返回 None。"""
+        slot = seq % self.slots
+        if int(self.meta[slot, META_SEQ]) != seq:
+            return None
+        grabbed_at = float(self.grab_times[slot])
+        return grabbed_at if int(self.meta[slot, META_SEQ]) == seq else None
+
+    def close(self):
+        # 释放 numpy 视图后才能关闭共享内存
+        self.ctrl = self.meta = self.times = self.grab_times = self.data = None
+        self.preview_meta = self.preview_data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            logging.warning(f"Shared frame buffer {self.shm.name} still has exported views")
+
+    def unlink(self):
+        if self._owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,80 @@
+import base64
+import threading
+import cv2
+
+DEFAULT_PROFILE = {'max_width': 1280, 'max_height': 720, 'quality': 80}
+
+
+class FrameEncoder:
+    """把帧在内存中编码为 JPEG：可选按比例裁剪感兴趣区域，超过最大分辨率时等比缩小。
+
+    roi 为 (x, y, w, h)，取值 0~1，表示相对画面宽高的比例，与视频分辨率无关。
+    缩放输出缓冲区按线程复用，分析线程池中并发编码互不影响。
+    """
+
+    def __init__(self, max_width=1280, max_height=720, quality=80, roi=None):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+        self.roi = roi
+        self._params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        self._local = threading.local()
+
+    def crop(self, frame, roi=None):
+        roi = roi or self.roi
+        if not roi:
+            return frame
+        h, w = frame.shape[:2]
+        x0 = min(max(int(roi[0] * w), 0), w - 1)
+        y0 = min(max(int(roi[1] * h), 0), h - 1)
+        x1 = min(max(int((roi[0] + roi[2]) * w), x0 + 1), w)
+        y1 = min(max(int((roi[1] + roi[3]) * h), y0 + 1), h)
+        return frame[y0:y1, x0:x1]
+
+    def resize(self, frame):
+        h, w = frame.shape[:2]
+        if w <= self.max_width and h <= self.max_height:
+            return frame
+        scale = min(self.max_width / w, self.max_height / h)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        # 输出尺寸不变时复用上一次的缓冲区，避免每帧分配
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[:2] != (size[1], size[0]) or buffer.shape[2:] != frame.shape[2:]:
+            buffer = None
+        buffer = cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+        self._local.buffer = buffer
+        return buffer
+
+    def encode(self, frame, roi=None):
+        """返回 JPEG 字节。"""
+        ok, buffer = cv2.imencode('.jpg', self.resize(self.crop(frame, roi)), self._params)
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return buffer.tobytes()
+
+    def encode_base64(self, frame, roi=None):
+        return base64.b64encode(self.encode(frame, roi)).decode('utf-8')
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_profile(model, config=None):
+    """ai_config.json 中 encode_profiles 按模型名配置 max_width/max_height/quality，"default" 为缺省值。"""
+    profiles = (config or {}).get('encode_profiles', {})
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(profiles.get('default', {}))
+    profile.update(profiles.get(model, {}))
+    return profile
+
+
+def get_frame_encoder(model=None, config=None):
+    """返回该模型编码参数对应的共享编码器，参数相同的模型共用一个实例。"""
+    profile = get_profile(model, config)
+    key = (profile['max_width'], profile['max_height'], profile['quality'])
+    with _encoders_lock:
+        encoder = _encoders.get(key)
+        if encoder is None:
+            encoder = _encoders[key] = FrameEncoder(*key)
+        return encoder
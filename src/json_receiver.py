@@ -1,11 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import json
 import logging
-from threading import Event
+from threading import Event, Thread
 from werkzeug.serving import make_server
+from src.metrics import registry
+from src.tracing import get_tracer
 
 app = Flask(__name__)
 server = None
+# 监控接口（/metrics、/trace）单独一个应用和端口，不暴露接收数据的 POST 接口
+metrics_app = Flask(__name__)
+metrics_server = None
 
 @app.route('/receive_data', methods=['POST'])
 def receive_data():
@@ -13,6 +18,20 @@ def receive_data():
     logging.info(f"Received JSON data: {json.dumps(data, ensure_ascii=False)}")
     return jsonify({"status": "success", "message": "Data received and logged"}), 200
 
+@metrics_app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@metrics_app.route('/trace', methods=['GET'])
+def trace():
+    # Chrome trace 格式，可直接在 chrome://tracing 或 ui.perfetto.dev 中打开
+    return jsonify(get_tracer().export_chrome_trace())
+
+@metrics_app.route('/trace/summary', methods=['GET'])
+def trace_summary():
+    summary = get_tracer().summary()
+    return jsonify({str(stream_id): stages for stream_id, stages in summary.items()})
+
 def run_flask_app(stop_event):
     global server
     server = make_server('0.0.0.0', 5001, app)
@@ -21,4 +40,23 @@ def run_flask_app(stop_event):
 def stop_flask_app():
     global server
     if server:
-        server.shutdown()
\ No newline at end of file
+        server.shutdown()
+
+def start_metrics_server(host='127.0.0.1', port=9100):
+    """在后台线程中启动监控接口（/metrics、/trace），端口被占用时返回 None。"""
+    global metrics_server
+    try:
+        metrics_server = make_server(host, port, metrics_app, threaded=True)
+    except OSError as e:
+        logging.error(f"Failed to start metrics server on {host}:{port}: {str(e)}")
+        return None
+    thread = Thread(target=metrics_server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logging.info(f"Metrics available at http://{host}:{port}/metrics")
+    return thread
+
+def stop_metrics_server():
+    global metrics_server
+    if metrics_server:
+        metrics_server.shutdown()
+        metrics_server = None
@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+
+# 秒级延迟的默认分桶，覆盖从数据库写入（毫秒级）到 AI 请求（数十秒）的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 标签值元组: 值
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(value) for value in labels)
+
+    def remove(self, *labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value, *extra in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra[0] if extra else None)} "
+                         f"{_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, *labels, value):
+        # 用于同步其他进程（共享内存中）累计的计数
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, *labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def get(self, *labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def snapshot(self, *labels):
+        """返回 {'count', 'sum', 'buckets'}，用于命令行输出。"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return {'count': 0, 'sum': 0.0, 'buckets': {}}
+            counts, total, count = list(state[0]), state[1], state[2]
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets[bound] = cumulative
+        return {'count': count, 'sum': total, 'buckets': buckets}
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        samples = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key, cumulative, ('le', _format_value(bound))))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """进程内的指标注册表。同名指标只创建一次；collector 在每次导出前调用，用于拉取其他模块或进程的状态。"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def collect(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            collector()
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）。"""
+        self.collect()
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = MetricsRegistry()
+
+# 各模块共用的指标
+AI_REQUESTS = registry.counter('ai_requests_total', 'AI analysis requests by outcome', ('stream', 'outcome'))
+AI_RETRIES = registry.counter('ai_retries_total', 'AI HTTP request retries by reason', ('reason',))
+AI_LATENCY = registry.histogram('ai_request_seconds', 'End-to-end AI analysis latency including queueing', ('stream',))
+AI_TIME_TO_ALERT = registry.histogram('ai_time_to_alert_seconds',
+                                      'Time from analysis start until a streamed response reveals a violation', ('stream',))
+AI_PAYLOAD_BYTES = registry.histogram('ai_request_payload_bytes', 'AI request JSON payload size',
+                                      buckets=(16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6))
+AI_REQUEST_IMAGES = registry.histogram('ai_request_images', 'Images sent per AI request', buckets=(1, 2, 4, 8, 16))
+CACHE_LOOKUPS = registry.counter('ai_cache_lookups_total', 'AI result cache lookups', ('result',))
+DB_WRITE_SECONDS = registry.histogram('db_write_seconds', 'Database batch write transaction time')
+DB_WRITE_ROWS = registry.counter('db_write_rows_total', 'Rows written by the database writer', ('table',))
+DB_WRITE_ERRORS = registry.counter('db_write_errors_total', 'Failed database batch writes')
+DB_DROPPED_ROWS = registry.counter('db_write_dropped_rows_total', 'Rows dropped after all write attempts failed',
+                                   ('table',))
@@ -0,0 +1,77 @@
+import threading
+import time
+
+
+class MotionGate:
+    """发送给视觉模型之前的画面变化预过滤。
+
+    把帧缩成很小的灰度图，与该流上一次"已发送"的参考图逐像素比较，变化像素占比
+    低于阈值时跳过本次分析。与上次发送帧比较（而不是上一帧）可以累积缓慢变化；
+    超过 max_skip_seconds 仍会强制发送一次，避免静止画面长期不被分析。
+    """
+
+    def __init__(self, threshold=0.02, pixel_delta=25, size=(64, 36), max_skip_seconds=300):
+        self.threshold = threshold  # 变化像素占比阈值，0 表示不过滤
+        self.pixel_delta = pixel_delta  # 灰度差超过该值的像素视为变化
+        self.size = size
+        self.max_skip_seconds = max_skip_seconds
+        self.thresholds = {}  # stream_id: 单独设置的阈值
+        self._references = {}  # stream_id: (缩略灰度图, 发送时间)
+        self._stats = {}  # stream_id: {'sent', 'skipped', 'last_score'}
+        self._lock = threading.Lock()
+
+    def set_threshold(self, stream_id, threshold):
+        with self._lock:
+            if threshold is None:
+                self.thresholds.pop(stream_id, None)
+            else:
+                self.thresholds[stream_id] = threshold
+
+    def reset(self, stream_id):
+        with self._lock:
+            self._references.pop(stream_id, None)
+            self._stats.pop(stream_id, None)
+            self.thresholds.pop(stream_id, None)
+
+    def _downscale(self, frame):
+        import cv2
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+    def change_score(self, small, reference):
+        import cv2
+        import numpy as np
+        diff = cv2.absdiff(small, reference)
+        return float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+
+    def check(self, stream_id, frame):
+        """返回 True 表示画面有足够变化、应当发送分析。"""
+        small = self._downscale(frame)
+        now = time.monotonic()
+        with self._lock:
+            threshold = self.thresholds.get(stream_id, self.threshold)
+            stats = self._stats.setdefault(stream_id, {'sent': 0, 'skipped': 0, 'last_score': None})
+            reference = self._references.get(stream_id)
+            if reference is not None and threshold > 0:
+                score = self.change_score(small, reference[0])
+                stats['last_score'] = round(score, 4)
+                if score < threshold and now - reference[1] < self.max_skip_seconds:
+                    stats['skipped'] += 1
+                    return False
+            self._references[stream_id] = (small, now)
+            stats['sent'] += 1
+            return True
+
+    def stats(self, stream_id=None):
+        with self._lock:
+            if stream_id is not None:
+                return dict(self._stats.get(stream_id, {'sent': 0, 'skipped': 0, 'last_score': None}))
+            return {sid: dict(stats) for sid, stats in self._stats.items()}
+
+    def totals(self):
+        with self._lock:
+            return {
+                'sent': sum(stats['sent'] for stats in self._stats.values()),
+                'skipped': sum(stats['skipped'] for stats in self._stats.values()),
+            }
@@ -0,0 +1,92 @@
+import json
+import re
+
+# 中日韩字符大致每字 1 个 token，其余文本按每 4 个字符 1 个 token 估算
+_CJK = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+# 图片按固定开销计入（多数视觉模型按分辨率折算为固定数量的 token）
+IMAGE_TOKENS = 1000
+OMITTED_IMAGE_TEXT = "[图片已省略]"
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message):
+    content = message.get('content')
+    if isinstance(content, str):
+        return estimate_tokens(content) + 4
+    tokens = 4
+    for part in content or []:
+        if part.get('type') == 'text':
+            tokens += estimate_tokens(part.get('text', ''))
+        elif part.get('type') == 'image_url':
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+def strip_images(message):
+    """去掉消息中的图片，返回新消息；历史消息只保留文字，旧图片不再重复发送。"""
+    content = message.get('content')
+    if isinstance(content, str):
+        return message
+    texts = [part.get('text', '') if part.get('type') == 'text' else OMITTED_IMAGE_TEXT for part in content or []]
+    return dict(message, content='\n'.join(texts))
+
+
+def _compact_person(person):
+    # 只保留对重识别有用的字段，空字段不输出
+    return {key: person[key] for key in ('id', 'features', 'position', 'action', 'last_seen') if person.get(key)}
+
+
+def build_reid_context(reid_data, budget_tokens):
+    """把人员特征按给定顺序（最近出现的在前）压缩进预算，超出的部分只给出数量摘要。"""
+    if not reid_data or budget_tokens <= 0:
+        return ""
+    header = "\n\n以下是之前识别到的人员特征数据，请在分析时考虑这些信息：\n"
+    used = estimate_tokens(header)
+    lines = []
+    for person in reid_data:
+        line = json.dumps(_compact_person(person), ensure_ascii=False, separators=(',', ':'))
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > budget_tokens:
+            break
+        lines.append(line)
+        used += tokens
+    # 一条都放不下时（例如单人特征很长）仍告知模型人员数量，而不是整段省略
+    dropped = len(reid_data) - len(lines)
+    if not lines:
+        lines.append(f"共 {dropped} 名人员，特征数据超出长度限制未列出。")
+    elif dropped:
+        lines.append(f"另有 {dropped} 名较早出现的人员未列出。")
+    return header + '\n'.join(lines)
+
+
+def fit_history(history, budget_tokens):
+    """从最新的消息往前保留历史，直到用完预算；assistant 回复不单独保留在开头。"""
+    kept = []
+    used = 0
+    for message in reversed(history):
+        tokens = message_tokens(message)
+        if used + tokens > budget_tokens:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    while kept and kept[0].get('role') == 'assistant':
+        kept.pop(0)
+    return kept
+
+
+def build_messages(system_message, history, user_message, budget_tokens):
+    """组装 messages：系统消息只出现一次，当前消息完整保留，历史按剩余预算截断。"""
+    remaining = budget_tokens - message_tokens(system_message) - message_tokens(user_message)
+    return [system_message] + fit_history(history, max(remaining, 0)) + [user_message]
+
+
+def payload_size(payload):
+    # 与 requests 发送 json= 时的序列化方式一致
+    return len(json.dumps(payload).encode('utf-8'))
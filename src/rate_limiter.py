@@ -0,0 +1,98 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value, default=None):
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式。"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """协程友好的令牌桶限流器，所有 AI 调用共用一个实例。
+
+    等待令牌的请求在事件循环中排队（asyncio.Lock 按先来先得唤醒），不占用线程。
+    收到 429 时按 Retry-After 暂停发放并把速率减半，之后每次成功按固定步长恢复，
+    使吞吐稳定在服务商限额附近。
+    """
+
+    def __init__(self, rate_per_minute=30, burst=5, min_rate_per_minute=1, max_backoff=60):
+        self.max_rate = rate_per_minute / 60.0
+        self.min_rate = min_rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst
+        self.max_backoff = max_backoff
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_limited = 0
+        self.waiting = 0
+        self.rate_limited_count = 0
+        self._lock = None
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _reserve(self):
+        # 拿到令牌返回 0，否则返回需要等待的秒数
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    delay = self._reserve()
+                    if delay <= 0:
+                        return
+                    await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+    def on_rate_limited(self, retry_after=None):
+        now = time.monotonic()
+        self._refill(now)
+        self.rate_limited_count += 1
+        self.consecutive_limited += 1
+        if retry_after is None:
+            retry_after = min(self.max_backoff, 2 ** self.consecutive_limited)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        return retry_after
+
+    def on_success(self):
+        self.consecutive_limited = 0
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def stats(self):
+        now = time.monotonic()
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        return {
+            'rate_per_minute': round(self.rate * 60, 2),
+            'max_rate_per_minute': round(self.max_rate * 60, 2),
+            'tokens': round(tokens, 2),
+            'blocked_for': round(max(0.0, self.blocked_until - now), 2),
+            'waiting': self.waiting,
+            'rate_limited': self.rate_limited_count,
+        }
@@ -1,23 +1,179 @@
+import heapq
+import logging
+import threading
 import time
+from collections import OrderedDict
+from datetime import datetime
+from src.backoff import Backoff
+from src.db_handler import get_person_features
+from src.db_writer import get_db_writer
 
-# 定义一个全局变量来存储ReID数据
-reid_data = []
-
-def get_reid_data(frame=None):
-    global reid_data
-    # 移除超过 5 分钟未更新的数据
-    current_time = time.time()
-    reid_data = [data for data in reid_data if current_time - data['last_seen'] < 300]
-    return reid_data
-
-def update_reid_data(new_data):
-    global reid_data
-    for new_person in new_data:
-        existing_person = next((p for p in reid_data if p['id'] == new_person['id']), None)
-        if existing_person:
-            existing_person.update(new_person)
-        else:
-            reid_data.append(new_person)
-
-# 确保在启动视频流处理之前调用update_reid_data至少一次，即使是用空数据初始化
-update_reid_data([])
\ No newline at end of file
+
+class ReIDStore:
+    """进程内的人员特征（ReID）存储。
+
+    以 id 为键的字典保存每个人的最新记录，另按视频流和全局各维护一个按最后出现时间
+    排序的 OrderedDict，过期由最小堆驱动（堆中的旧条目在弹出时与记录比对后丢弃）。
+    启动时从 person_features 表加载一次未过期的数据，之后的更新只经后台写线程增量
+    写回，数据库中的过期数据每 prune_interval 秒清理一次。
+    """
+
+    def __init__(self, ttl_seconds=7200, max_people=20, prune_interval=60, persist=True):
+        self.ttl_seconds = ttl_seconds
+        self.max_people = max_people  # 每次提示词中最多附带的人员数
+        self.prune_interval = prune_interval
+        self.persist = persist
+        self.logger = logging.getLogger(__name__)
+        self._people = {}  # id: 记录
+        self._seen = {}  # id: 最后出现时间戳
+        self._recent = OrderedDict()  # 全部人员，最近出现的在末尾
+        self._by_stream = {}  # stream_id: OrderedDict
+        self._heap = []  # (最后出现时间戳, id)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._load_backoff = Backoff(5.0, 300.0)
+        self._load_retry_at = 0  # 读取失败后，在此时间之前不再重试，避免每次调用都访问数据库并记录错误
+        self._last_prune = time.time()
+
+    def load(self):
+        """从数据库加载未过期的人员特征，成功一次后不再加载；读取失败时按指数退避延后重试。"""
+        with self._lock:
+            if self._loaded or time.monotonic() < self._load_retry_at:
+                return
+        try:
+            rows = get_person_features(since=time.time() - self.ttl_seconds)
+        except Exception as e:
+            with self._lock:
+                delay = self._load_backoff.next_delay()
+                self._load_retry_at = time.monotonic() + delay
+            self.logger.error(f"Failed to load person features: {str(e)}, retrying in {delay:.1f}s")
+            return
+        with self._lock:
+            # 并发加载时后完成的一次按时间比对合并，结果相同
+            self._loaded = True
+            for row in rows:
+                seen_at = row.pop('created_at')
+                # 启动后已有更新的人员以内存中的数据为准
+                if row['id'] not in self._seen or self._seen[row['id']] < seen_at:
+                    self._put(row, seen_at)
+        self.logger.info(f"Loaded {len(rows)} person features")
+
+    def _put(self, record, seen_at):
+        person_id = record['id']
+        old = self._people.get(person_id)
+        if old is not None and old.get('stream_id') != record.get('stream_id'):
+            stream_people = self._by_stream.get(old.get('stream_id'))
+            if stream_people is not None:
+                stream_people.pop(person_id, None)
+                if not stream_people:
+                    del self._by_stream[old.get('stream_id')]
+        self._people[person_id] = record
+        self._seen[person_id] = seen_at
+        self._recent[person_id] = None
+        self._recent.move_to_end(person_id)
+        stream_people = self._by_stream.setdefault(record.get('stream_id'), OrderedDict())
+        stream_people[person_id] = None
+        stream_people.move_to_end(person_id)
+        heapq.heappush(self._heap, (seen_at, person_id))
+
+    def _expire(self, now):
+        cutoff = now - self.ttl_seconds
+        while self._heap and self._heap[0][0] < cutoff:
+            seen_at, person_id = heapq.heappop(self._heap)
+            # 之后再次出现过的人员在堆中还有更新的条目
+            if self._seen.get(person_id) != seen_at:
+                continue
+            record = self._people.pop(person_id)
+            del self._seen[person_id]
+            self._recent.pop(person_id, None)
+            stream_people = self._by_stream.get(record.get('stream_id'))
+            if stream_people is not None:
+                stream_people.pop(person_id, None)
+                if not stream_people:
+                    del self._by_stream[record.get('stream_id')]
+        # 堆中失效条目过多时重建，避免同一批人反复出现导致堆无限增长
+        if len(self._heap) > 4 * len(self._seen) + 64:
+            self._heap = [(seen_at, person_id) for person_id, seen_at in self._seen.items()]
+            heapq.heapify(self._heap)
+
+    def update(self, stream_id, people):
+        """记录一帧分析结果中的人员，返回写入的记录列表。"""
+        now = time.time()
+        last_seen = datetime.now().isoformat()
+        records = [{
+            'id': person['id'],
+            'features': person.get('features', ''),
+            'position': person.get('position', ''),
+            'action': person.get('action', ''),
+            'last_seen': last_seen,
+            'stream_id': stream_id
+        } for person in people if 'id' in person]
+        with self._lock:
+            for record in records:
+                self._put(record, now)
+            self._expire(now)
+            prune = self.persist and now - self._last_prune >= self.prune_interval
+            if prune:
+                self._last_prune = now
+        if self.persist:
+            db_writer = get_db_writer()
+            if records:
+                db_writer.save_person_features(records)
+            if prune:
+                db_writer.delete_person_features_before(now - self.ttl_seconds)
+        return records
+
+    def get_recent(self, stream_id=None, limit=None):
+        """返回该视频流最近出现的人员，不足 limit 时用其他流最近出现的人员补齐（跨摄像头重识别）。"""
+        limit = self.max_people if limit is None else limit
+        with self._lock:
+            self._expire(time.time())
+            ids = []
+            stream_people = self._by_stream.get(stream_id)
+            if stream_people:
+                for person_id in reversed(stream_people):
+                    if len(ids) >= limit:
+                        break
+                    ids.append(person_id)
+            if len(ids) < limit:
+                selected = set(ids)
+                for person_id in reversed(self._recent):
+                    if len(ids) >= limit:
+                        break
+                    if person_id not in selected:
+                        ids.append(person_id)
+            return [{key: value for key, value in self._people[person_id].items() if key != 'stream_id'}
+                    for person_id in ids]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._people)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'people': len(self._people),
+                'streams': len(self._by_stream),
+                'heap': len(self._heap),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_reid_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ReIDStore()
+    _store.load()
+    return _store
+
+
+def get_reid_data(frame=None, stream_id=None):
+    return get_reid_store().get_recent(stream_id)
+
+
+def update_reid_data(new_data, stream_id=None):
+    get_reid_store().update(stream_id, new_data)
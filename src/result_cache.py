@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from src.db_handler import DB_PATH
+
+CACHE_DB_PATH = os.path.join(os.path.dirname(DB_PATH), 'analysis_cache.db')
+
+# 64 位哈希拆成 4 段 16 位：汉明距离 <= 3 时至少有一段完全相同（抽屉原理），
+# 因此按段做等值索引查询即可找到全部候选
+BANDS = 4
+BAND_BITS = 16
+
+
+def _to_signed(value):
+    # SQLite INTEGER 为有符号 64 位
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _bands(phash):
+    mask = (1 << BAND_BITS) - 1
+    return [(phash >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def make_prompt_key(model, prompt, stream_id=None):
+    # 不同摄像头的相似画面（例如同款工位）不能共用结果，视频流也是键的一部分
+    return hashlib.sha1(f"{model}\n{stream_id}\n{prompt}".encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """按"感知哈希 + 视频流 + 提示词模板 + 模型"缓存 AI 分析结果，存放在 video_streams.db 旁的 SQLite 文件中。
+
+    哈希汉明距离不超过 max_distance 视为同一画面；条目超过 ttl_seconds 失效（查询时可按提示词传入
+    更短的有效期），总数超过 max_entries 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, path=CACHE_DB_PATH, max_distance=3, ttl_seconds=3600, max_entries=5000):
+        self.path = path
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS ai_result_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prompt_key TEXT NOT NULL,
+                phash INTEGER NOT NULL,
+                band0 INTEGER NOT NULL,
+                band1 INTEGER NOT NULL,
+                band2 INTEGER NOT NULL,
+                band3 INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER DEFAULT 0
+            )
+        ''')
+        for i in range(BANDS):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_ai_result_cache_band{i} "
+                               f"ON ai_result_cache (prompt_key, band{i})")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_result_cache_last_used ON ai_result_cache (last_used)")
+        self._conn.commit()
+
+    def configure(self, max_distance, ttl_seconds, max_entries):
+        with self._lock:
+            self.max_distance = max_distance
+            self.ttl_seconds = ttl_seconds
+            self.max_entries = max_entries
+
+    def _candidates(self, prompt_key, phash, min_created):
+        if self.max_distance < BANDS:
+            conditions = ' OR '.join(f"band{i} = ?" for i in range(BANDS))
+            return self._conn.execute(
+                f"SELECT id, phash, result FROM ai_result_cache "
+                f"WHERE prompt_key = ? AND created_at >= ? AND ({conditions})",
+                (prompt_key, min_created, *_bands(phash))).fetchall()
+        # 距离阈值过大时分段索引不再保证召回，退化为扫描该提示词下的全部条目
+        return self._conn.execute(
+            "SELECT id, phash, result FROM ai_result_cache WHERE prompt_key = ? AND created_at >= ?",
+            (prompt_key, min_created)).fetchall()
+
+    def get(self, phash, prompt_key, ttl_seconds=None):
+        now = time.time()
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        with self._lock:
+            best = None
+            for row_id, stored_hash, result in self._candidates(prompt_key, phash, now - ttl_seconds):
+                distance = bin(_to_unsigned(stored_hash) ^ phash).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, row_id, result)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE ai_result_cache SET last_used = ?, hits = hits + 1 WHERE id = ?",
+                               (now, best[1]))
+            self._conn.commit()
+            return best[2]
+
+    def put(self, phash, prompt_key, result):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ai_result_cache (prompt_key, phash, band0, band1, band2, band3, result, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (prompt_key, _to_signed(phash), *_bands(phash), result, now, now))
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM ai_result_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM ai_result_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM ai_result_cache WHERE id IN "
+                "(SELECT id FROM ai_result_cache ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_result_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM ai_result_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache(max_distance=3, ttl_seconds=3600, max_entries=5000):
+    """返回进程内共享的结果缓存；参数与现有缓存不同时更新其阈值，已有条目保留。"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(CACHE_DB_PATH, max_distance, ttl_seconds, max_entries)
+        elif (_cache.max_distance, _cache.ttl_seconds, _cache.max_entries) != (max_distance, ttl_seconds, max_entries):
+            _cache.configure(max_distance, ttl_seconds, max_entries)
+        return _cache
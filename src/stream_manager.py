@@ -2,181 +2,307 @@ import multiprocessing
 import time
 import logging
 import json
-from src.stream_receiver import process_stream
-from src.ai_interface import send_image_to_ai
-from src.utils import save_frame, generate_filename, encode_image
-import requests
-from src.db_handler import save_analysis_result, save_person_features, get_person_features
-from datetime import datetime
+from src.utils import generate_filename
+from src.reid_handler import get_reid_store
+from src.db_writer import get_db_writer
 import threading
-import queue
-import cv2
-
-def stream_worker(stream_id, url, status_dict, stop_event, frame_queue, prompt_type='safety'):
-    cap = cv2.VideoCapture(url)
-    if not cap.isOpened():
-        status_dict[stream_id] = 'error'
-        logging.error(f"Failed to open stream {url}")
-        return
+import atexit
+from src.analysis_scheduler import AnalysisScheduler
+from src.motion_gate import MotionGate
+from src.capture import DEFAULT_CAPTURE_OPTIONS, CapturePool, stream_worker
+from src.stream_supervisor import StreamSupervisor
+from src.metrics import registry
+from src import tracing
 
-    while not stop_event.is_set():
-        try:
-            status_dict[stream_id] = 'streaming'
-            ret, frame = cap.read()
-            if not ret:
-                status_dict[stream_id] = 'error'
-                logging.warning(f"Failed to read frame from stream {url}")
-                time.sleep(1)  # 等待1秒后重试
-                continue
-            
-            # 更新最新帧
-            try:
-                frame_queue.put(frame, block=False)
-            except queue.Full:
-                try:
-                    frame_queue.get_nowait()
-                    frame_queue.put(frame, block=False)
-                except queue.Empty:
-                    pass
-            
-            time.sleep(0.01)  # 减少睡眠时间，提高帧率
-        
-        except Exception as e:
-            status_dict[stream_id] = 'error'
-            logging.error(f"Error in stream worker for {url}: {str(e)}")
-            time.sleep(1)  # 出错后等待1秒再重试
-        
-        if stop_event.is_set():
-            break
+CAPTURE_GRABBED = registry.counter('capture_frames_grabbed_total', 'Frames read from the stream by the capture worker', ('stream',))
+CAPTURE_DECODED = registry.counter('capture_frames_decoded_total', 'Frames retrieved and published to the frame buffer', ('stream',))
+CAPTURE_FAILURES = registry.counter('capture_read_failures_total', 'Failed frame reads', ('stream',))
+CAPTURE_FPS = registry.gauge('capture_fps', 'Frames read per second since the previous scrape', ('stream',))
+CAPTURE_HEARTBEAT_AGE = registry.gauge('capture_heartbeat_age_seconds', 'Seconds since the last successful frame read', ('stream',))
+STREAM_UP = registry.gauge('stream_up', '1 if the capture worker reports streaming', ('stream',))
+STREAM_RESTARTS = registry.counter('stream_restarts_total', 'Capture restarts by the supervisor', ('stream',))
+MOTION_FRAMES = registry.counter('analysis_motion_frames_total', 'Frames checked by the motion gate', ('stream', 'result'))
+SCHEDULER_JOBS = registry.counter('analysis_jobs_total', 'Analysis scheduler jobs', ('event',))
+SCHEDULER_PENDING = registry.gauge('analysis_jobs_pending', 'Analysis jobs waiting for a worker')
 
-    cap.release()
-    status_dict[stream_id] = 'stopped'
+def encode_frame(frame, stream_id):
+    # 在内存中按模型的编码参数缩放、裁剪并编码，不再经过磁盘
+    from src.ai_interface import load_ai_config
+    from src.frame_encoder import get_frame_encoder
+    encoder = get_frame_encoder(stream_manager.ai_model, load_ai_config())
+    return encoder.encode_base64(frame, stream_manager.stream_rois.get(stream_id))
 
 def analyze_frame(frame, source_info, stream_id, prompt_type='safety'):
+    # requests、OpenCV 等较重的依赖在第一次分析时才导入，加快界面启动
+    from src.ai_interface import send_image_to_ai
     try:
-        filename = generate_filename()
-        save_frame(frame, f"logs/{filename}")
-        base64_image = encode_image(f"logs/{filename}")
+        filename = generate_filename()  # 仅用于在日志中标识本帧
+        with tracing.span('encode', stream_id):
+            base64_image = encode_frame(frame, stream_id)
         
-        # 获取数据库中的人员特征数据
-        reid_data = get_person_features()
+        # 只取该视频流最近出现的人员特征，其余由 ReID 存储在内存中维护
+        reid_data = get_reid_store().get_recent(stream_id)
         
-        max_retries = 3
-        for attempt in range(max_retries):
+        with tracing.span('ai', stream_id):
             analysis_result = send_image_to_ai(base64_image, prompt_type, reid_data, 
                                                stream_manager.ai_model, 
                                                stream_manager.api_key, 
-                                               stream_manager.api_base)
-            
-            if analysis_result is not None:
-                break
-            
-            if attempt < max_retries - 1:
-                logging.warning(f"Retrying analysis for {filename} (Attempt {attempt + 2}/{max_retries})")
-                time.sleep(5)  # 等待5秒后重试
-        
-        if analysis_result is None:
-            logging.error(f"Failed to get analysis result for {filename} from {source_info} after {max_retries} attempts")
-            return
+                                               stream_manager.api_base,
+                                               stream_id=stream_id,
+                                               on_alert=lambda alert_stream_id, elapsed:
+                                                   stream_manager.notify_alert(alert_stream_id, source_info, elapsed))
+        handle_analysis_result(analysis_result, filename, source_info, stream_id, prompt_type)
+    except Exception as e:
+        logging.error(f"Error analyzing frame from {source_info}: {str(e)}")
+
+def analyze_frames(jobs, prompt_type='safety'):
+    """把多路视频流的帧放进一个多图请求分析，jobs 为 [(frame, source_info, stream_id)]。"""
+    from src.ai_interface import send_images_batch_to_ai
+    reid_store = get_reid_store()
+    images, encoded = [], []
+    for frame, source_info, stream_id in jobs:
+        try:
+            with tracing.span('encode', stream_id):
+                base64_image = encode_frame(frame, stream_id)
+            images.append((base64_image, reid_store.get_recent(stream_id), stream_id))
+            encoded.append((generate_filename(), source_info, stream_id))
+        except Exception as e:
+            logging.error(f"Error encoding frame from {source_info}: {str(e)}")
+    if not images:
+        return
+    sources = {stream_id: source_info for _, source_info, stream_id in encoded}
+    try:
+        with tracing.span('ai'):
+            results = send_images_batch_to_ai(images, prompt_type, stream_manager.ai_model,
+                                              stream_manager.api_key, stream_manager.api_base,
+                                              on_alert=lambda stream_id, elapsed:
+                                                  stream_manager.notify_alert(stream_id, sources.get(stream_id), elapsed))
+    except Exception as e:
+        logging.error(f"Error analyzing frames from {len(images)} streams: {str(e)}")
+        return
+    for (filename, source_info, stream_id), analysis_result in zip(encoded, results):
+        try:
+            handle_analysis_result(analysis_result, filename, source_info, stream_id, prompt_type)
+        except Exception as e:
+            logging.error(f"Error handling analysis result from {source_info}: {str(e)}")
+
+def handle_analysis_result(analysis_result, filename, source_info, stream_id, prompt_type='safety'):
+    """解析模型回复，更新 ReID 数据并把结果交给后台写线程入库。"""
+    from src.ai_interface import parse_analysis_result
+    if analysis_result is None:
+        logging.error(f"Failed to get analysis result for {filename} from {source_info}")
+        return
+    with tracing.span('parse', stream_id):
+        analysis_result = parse_analysis_result(analysis_result)
 
-        # 更新 ReID 数据
+        # 更新 ReID 数据（内存索引立即生效，写库交给后台写线程）
         if isinstance(analysis_result, dict) and 'people' in analysis_result:
-            for person in analysis_result['people']:
-                if 'id' in person:
-                    person_data = {
-                        'id': person['id'],
-                        'features': person.get('features', ''),
-                        'position': person.get('position', ''),
-                        'action': person.get('action', ''),
-                        'last_seen': datetime.now().isoformat()
-                    }
-                    save_person_features(person_data)
-        
-        # 处理车辆数据（如果需要保存到数据库，可以添加相应的函数）
-        if isinstance(analysis_result, dict) and 'vehicles' in analysis_result:
-            for vehicle in analysis_result['vehicles']:
-                # 这里可以添加保存车辆信息到数据库的逻辑
-                pass
-        
-        logging.info(f"Analysis result for {filename} from {source_info}: {json.dumps(analysis_result, ensure_ascii=False)}")
-        
-        if prompt_type == 'safety':
-            if isinstance(analysis_result, dict):
-                if analysis_result.get('violation_detected'):
-                    violation_message = f"安全违规警告：在 {filename} 中检测到违规行，来自 {source_info}。描述：{analysis_result.get('description', '无描述')}"
-                    logging.info(violation_message)
-                else:
-                    logging.info(f"No safety violation detected in {filename} from {source_info}")
-                
-                # 保存分析结果到数据库
-                save_analysis_result(stream_id, analysis_result)
-        else:
-            logging.info(f"Analysis result for {filename} from {source_info}: {analysis_result}")
+            get_reid_store().update(stream_id, analysis_result['people'])
+    db_writer = get_db_writer()
     
-    except Exception as e:
-        logging.error(f"Error analyzing frame from {source_info}: {str(e)}")
+    # 处理车辆数据（如果需要保存到数据库，可以添加相应的函数）
+    if isinstance(analysis_result, dict) and 'vehicles' in analysis_result:
+        for vehicle in analysis_result['vehicles']:
+            # 这里可以添加保存车辆信息到数据库的逻辑
+            pass
+    
+    logging.info(f"Analysis result for {filename} from {source_info}: {json.dumps(analysis_result, ensure_ascii=False)}")
+    
+    if prompt_type == 'safety':
+        if isinstance(analysis_result, dict):
+            if analysis_result.get('violation_detected'):
+                violation_message = f"安全违规警告：在 {filename} 中检测到违规行，来自 {source_info}。描述：{analysis_result.get('description', '无描述')}"
+                logging.info(violation_message)
+            else:
+                logging.info(f"No safety violation detected in {filename} from {source_info}")
+            # 保存分析结果到数据库
+            db_writer.save_analysis_result(stream_id, analysis_result)
+    else:
+        logging.info(f"Analysis result for {filename} from {source_info}: {analysis_result}")
 
 class StreamManager:
     def __init__(self):
         self.streams = {}  # 存储 stream_id: {'url': url, 'prompt_template': prompt_template}
-        self.processes = {}  # 存储 stream_id: Process
+        self.processes = {}  # 存储 stream_id: Process（capture_backend 为 "process" 时）
+        self.capture_backend = 'process'  # "process": 每路流一个进程；"pooled": 固定数量进程，每路流一个线程
+        self.capture_pool = CapturePool()
+        self.supervisor = StreamSupervisor(self)  # 重启退出或卡住的采集
+        self._capture_lock = threading.RLock()  # 监督线程与界面线程同时启停采集时互斥
         self.manager = None
         self.stream_statuses = None
         self.stop_event = None
         self.analysis_interval = 10  # 将默认分析间隔改为10秒
-        self.frame_queues = {}  # 存储 stream_id: Queue
+        self.frame_buffers = {}  # 存储 stream_id: SharedFrameBuffer
+        self.frame_buffer_size = (1920, 1080)  # 超过该分辨率的帧会在采集进程中缩小
+        self.frame_buffer_slots = 3
+        self.preview_size = (320, 240)  # 预览缩略图的最大尺寸，新建帧缓冲区时生效
+        self.analysis_workers = 4  # 分析线程池大小
+        self.motion_gate = MotionGate()  # 画面无明显变化时跳过分析
+        self.stream_rois = {}  # stream_id: (x, y, w, h)，按画面比例裁剪后再发送分析
+        self.capture_options = dict(DEFAULT_CAPTURE_OPTIONS)  # 新启动的采集进程生效
+        self.tracer = tracing.get_tracer()  # 每帧从采集到入库的各阶段耗时
+        self.scheduler = AnalysisScheduler(self._analyze_stream_frame, self._get_analysis_frame,
+                                           self.analysis_workers, self.analysis_interval,
+                                           self._analyze_stream_frames, tracer=self.tracer)
         self.ai_model = None
         self.api_key = None
         self.api_base = None
         self.logger = logging.getLogger(__name__)
+        self._fps_samples = {}  # stream_id: (time.monotonic(), grabbed)，用于计算 capture_fps
+        self.alert_listeners = []  # callback(stream_id, source_info, elapsed)，流式回复中发现违规时调用
+        registry.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        # 采集进程的计数保存在共享内存中，导出时同步到本进程的指标
+        now = time.monotonic()
+        statuses = self.get_stream_statuses()
+        supervisor_restarts = self.supervisor.stats()['restarts']
+        motion_stats = self.motion_gate.stats()
+        for stream_id, frame_buffer in list(self.frame_buffers.items()):
+            try:
+                counters = frame_buffer.counters()
+                exited, last_heartbeat = frame_buffer.last_heartbeat
+            except TypeError:
+                continue  # 缓冲区刚被释放
+            CAPTURE_GRABBED.set(stream_id, value=counters['grabbed'])
+            CAPTURE_DECODED.set(stream_id, value=counters['decoded'])
+            CAPTURE_FAILURES.set(stream_id, value=counters['read_failures'])
+            previous = self._fps_samples.get(stream_id)
+            if previous is not None and now > previous[0]:
+                CAPTURE_FPS.set(stream_id, value=round(max(0, counters['grabbed'] - previous[1]) / (now - previous[0]), 2))
+            self._fps_samples[stream_id] = (now, counters['grabbed'])
+            if last_heartbeat is not None and not exited:
+                CAPTURE_HEARTBEAT_AGE.set(stream_id, value=round(time.time() - last_heartbeat, 3))
+            STREAM_UP.set(stream_id, value=1 if statuses.get(stream_id) == 'streaming' else 0)
+            STREAM_RESTARTS.set(stream_id, value=supervisor_restarts.get(stream_id, 0))
+        for stream_id, stats in motion_stats.items():
+            MOTION_FRAMES.set(stream_id, 'sent', value=stats['sent'])
+            MOTION_FRAMES.set(stream_id, 'skipped', value=stats['skipped'])
+        scheduler_stats = self.scheduler.stats()
+        SCHEDULER_JOBS.set('submitted', value=scheduler_stats['submitted'])
+        SCHEDULER_JOBS.set('replaced', value=scheduler_stats['replaced'])
+        SCHEDULER_JOBS.set('completed', value=scheduler_stats['completed'])
+        SCHEDULER_JOBS.set('batched', value=scheduler_stats['batches'])
+        SCHEDULER_PENDING.set(value=scheduler_stats['pending'])
+
+    def _forget_stream_metrics(self, stream_id):
+        self._fps_samples.pop(stream_id, None)
+        for metric in (CAPTURE_GRABBED, CAPTURE_DECODED, CAPTURE_FAILURES, CAPTURE_FPS, CAPTURE_HEARTBEAT_AGE,
+                       STREAM_UP, STREAM_RESTARTS):
+            metric.remove(stream_id)
+        for result in ('sent', 'skipped'):
+            MOTION_FRAMES.remove(stream_id, result)
 
     def initialize(self):
-        self.manager = multiprocessing.Manager()
-        self.stream_statuses = self.manager.dict()
+        # Manager 服务进程推迟到第一次启动采集时创建，见 _ensure_manager
         self.stop_event = multiprocessing.Event()
+        atexit.register(self.release_frame_buffers)
+
+    def _ensure_manager(self):
+        if self.manager is None:
+            self.manager = multiprocessing.Manager()
+            self.stream_statuses = self.manager.dict()
 
-    def add_stream(self, stream_id, url, prompt_template='DEFAULT_PROMPT_TEMPLATE'):
+    def add_stream(self, stream_id, url, prompt_template='DEFAULT_PROMPT_TEMPLATE', analysis_interval=None):
         self.streams[stream_id] = {
             'url': url, 
-            'prompt_template': prompt_template
+            'prompt_template': prompt_template,
+            'analysis_interval': analysis_interval  # None 表示使用全局分析间隔
         }
-        self.frame_queues[stream_id] = self.manager.Queue(maxsize=5)  # 增加队列大小
+        self.scheduler.add_stream(stream_id, analysis_interval)
         self.logger.info(f"Added stream: ID: {stream_id}, URL: {url}")
         return True
 
+    def _terminate_process(self, stream_id):
+        process = self.processes.pop(stream_id, None)
+        if isinstance(process, multiprocessing.Process):
+            process.terminate()
+            process.join(timeout=5)  # 给予5秒的时间让进程正常退出
+            if process.is_alive():
+                process.kill()  # 如果进程仍然存活，强制终止
+
     def remove_stream(self, stream_id):
+        with self._capture_lock:
+            self._remove_stream(stream_id)
+
+    def _remove_stream(self, stream_id):
         if stream_id in self.streams:
-            if stream_id in self.processes:
-                process = self.processes[stream_id]
-                if isinstance(process, multiprocessing.Process):
-                    process.terminate()
-                    process.join(timeout=5)  # 给予5秒的时间让进程正常退出
-                    if process.is_alive():
-                        process.kill()  # 如果进程仍然存活，强制终止
-                del self.processes[stream_id]
+            self.supervisor.forget(stream_id)
+            self._forget_stream_metrics(stream_id)
+            self._terminate_process(stream_id)
+            self.capture_pool.remove_stream(stream_id)
             del self.streams[stream_id]
-            if stream_id in self.stream_statuses:
+            self.scheduler.remove_stream(stream_id)
+            self.motion_gate.reset(stream_id)
+            if self.stream_statuses is not None and stream_id in self.stream_statuses:
                 del self.stream_statuses[stream_id]
-            if stream_id in self.frame_queues:
-                del self.frame_queues[stream_id]
+            if stream_id in self.frame_buffers:
+                self._release_frame_buffer(stream_id)
             logging.info(f"Removed stream for ID: {stream_id}")
         else:
             logging.warning(f"Stream {stream_id} not found in manager")
 
     def start_all_streams(self):
-        self.stop_event.clear()  # 确保stop_event被清除
-        for stream_id, stream_info in self.streams.items():
-            if stream_id not in self.processes or not self.processes[stream_id].is_alive():
-                self.frame_queues[stream_id] = self.manager.Queue(maxsize=1)
-                process = multiprocessing.Process(target=stream_worker, 
-                                                  args=(stream_id, stream_info['url'], self.stream_statuses, 
-                                                        self.stop_event, self.frame_queues[stream_id]))
-                process.start()
-                self.processes[stream_id] = process
-                logging.info(f"Started stream process for ID: {stream_id}, URL: {stream_info['url']}")
+        with self._capture_lock:
+            self._ensure_manager()
+            self.stop_event.clear()  # 确保stop_event被清除
+            if self.capture_backend == 'pooled':
+                self._start_pooled_streams()
+            else:
+                for stream_id, stream_info in self.streams.items():
+                    if stream_id not in self.processes or not self.processes[stream_id].is_alive():
+                        self._start_stream_process(stream_id, stream_info)
+            for stream_id in self.streams:
+                self.supervisor.started(stream_id)
+            self.supervisor.start()
         logging.info(f"Started all streams: {len(self.streams)} streams")
 
+    def restart_stream(self, stream_id):
+        """重启一路视频流的采集（由 StreamSupervisor 调用）。"""
+        with self._capture_lock:
+            stream_info = self.streams.get(stream_id)
+            if stream_info is None or self.stop_event.is_set():
+                return
+            # 先刷新心跳，避免新采集启动前被再次判定为已退出
+            self._get_frame_buffer(stream_id).heartbeat()
+            if self.capture_backend == 'pooled':
+                self.capture_pool.ensure_worker(stream_id, self.stream_statuses, self.stop_event)
+                self.capture_pool.add_stream(stream_id, stream_info['url'], self.frame_buffers[stream_id],
+                                             self.capture_options)
+            else:
+                self._terminate_process(stream_id)
+                self._start_stream_process(stream_id, stream_info)
+            logging.info(f"Restarted capture for stream {stream_id}")
+
+    def is_capture_alive(self, stream_id):
+        if self.capture_backend == 'pooled':
+            return self.capture_pool.is_running(stream_id)
+        process = self.processes.get(stream_id)
+        return process is not None and process.is_alive()
+
+    def _start_stream_process(self, stream_id, stream_info):
+        frame_buffer = self._get_frame_buffer(stream_id)
+        process = multiprocessing.Process(target=stream_worker, 
+                                          args=(stream_id, stream_info['url'], self.stream_statuses, 
+                                                self.stop_event, frame_buffer,
+                                                stream_info['prompt_template'], self.capture_options))
+        process.start()
+        self.processes[stream_id] = process
+        logging.info(f"Started stream process for ID: {stream_id}, URL: {stream_info['url']}")
+
+    def _start_pooled_streams(self):
+        # 先创建共享内存再启动采集池，使 fork 出的进程与主进程共用同一个 resource_tracker，
+        # 否则采集进程退出时其自己的 tracker 会把仍在使用的共享内存删除
+        frame_buffers = {stream_id: self._get_frame_buffer(stream_id) for stream_id in self.streams}
+        self.capture_pool.start(self.stream_statuses, self.stop_event)
+        for stream_id, stream_info in self.streams.items():
+            if not self.capture_pool.is_running(stream_id):
+                self.capture_pool.add_stream(stream_id, stream_info['url'], frame_buffers[stream_id],
+                                             self.capture_options)
+                logging.info(f"Started pooled capture for ID: {stream_id}, URL: {stream_info['url']}")
+
     def stop_all_streams(self):
+        self.supervisor.stop()
         self.stop_event.set()
         stop_thread = threading.Thread(target=self._stop_all_streams_thread)
         stop_thread.start()
@@ -194,15 +320,31 @@ class StreamManager:
                         logging.error(f"Failed to terminate stream {stream_id}, killing...")
                         process.kill()
         self.processes.clear()
-        for queue in self.frame_queues.values():
-            while not queue.empty():
-                try:
-                    queue.get_nowait()
-                except queue.Empty:
-                    pass
+        self.capture_pool.stop()
+        # 确保分析结果和人员特征全部落库
+        if not get_db_writer().flush(timeout=10):
+            logging.warning("Timed out flushing pending database writes")
         self.stop_event.clear()
         logging.info("Stopped all streams")
 
+    def _get_frame_buffer(self, stream_id):
+        if stream_id not in self.frame_buffers:
+            from src.frame_buffer import SharedFrameBuffer
+            max_width, max_height = self.frame_buffer_size
+            self.frame_buffers[stream_id] = SharedFrameBuffer(max_width, max_height,
+                                                              slots=self.frame_buffer_slots,
+                                                              preview_size=self.preview_size)
+        return self.frame_buffers[stream_id]
+
+    def _release_frame_buffer(self, stream_id):
+        frame_buffer = self.frame_buffers.pop(stream_id)
+        frame_buffer.close()
+        frame_buffer.unlink()
+
+    def release_frame_buffers(self):
+        for stream_id in list(self.frame_buffers):
+            self._release_frame_buffer(stream_id)
+
     def get_stream_statuses(self):
         return dict(self.stream_statuses) if self.stream_statuses else {}
 
@@ -211,31 +353,209 @@ class StreamManager:
 
     def set_analysis_interval(self, interval):
         self.analysis_interval = interval
+        self.scheduler.default_interval = interval
         logging.info(f"Analysis interval set to {interval} seconds")
 
+    def set_stream_analysis_interval(self, stream_id, interval):
+        if stream_id not in self.streams:
+            self.logger.warning(f"Stream {stream_id} not found in manager")
+            return
+        self.streams[stream_id]['analysis_interval'] = interval
+        self.scheduler.set_interval(stream_id, interval)
+        logging.info(f"Analysis interval for stream {stream_id} set to {interval} seconds")
+
+    def configure(self, settings):
+        """应用 settings.json 中与采集和分析相关的配置。"""
+        self.set_analysis_interval(settings.get('analysis_interval', self.analysis_interval))
+        self.set_analysis_workers(settings.get('analysis_workers', self.analysis_workers))
+        # 多图请求：每个请求最多 ai_batch_size 张图片，1 表示不合并
+        self.scheduler.batch_size = settings.get('ai_batch_size', self.scheduler.batch_size)
+        self.scheduler.batch_wait = settings.get('ai_batch_wait', self.scheduler.batch_wait)
+        # 单独配置的视频流参数，键为流 ID
+        for stream_id, interval in self._per_stream_settings(settings, 'stream_intervals').items():
+            if stream_id in self.streams:
+                self.set_stream_analysis_interval(stream_id, interval)
+        # 采集方式和池大小在下次 start_all_streams 时生效
+        self.capture_backend = settings.get('capture_backend', self.capture_backend)
+        self.capture_pool.size = settings.get('capture_pool_size', self.capture_pool.size)
+        self.supervisor.hang_timeout = settings.get('stream_hang_timeout', self.supervisor.hang_timeout)
+        self.supervisor.backoff_max = settings.get('reconnect_backoff_max', self.supervisor.backoff_max)
+        self.supervisor.max_restarts_per_minute = settings.get('max_restarts_per_minute',
+                                                               self.supervisor.max_restarts_per_minute)
+        self.preview_size = tuple(settings.get('preview_size', self.preview_size))
+        for key in DEFAULT_CAPTURE_OPTIONS:
+            if key in settings:
+                self.capture_options[key] = settings[key]
+        reid_store = get_reid_store()
+        reid_store.max_people = settings.get('reid_max_people', reid_store.max_people)
+        reid_store.ttl_seconds = settings.get('reid_ttl_seconds', reid_store.ttl_seconds)
+        self.motion_gate.threshold = settings.get('motion_threshold', self.motion_gate.threshold)
+        self.motion_gate.max_skip_seconds = settings.get('motion_max_skip_seconds', self.motion_gate.max_skip_seconds)
+        for stream_id, threshold in self._per_stream_settings(settings, 'stream_motion_thresholds').items():
+            self.motion_gate.set_threshold(stream_id, threshold)
+        self.stream_rois = {stream_id: tuple(roi) for stream_id, roi
+                            in self._per_stream_settings(settings, 'stream_rois').items() if roi}
+        # 保留最近 trace_capacity 帧的延迟追踪，0 表示关闭
+        self.tracer.set_capacity(settings.get('trace_capacity', self.tracer.capacity))
+
+    def _per_stream_settings(self, settings, key):
+        # settings.json 中按流配置的项，键为流 ID 字符串；无法解析的键跳过，不影响其余配置
+        values = {}
+        for stream_id, value in settings.get(key, {}).items():
+            try:
+                values[int(stream_id)] = value
+            except (TypeError, ValueError):
+                self.logger.warning(f"Ignoring {key} entry with invalid stream ID {stream_id!r}")
+        return values
+
+    def get_motion_stats(self):
+        return self.motion_gate.stats()
+
+    def set_analysis_workers(self, workers):
+        # 新的线程池大小在下次 start_analysis 时生效
+        self.analysis_workers = workers
+        self.scheduler.max_workers = workers
+
+    def start_analysis(self, handler=None, batch_handler=None):
+        """按各流的分析间隔定时取帧并交给分析线程池，handler(stream_id, frame) 默认为 analyze_frame。
+
+        ai_batch_size 大于 1 时同时到期的多路流交给 batch_handler([(stream_id, frame), ...])；
+        只传入 handler 时不做多图请求。
+        """
+        self.scheduler.handler = handler or self._analyze_stream_frame
+        self.scheduler.batch_handler = batch_handler or (self._analyze_stream_frames if handler is None else None)
+        self.scheduler.start()
+        logging.info(f"Started analysis scheduler with {self.analysis_workers} workers")
+
+    def stop_analysis(self):
+        self.scheduler.stop()
+        logging.info("Stopped analysis scheduler")
+
+    def _get_analysis_frame(self, stream_id):
+        # 复制时校验序号，采集进程在复制期间覆盖该槽位时丢弃（任务会在线程池中排队，不能持有共享内存视图）
+        # grab 模式下帧按 retrieve_fps 更新；过旧（例如 retrieve_fps 为 0）时请求新帧，只短暂等待以免拖慢其他流
+        frame = self.get_latest_frame(stream_id, copy=True, max_age=2.0, wait=0.2)
+        if frame is None:
+            return None
+        with tracing.span('motion_gate', stream_id):
+            if not self.motion_gate.check(stream_id, frame):
+                return None
+            return frame
+
+    def _analyze_stream_frame(self, stream_id, frame):
+        stream_info = self.streams.get(stream_id)
+        if stream_info is None:
+            return
+        source_info = f"Stream: {stream_info['url']}"
+        analyze_frame(frame, source_info, stream_id, stream_info['prompt_template'])
+
+    def _analyze_stream_frames(self, jobs):
+        # 只有使用相同提示词模板的流才能合并到一个请求中
+        groups = {}
+        for stream_id, frame in jobs:
+            stream_info = self.streams.get(stream_id)
+            if stream_info is not None:
+                groups.setdefault(stream_info['prompt_template'], []).append(
+                    (frame, f"Stream: {stream_info['url']}", stream_id))
+        for prompt_template, group in groups.items():
+            if len(group) == 1:
+                analyze_frame(*group[0], prompt_template)
+            else:
+                analyze_frames(group, prompt_template)
+
+    def add_alert_listener(self, callback):
+        if callback not in self.alert_listeners:
+            self.alert_listeners.append(callback)
+
+    def notify_alert(self, stream_id, source_info, elapsed):
+        # 在 AI 请求线程中调用，此时完整结果尚未返回
+        logging.warning(f"安全违规提前告警：{source_info}（分析开始后 {elapsed:.2f} 秒）")
+        for callback in list(self.alert_listeners):
+            try:
+                callback(stream_id, source_info, elapsed)
+            except Exception as e:
+                self.logger.error(f"Alert listener failed: {str(e)}")
+
     def analyze_camera_frame(self, frame):
         analyze_frame(frame, "Local Camera", "local_camera")
 
-    def get_latest_frame(self, stream_id):
+    def get_latest_frame(self, stream_id, copy=False, max_age=None, wait=0.5):
+        # 默认返回共享内存中的零拷贝视图，跨线程长时间持有时需传 copy=True
+        # max_age（秒）：最新帧比这更旧时请求采集进程解码新帧，最多等待 wait 秒
         if stream_id not in self.streams:
             self.logger.error(f"Stream ID {stream_id} not found")
             return None
 
-        if stream_id not in self.frame_queues:
-            self.logger.error(f"Frame queue for stream ID {stream_id} not found")
+        if stream_id not in self.frame_buffers:
+            # 采集尚未启动（或已停止）的流，定时分析每轮都会走到这里
+            self.logger.debug(f"Frame buffer for stream ID {stream_id} not found")
             return None
 
-        try:
-            return self.frame_queues[stream_id].get(block=False)
-        except queue.Empty:
+        frame_buffer = self.frame_buffers[stream_id]
+        latest = frame_buffer.read_latest(copy=copy)
+        if max_age is not None and (latest is None or time.time() - latest[2] > max_age):
+            frame_buffer.request_frame()
+            if frame_buffer.wait_for_frame(latest[0] if latest else 0, wait):
+                latest = frame_buffer.read_latest(copy=copy)
+        if latest is None:
             return None
+        trace = tracing.current_trace(stream_id)
+        if trace is not None:
+            self._trace_frame_read(trace, frame_buffer, *latest)
+        return latest[1]
+
+    def _trace_frame_read(self, trace, frame_buffer, seq, frame, published_at):
+        # 采集进程记录的读取和发布时间：retrieve 为解码后的拷贝和写入，buffer 为帧在共享内存中等待的时间
+        grabbed_at = frame_buffer.grab_time(seq)
+        trace.captured_at = grabbed_at or published_at
+        if grabbed_at:
+            trace.add_span('retrieve', grabbed_at, published_at)
+        trace.add_span('buffer', published_at, time.time())
+
+    def request_frame(self, stream_id):
+        # grab 模式下采集进程只在有人请求时解码，预览需要持续请求
+        frame_buffer = self.frame_buffers.get(stream_id)
+        if frame_buffer is not None:
+            frame_buffer.request_frame()
+
+    def get_preview(self, stream_id, after_seq=0, wait=0.5):
+        """请求并等待比 after_seq 新的预览缩略图，返回 (seq, RGB 数组)；wait 秒内没有新图时返回 None。
+
+        缩略图由采集进程缩小和转换颜色，按 preview_fps 限制频率，调用方不需要自己节流。
+        """
+        frame_buffer = self.frame_buffers.get(stream_id)
+        if frame_buffer is None:
+            return None
+        frame_buffer.request_preview()
+        if not frame_buffer.wait_for_preview(after_seq, wait):
+            return None
+        return frame_buffer.read_preview()
+
+    def request_previews(self, stream_ids):
+        for stream_id in stream_ids:
+            frame_buffer = self.frame_buffers.get(stream_id)
+            if frame_buffer is not None:
+                frame_buffer.request_preview()
+
+    def read_previews(self, last_seqs):
+        """不等待地读取多路流的新缩略图：last_seqs 为 {stream_id: 已显示的序号}，只返回有新图的流 {stream_id: (seq, RGB 数组)}。"""
+        previews = {}
+        for stream_id, last_seq in last_seqs.items():
+            frame_buffer = self.frame_buffers.get(stream_id)
+            if frame_buffer is None or frame_buffer.preview_seq <= last_seq:
+                continue
+            preview = frame_buffer.read_preview()
+            if preview is not None:
+                previews[stream_id] = preview
+        return previews
 
     def analyze_frame(self, stream_id):
-        frame = self.get_latest_frame(stream_id)
+        # 立即分析一帧（不经过变化检测）：交给分析线程池，若该流已有待处理任务则替换之
+        trace = self.tracer.start(stream_id)
+        with tracing.activate([trace]):
+            frame = self.get_latest_frame(stream_id, copy=True, max_age=1.0)
         if frame is not None:
-            source_info = f"Stream: {self.streams[stream_id]['url']}"
-            prompt_template = self.streams[stream_id]['prompt_template']
-            threading.Thread(target=analyze_frame, args=(frame, source_info, stream_id, prompt_template)).start()
+            self.scheduler.submit(stream_id, frame, trace=trace)
         else:
             self.logger.error(f"Failed to get frame for analysis from stream {stream_id}")
 
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import deque
+from src.backoff import Backoff
+
+
+class StreamSupervisor:
+    """监督采集进程/线程，重启退出或卡住的采集。
+
+    判定依据：进程已退出（process 模式）、采集已退出（缓冲区心跳为 -1），或心跳超过
+    hang_timeout 秒未更新（例如卡在网络读取中）。重启按每路流各自的指数退避（带抖动）
+    延后执行，并且全局每分钟最多重启 max_restarts_per_minute 次，超出的顺延到下一轮，
+    避免大量摄像头同时掉线时集中重连。连续正常运行 stable_seconds 秒后退避清零。
+    """
+
+    def __init__(self, manager, check_interval=1.0, hang_timeout=30, startup_timeout=30,
+                 backoff_base=1.0, backoff_max=60.0, max_restarts_per_minute=30, stable_seconds=60):
+        self.manager = manager
+        self.check_interval = check_interval
+        self.hang_timeout = hang_timeout
+        self.startup_timeout = startup_timeout  # 打开 RTSP 流可能很慢，启动后这段时间内不判定卡住
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_restarts_per_minute = max_restarts_per_minute
+        self.stable_seconds = stable_seconds
+        self.logger = logging.getLogger(__name__)
+        self._state = {}  # stream_id: {'backoff', 'started', 'restart_at'}
+        self._restart_counts = {}  # stream_id: 累计重启次数，stop() 后保留，导出的计数器不会回退
+        self._restart_times = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.total_restarts = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='stream-supervisor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(5)
+        with self._lock:
+            self._state.clear()
+
+    def started(self, stream_id):
+        # 由 StreamManager 在启动或重启采集后调用
+        with self._lock:
+            state = self._get_state(stream_id)
+            state['started'] = time.monotonic()
+            state['restart_at'] = None
+
+    def forget(self, stream_id):
+        with self._lock:
+            self._state.pop(stream_id, None)
+            self._restart_counts.pop(stream_id, None)
+
+    def _get_state(self, stream_id):
+        state = self._state.get(stream_id)
+        if state is None:
+            state = self._state[stream_id] = {
+                'backoff': Backoff(self.backoff_base, self.backoff_max),
+                'started': time.monotonic(),
+                'restart_at': None,
+            }
+        return state
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Stream supervisor check failed: {str(e)}")
+
+    def check(self):
+        now = time.monotonic()
+        wall_now = time.time()
+        due = []
+        with self._lock:
+            for stream_id in list(self.manager.streams):
+                state = self._get_state(stream_id)
+                if state['restart_at'] is not None:
+                    if now >= state['restart_at']:
+                        due.append((state['restart_at'], stream_id))
+                    continue
+                reason = self._unhealthy_reason(stream_id, state, now, wall_now)
+                if reason is None:
+                    if now - state['started'] >= self.stable_seconds:
+                        state['backoff'].reset()
+                    continue
+                delay = state['backoff'].next_delay()
+                state['restart_at'] = now + delay
+                self.logger.warning(f"Stream {stream_id} {reason}, restarting in {delay:.1f}s")
+
+            # 全局重启速率限制：按到期先后重启，超出配额的留到下一轮
+            while self._restart_times and now - self._restart_times[0] > 60:
+                self._restart_times.popleft()
+            budget = max(0, self.max_restarts_per_minute - len(self._restart_times))
+            due.sort()
+            due = [stream_id for _, stream_id in due[:budget]]
+            for stream_id in due:
+                self._restart_times.append(now)
+
+        for stream_id in due:
+            if self._stop_event.is_set():
+                return
+            try:
+                self.manager.restart_stream(stream_id)
+            except Exception as e:
+                self.logger.error(f"Failed to restart stream {stream_id}: {str(e)}")
+            with self._lock:
+                state = self._state.get(stream_id)
+                if state is not None:
+                    state['started'] = time.monotonic()
+                    state['restart_at'] = None
+                    self._restart_counts[stream_id] = self._restart_counts.get(stream_id, 0) + 1
+                self.total_restarts += 1
+
+    def _unhealthy_reason(self, stream_id, state, now, wall_now):
+        if not self.manager.is_capture_alive(stream_id):
+            return "capture process exited"
+        frame_buffer = self.manager.frame_buffers.get(stream_id)
+        if frame_buffer is None:
+            return None
+        exited, last_heartbeat = frame_buffer.last_heartbeat
+        if exited:
+            return "capture exited"
+        if now - state['started'] < self.startup_timeout:
+            return None
+        if last_heartbeat is None or wall_now - last_heartbeat > self.hang_timeout:
+            return f"has no frames for more than {self.hang_timeout}s"
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'total_restarts': self.total_restarts,
+                'pending_restarts': sum(1 for state in self._state.values() if state['restart_at'] is not None),
+                'restarts': dict(self._restart_counts),
+            }
@@ -0,0 +1,188 @@
+import json
+import logging
+
+# 出现即判定为违规的字段：与 db_handler.extract_result_fields 的规则一致
+VIOLATION_KEY = 'violation_detected'
+HAZARD_KEY = '安全隐患'
+
+
+class _Container:
+    __slots__ = ('kind', 'key', 'expect', 'fields', 'hazard', 'count', 'position', 'pending')
+
+    def __init__(self, kind):
+        self.kind = kind  # 'obj' 或 'arr'
+        self.key = None  # 对象中当前的键
+        self.expect = 'key' if kind == 'obj' else 'value'
+        self.fields = {}  # 对象中已读完的字符串值（用于取 image_id）
+        self.hazard = False  # "安全隐患" 数组，出现第一个元素时告警
+        self.count = 0  # 数组中已出现的元素数
+        self.position = None  # 作为数组元素时的序号（从 1 开始）
+        self.pending = False  # 已发现违规，等待 image_id
+
+
+class ViolationDetector:
+    """增量扫描模型输出的 JSON 文本，在结果完整之前发现违规。
+
+    不构建完整的解析树，只跟踪嵌套层级和当前键：某个对象中出现 "violation_detected": true，
+    或 "安全隐患" 数组出现第一个元素时，调用 on_violation(image_id)。单图结果的 image_id 为 None；
+    多图结果中为外层对象的键（{"image_1": {...}}）或同一对象中的 "image_id" 字段；数组元素中
+    image_id 出现在违规字段之后时，等读到 image_id 再告警，对象结束仍没有时按数组位置取 image_N。
+    第一个 '{' 或 '[' 之前的文本（例如 ```json）会被忽略。每个 image_id 只触发一次。
+    """
+
+    def __init__(self, on_violation):
+        self.on_violation = on_violation
+        self.fired = set()
+        self._stack = []
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string_role = None  # 'key'、'field'（需要保留的值）或 None
+        self._buffer = []
+
+    def feed(self, text):
+        for ch in text:
+            if self._done:
+                return
+            if self._in_string:
+                self._feed_string(ch)
+                continue
+            if not self._stack:
+                if ch in '{[':
+                    self._stack.append(_Container('obj' if ch == '{' else 'arr'))
+                continue
+            if ch.isspace():
+                continue
+            top = self._stack[-1]
+            if top.hazard and ch != ']':
+                self._fire(len(self._stack) - 2)
+            top.hazard = False
+            if ch == '"':
+                self._in_string = True
+                if top.kind == 'obj' and top.expect == 'key':
+                    self._string_role = 'key'
+                else:
+                    self._on_value(top, ch)
+                    self._string_role = 'field' if top.kind == 'obj' and top.key == 'image_id' else None
+                self._buffer = []
+            elif ch in '{[':
+                self._on_value(top, ch)
+                container = _Container('obj' if ch == '{' else 'arr')
+                container.hazard = ch == '[' and top.kind == 'obj' and top.key == HAZARD_KEY
+                if top.kind == 'arr':
+                    container.position = top.count
+                self._stack.append(container)
+            elif ch in '}]':
+                container = self._stack.pop()
+                if container.pending:
+                    # 与 send_images_batch_to_ai_async 中的图片ID编号一致
+                    self._emit(f"image_{container.position}")
+                self._done = not self._stack
+            elif ch == ':':
+                top.expect = 'value'
+            elif ch == ',':
+                top.expect = 'key' if top.kind == 'obj' else 'value'
+            elif top.expect == 'value':
+                # true/false/null/数字的第一个字符
+                self._on_value(top, ch)
+
+    def _feed_string(self, ch):
+        if self._escape:
+            self._escape = False
+            self._buffer.append(ch)
+        elif ch == '\\':
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            top = self._stack[-1]
+            if self._string_role == 'key':
+                top.key = ''.join(self._buffer)
+                top.expect = 'colon'
+            elif self._string_role == 'field':
+                top.fields[top.key] = ''.join(self._buffer)
+                if top.pending:
+                    top.pending = False
+                    self._emit(top.fields[top.key])
+        elif self._string_role is not None:
+            self._buffer.append(ch)
+
+    def _on_value(self, top, ch):
+        top.expect = 'after'
+        if top.kind == 'arr':
+            top.count += 1
+        if top.kind == 'obj' and top.key == VIOLATION_KEY and ch == 't':
+            self._fire(len(self._stack) - 1)
+
+    def _fire(self, index):
+        # index 为违规字段所在对象在栈中的位置
+        container = self._stack[index]
+        image_id = container.fields.get('image_id')
+        if image_id is None and index > 0:
+            parent = self._stack[index - 1]
+            if parent.kind == 'arr':
+                container.pending = True
+                return
+            image_id = parent.key
+        self._emit(image_id)
+
+    def _emit(self, image_id):
+        if image_id in self.fired:
+            return
+        self.fired.add(image_id)
+        self.on_violation(image_id)
+
+
+class StreamingResponse:
+    """累积 SSE（text/event-stream）格式的 chat/completions 流式响应。
+
+    由请求引擎在请求线程中逐行调用 feed()；每次（重试）开始前调用 start() 清空已收到的内容。
+    收到 [DONE] 或带 finish_reason 的事件后 done 为 True，此前结束的流视为被截断。
+    on_alert(image_id) 在检测到违规时立即调用（在请求线程中），此时模型可能仍在生成其余内容。
+    """
+
+    def __init__(self, on_alert=None):
+        self.on_alert = on_alert
+        self.text = ''
+        self.done = False
+        self._parts = []
+        self._detector = None
+        self._alerted = set()
+
+    def start(self):
+        self._parts = []
+        self.text = ''
+        self.done = False
+        self._detector = ViolationDetector(self._on_violation)
+
+    def feed(self, line):
+        if not line or not line.startswith('data:'):
+            return  # 空行分隔事件，": ..." 为注释
+        data = line[5:].strip()
+        if data == '[DONE]':
+            self.done = True
+            self.text = ''.join(self._parts)
+            return
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring malformed stream event: {data[:200]}")
+            return
+        for choice in chunk.get('choices') or []:
+            content = (choice.get('delta') or {}).get('content')
+            if content:
+                self._parts.append(content)
+                self._detector.feed(content)
+            if choice.get('finish_reason'):
+                self.done = True
+        self.text = ''.join(self._parts)
+
+    def _on_violation(self, image_id):
+        # 重试时检测器会重建，已告警过的图片不重复告警
+        if image_id in self._alerted:
+            return
+        self._alerted.add(image_id)
+        if self.on_alert is not None:
+            try:
+                self.on_alert(image_id)
+            except Exception as e:
+                logging.error(f"Violation alert callback failed: {str(e)}")
@@ -0,0 +1,203 @@
+import itertools
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from src.metrics import registry
+
+# 各阶段按流水线顺序排列，summary() 和导出时按此排序
+STAGES = ('retrieve', 'buffer', 'motion_gate', 'queue', 'encode', 'ai', 'parse', 'db_queue', 'db_write')
+PERCENTILES = (50, 95, 99)
+
+FRAME_RESULT_AGE = registry.histogram('analysis_frame_age_seconds',
+                                      'Age of a frame (since capture) when its analysis is stored', ('stream',))
+
+_local = threading.local()
+
+
+class FrameTrace:
+    """一帧从采集到结果入库的各阶段耗时，时间均为 time.time()（采集进程写入的时间戳也是）。"""
+
+    __slots__ = ('tracer', 'trace_id', 'stream_id', 'captured_at', 'spans', 'handed_off', 'finished')
+
+    def __init__(self, tracer, trace_id, stream_id, captured_at=None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.stream_id = stream_id
+        self.captured_at = captured_at
+        self.spans = []  # (阶段, 开始, 结束)
+        self.handed_off = False  # 已交给写库线程，由其在提交后调用 finish()
+        self.finished = False
+
+    def add_span(self, name, start, end):
+        self.spans.append((name, start, max(start, end)))
+
+    def hand_off(self):
+        self.handed_off = True
+        return self
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self.tracer._record(self)
+
+    @property
+    def start(self):
+        if self.captured_at is not None:
+            return self.captured_at
+        return min(start for _, start, _ in self.spans) if self.spans else None
+
+    @property
+    def end(self):
+        return max(end for _, _, end in self.spans) if self.spans else None
+
+
+class Tracer:
+    """帧延迟追踪：完成的 FrameTrace 保存在最多 capacity 条的环形缓冲区中，capacity 为 0 时不追踪。
+
+    export_chrome_trace() 输出 Chrome trace（chrome://tracing、Perfetto）格式，每路流一个进程、
+    每帧一条异步轨道；summary() 按流和阶段统计 p50/p95/p99。
+    """
+
+    def __init__(self, capacity=1000):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._traces = deque(maxlen=max(1, capacity))
+        self.capacity = capacity
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def set_capacity(self, capacity):
+        with self._lock:
+            if capacity != self.capacity:
+                self.capacity = capacity
+                self._traces = deque(self._traces, maxlen=max(1, capacity))
+
+    def start(self, stream_id, captured_at=None):
+        """开始追踪一帧，未启用时返回 None（调用方无需再判断）。"""
+        if not self.enabled:
+            return None
+        return FrameTrace(self, next(self._ids), stream_id, captured_at)
+
+    def _record(self, trace):
+        if not trace.spans:
+            return
+        with self._lock:
+            self._traces.append(trace)
+        # 只统计结果已入库的帧；被变化检测跳过或分析失败的帧也会结束追踪，但没有结果
+        if trace.handed_off:
+            FRAME_RESULT_AGE.observe(trace.stream_id, value=trace.end - trace.start)
+
+    def traces(self):
+        with self._lock:
+            return list(self._traces)
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+    def summary(self):
+        """返回 {stream_id: {阶段: {'count', 'p50', 'p95', 'p99'}}}，单位为秒；'total' 为采集到入库的总耗时。"""
+        durations = {}
+        for trace in self.traces():
+            stages = durations.setdefault(trace.stream_id, {})
+            for name, start, end in trace.spans:
+                stages.setdefault(name, []).append(end - start)
+            stages.setdefault('total', []).append(trace.end - trace.start)
+        order = {name: index for index, name in enumerate(STAGES + ('total',))}
+        summary = {}
+        for stream_id, stages in durations.items():
+            summary[stream_id] = {}
+            for name in sorted(stages, key=lambda name: order.get(name, len(order))):
+                values = sorted(stages[name])
+                stats = {'count': len(values)}
+                for p in PERCENTILES:
+                    stats[f'p{p}'] = values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+                summary[stream_id][name] = stats
+        return summary
+
+    def format_summary(self):
+        lines = [f"{'stream':<12}{'stage':<14}{'count':>7}" + ''.join(f"{f'p{p} ms':>11}" for p in PERCENTILES)]
+        for stream_id, stages in self.summary().items():
+            for name, stats in stages.items():
+                lines.append(f"{str(stream_id):<12}{name:<14}{stats['count']:>7}" +
+                             ''.join(f"{stats[f'p{p}'] * 1000:>11.1f}" for p in PERCENTILES))
+        return '\n'.join(lines)
+
+    def export_chrome_trace(self, path=None):
+        """返回 Chrome trace 事件字典；指定 path 时同时写入文件。"""
+        events, pids = [], {}
+        for trace in self.traces():
+            pid = pids.get(trace.stream_id)
+            if pid is None:
+                pid = pids[trace.stream_id] = len(pids) + 1
+                events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                               'args': {'name': f'stream {trace.stream_id}'}})
+            args = {'stream': str(trace.stream_id), 'trace_id': trace.trace_id}
+            common = {'cat': 'frame', 'id': trace.trace_id, 'pid': pid, 'tid': 0}
+            # 外层为整帧，阶段按开始时间嵌套在其中
+            events.append(dict(common, name=f'frame {trace.trace_id}', ph='b', ts=trace.start * 1e6, args=args))
+            for name, start, end in sorted(trace.spans, key=lambda span: span[1]):
+                events.append(dict(common, name=name, ph='b', ts=start * 1e6))
+                events.append(dict(common, name=name, ph='e', ts=end * 1e6))
+            events.append(dict(common, name=f'frame {trace.trace_id}', ph='e', ts=trace.end * 1e6))
+        data = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if path:
+            with open(path, 'w') as f:
+                json.dump(data, f)
+        return data
+
+
+@contextmanager
+def activate(traces):
+    """在当前线程中设置正在处理的帧，供 span() 和写库线程取用。"""
+    previous = getattr(_local, 'traces', ())
+    _local.traces = tuple(trace for trace in traces if trace is not None)
+    try:
+        yield
+    finally:
+        _local.traces = previous
+
+
+def current_traces(stream_id=None):
+    traces = getattr(_local, 'traces', ())
+    if stream_id is None:
+        return traces
+    return tuple(trace for trace in traces if trace.stream_id == stream_id)
+
+
+def current_trace(stream_id):
+    traces = current_traces(stream_id)
+    return traces[0] if traces else None
+
+
+@contextmanager
+def span(name, stream_id=None):
+    """记录一个阶段；stream_id 为 None 时计入当前线程的所有帧（多图请求）。没有追踪中的帧时几乎没有开销。"""
+    traces = current_traces(stream_id)
+    if not traces:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        end = time.time()
+        for trace in traces:
+            trace.add_span(name, start, end)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
@@ -1,12 +1,13 @@
-import cv2
-import numpy as np
 import base64
 from datetime import datetime
 
 def extract_frame(frame):
+    import cv2
+    import numpy as np
     return cv2.cvtColor(np.array(frame.to_image()), cv2.COLOR_RGB2BGR)
 
 def save_frame(frame, filename):
+    import cv2
     cv2.imwrite(filename, frame)
 
 def encode_image(image_path):
@@ -15,4 +16,23 @@ def encode_image(image_path):
 
 def generate_filename():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    return f"frame_{timestamp}.jpg"
\ No newline at end of file
+    return f"frame_{timestamp}.jpg"
+
+def dhash(image, hash_size=8):
+    """差值感知哈希：返回 hash_size*hash_size 位整数，相似图片的汉明距离很小。"""
+    import cv2
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (resized[:, 1:] > resized[:, :-1]).flatten()
+    return int(''.join('1' if b else '0' for b in bits), 2)
+
+def dhash_base64_jpeg(base64_image, hash_size=8):
+    import cv2
+    import numpy as np
+    # 以 1/8 分辨率解码灰度图，只为计算哈希，开销很小
+    data = np.frombuffer(base64.b64decode(base64_image), dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    return dhash(image, hash_size)
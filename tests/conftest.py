@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from mock_ai_server import start_mock_server
+from src import db_handler
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**options):
+        server = start_mock_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def ai_config(tmp_path, monkeypatch):
+    """在临时目录中写入 ai_config.json 并切换到该目录，返回写入函数。"""
+    monkeypatch.chdir(tmp_path)
+
+    def write(api_base, **options):
+        config = {'ai_model': 'mock-model', 'api_key': 'mock-key', 'api_base': api_base, 'cache_enabled': False,
+                  'requests_per_minute': 6000, 'rate_burst': 10, 'max_attempts': 3}
+        config.update(options)
+        with open(tmp_path / 'ai_config.json', 'w') as f:
+            json.dump(config, f)
+        return config
+
+    return write
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """把数据库指向临时文件，结束后关闭各线程的连接。"""
+    path = str(tmp_path / 'video_streams.db')
+    monkeypatch.setattr(db_handler, 'DB_PATH', path)
+    yield path
+    db_handler.close_db_connections()
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+import requests
+
+from src.ai_engine import AIRequestEngine
+from src.rate_limiter import TokenBucket
+
+
+@pytest.fixture
+def engine():
+    engine = AIRequestEngine(max_concurrency=1, timeout=10, limiter=TokenBucket(6000, 100), max_attempts=3)
+    yield engine
+    engine.stop()
+
+
+def post(engine, server, stream_key, tag):
+    return engine.submit(stream_key, f"{server.url}/chat/completions", {}, {'tag': tag})
+
+
+def test_retries_rate_limited_and_server_errors(engine, mock_server):
+    server = mock_server(retry_after=0, status_sequence=[429, 500])
+    response = post(engine, server, 1, 'a').result(10)
+    assert response.status_code == 200
+    assert server.stats()['statuses'] == {429: 1, 500: 1, 200: 1}
+
+
+def test_gives_up_after_max_attempts(engine, mock_server):
+    server = mock_server(status_sequence=[500, 500, 500])
+    response = post(engine, server, 1, 'a').result(10)
+    assert response.status_code == 500
+    assert server.stats()['requests'] == 3
+
+
+def test_network_errors_are_retried_then_raised(engine):
+    future = engine.submit(1, 'http://127.0.0.1:9/chat/completions', {}, {})
+    with pytest.raises(requests.exceptions.ConnectionError):
+        future.result(10)
+
+
+def test_round_robin_across_streams(engine, mock_server):
+    server = mock_server(latency=0.3, record_requests=True)
+    futures = [post(engine, server, 'A', 'A1')]
+    # 第一个请求占住唯一的并发名额后再排队其余请求
+    deadline = time.monotonic() + 5
+    while not server.received and time.monotonic() < deadline:
+        time.sleep(0.01)
+    futures += [post(engine, server, 'A', 'A2'), post(engine, server, 'A', 'A3'), post(engine, server, 'B', 'B1')]
+    for future in futures:
+        assert future.result(10).status_code == 200
+    assert [request['tag'] for request in server.received] == ['A1', 'A2', 'B1', 'A3']
+
+
+def test_replaced_engine_does_not_report_metrics(monkeypatch):
+    from src import ai_engine
+    from src.metrics import registry
+    monkeypatch.setattr(ai_engine, '_engine', None)
+    old = ai_engine.get_ai_engine(max_concurrency=1)
+    old._in_flight = 3
+    new = ai_engine.get_ai_engine(max_concurrency=2)
+    try:
+        registry.collect()
+        assert ai_engine.AI_IN_FLIGHT.get() == 0
+        new._in_flight = 1
+        registry.collect()
+        assert ai_engine.AI_IN_FLIGHT.get() == 1
+    finally:
+        new._in_flight = 0
+        new.stop()
+        old.stop()
+
+
+def test_stop_when_idle_waits_for_running_coroutines(engine):
+    import asyncio
+    import threading
+
+    async def slow():
+        await asyncio.sleep(0.3)
+        return 'done'
+
+    results = []
+    runner = threading.Thread(target=lambda: results.append(engine.run(slow())), daemon=True)
+    runner.start()
+    time.sleep(0.1)
+    engine.stop_when_idle(poll_interval=0.05)
+    runner.join(5)
+    assert results == ['done']
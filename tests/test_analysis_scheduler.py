@@ -0,0 +1,42 @@
+import threading
+
+from src.analysis_scheduler import AnalysisScheduler
+
+
+def test_blocking_frame_source_does_not_delay_other_streams():
+    release = threading.Event()
+    handled = threading.Event()
+
+    def frame_source(stream_id):
+        if stream_id == 'slow':
+            release.wait(5)
+        return f'frame-{stream_id}'
+
+    def handler(stream_id, frame):
+        if stream_id == 'fast':
+            handled.set()
+
+    scheduler = AnalysisScheduler(handler, frame_source, max_workers=2, default_interval=60)
+    scheduler.add_stream('slow')
+    scheduler.add_stream('fast')
+    scheduler.start()
+    try:
+        assert handled.wait(2)
+    finally:
+        release.set()
+        scheduler.stop(wait=True)
+
+
+def test_stop_finishes_pending_traces():
+    from src.tracing import Tracer
+    tracer = Tracer()
+    scheduler = AnalysisScheduler(lambda stream_id, frame: None, max_workers=1, tracer=tracer)
+    trace = tracer.start(1)
+    trace.add_span('capture', 0.0, 1.0)
+    scheduler.add_stream(1)
+    with scheduler._cond:
+        scheduler._running.add(1)  # 让任务停留在队列中
+    scheduler.submit(1, 'frame', trace=trace)
+    scheduler.stop(wait=True)
+    assert trace.finished
+    assert tracer.traces() == [trace]
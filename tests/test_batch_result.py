@@ -0,0 +1,26 @@
+import json
+
+from src.ai_interface import split_batch_result
+
+IMAGE_IDS = ['image_1', 'image_2']
+
+
+def test_split_object_keyed_by_image_id():
+    response = '```json\n{"image_1": {"violation_detected": true}, "image_2": {"people": []}}\n```'
+    split = split_batch_result(response, IMAGE_IDS)
+    assert {image_id: json.loads(text) for image_id, text in split.items()} == {
+        'image_1': {'violation_detected': True}, 'image_2': {'people': []}}
+
+
+def test_split_list_and_results_wrapper():
+    items = [{'image_id': 'image_2', 'violation_detected': False}, {'image_id': 'image_1', '安全隐患': ['x']}]
+    for response in (json.dumps(items), json.dumps({'results': items})):
+        split = split_batch_result(response, IMAGE_IDS)
+        assert json.loads(split['image_1']) == {'安全隐患': ['x']}
+        assert json.loads(split['image_2']) == {'violation_detected': False}
+
+
+def test_split_drops_missing_and_malformed_images():
+    assert split_batch_result('{"image_1": {"people": []}, "image_2": "n/a", "image_9": {}}', IMAGE_IDS) == {
+        'image_1': '{"people": []}'}
+    assert split_batch_result('not json', IMAGE_IDS) == {}
@@ -0,0 +1,13 @@
+import sqlite3
+
+import pytest
+
+from src import db_handler
+
+
+def test_failed_write_does_not_leave_transaction_open(db_path):
+    db_handler.init_db()
+    db_handler.add_stream('rtsp://camera')
+    with pytest.raises(sqlite3.IntegrityError):
+        db_handler.add_stream('rtsp://camera')
+    assert not db_handler.get_db_connection().in_transaction
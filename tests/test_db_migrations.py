@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from src import db_handler
+
+
+def create_legacy_schema(path):
+    # 引入 user_version 之前的结构：缺少 added_time、prompt_template 等列
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE streams (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE);
+        CREATE TABLE analysis_results (id INTEGER PRIMARY KEY AUTOINCREMENT, stream_id INTEGER,
+                                       timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, result JSON);
+        CREATE TABLE person_features (id TEXT PRIMARY KEY, features TEXT, last_seen TIMESTAMP);
+        INSERT INTO streams (url) VALUES ('rtsp://camera');
+        INSERT INTO analysis_results (stream_id, result) VALUES (1, '{"安全隐患": ["x"], "people": [{}, {}]}');
+        INSERT INTO analysis_results (stream_id, result) VALUES (1, '{"violation_detected": false}');
+    ''')
+    conn.close()
+
+
+def columns(table):
+    return [row[1] for row in db_handler.get_db_connection().execute(f"PRAGMA table_info({table})")]
+
+
+def test_migrates_legacy_database(db_path):
+    create_legacy_schema(db_path)
+    assert db_handler.migrate() == db_handler.SCHEMA_VERSION
+    assert db_handler.get_schema_version() == db_handler.SCHEMA_VERSION
+    assert {'added_time', 'prompt_template'} <= set(columns('streams'))
+    assert {'violation_detected', 'people_count', 'source'} <= set(columns('analysis_results'))
+    assert {'position', 'action', 'created_at', 'stream_id'} <= set(columns('person_features'))
+    results = sorted(db_handler.get_analysis_results(1), key=lambda row: row['id'])
+    assert [(row['violation_detected'], row['people_count']) for row in results] == [(True, 2), (False, None)]
+    assert [stream['url'] for stream in db_handler.get_all_streams()] == ['rtsp://camera']
+
+
+def test_migrate_is_idempotent(db_path):
+    db_handler.init_db()
+    db_handler.add_stream('rtsp://camera')
+    assert db_handler.migrate() == db_handler.SCHEMA_VERSION
+    assert len(db_handler.get_all_streams()) == 1
+
+
+def test_failed_migration_rolls_back(db_path, monkeypatch):
+    def broken(cursor):
+        cursor.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(db_handler, 'MIGRATIONS', db_handler.MIGRATIONS[:1] + [(2, broken)])
+    with pytest.raises(RuntimeError):
+        db_handler.migrate()
+    assert db_handler.get_schema_version() == 1
+    assert 'half_done' not in [row[0] for row in db_handler.get_db_connection().execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")]
+
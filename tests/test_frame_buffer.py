@@ -0,0 +1,59 @@
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+from src.frame_buffer import SharedFrameBuffer
+
+WIDTH, HEIGHT = 320, 240
+
+
+@pytest.fixture
+def frame_buffer():
+    frame_buffer = SharedFrameBuffer(WIDTH, HEIGHT, slots=2)
+    yield frame_buffer
+    frame_buffer.close()
+    frame_buffer.unlink()
+
+
+def frame_for(seq):
+    # 整帧填充为序号对应的值，读到混合了两帧内容的帧时可以发现
+    return np.full((HEIGHT, WIDTH, 3), seq % 256, np.uint8)
+
+
+def write_frames(frame_buffer, stop_event):
+    while not stop_event.is_set():
+        frame_buffer.write(frame_for(frame_buffer.seq + 1))
+
+
+def test_read_latest_returns_newest_frame(frame_buffer):
+    assert frame_buffer.read_latest() is None
+    for seq in range(1, 4):
+        frame_buffer.write(frame_for(seq), grabbed_at=100.0 + seq)
+    seq, frame, _ = frame_buffer.read_latest(copy=True)
+    assert seq == 3 and (frame == 3).all()
+    assert frame_buffer.grab_time(3) == 103.0
+    # 两个槽位时序号 1 的槽位已被序号 3 覆盖
+    assert frame_buffer.grab_time(1) is None
+
+
+def test_copy_is_never_torn_while_writer_runs(frame_buffer):
+    stop_event = multiprocessing.Event()
+    writer = multiprocessing.Process(target=write_frames, args=(frame_buffer, stop_event))
+    writer.start()
+    try:
+        deadline = time.monotonic() + 2
+        reads = 0
+        while time.monotonic() < deadline:
+            latest = frame_buffer.read_latest(copy=True)
+            if latest is None:
+                continue
+            seq, frame, _ = latest
+            assert (frame == seq % 256).all(), f"frame {seq} was overwritten while being copied"
+            reads += 1
+        assert reads > 0
+        assert frame_buffer.seq > reads  # 写入方确实在读取期间不断覆盖槽位
+    finally:
+        stop_event.set()
+        writer.join(5)
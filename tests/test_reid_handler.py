@@ -0,0 +1,25 @@
+from src import reid_handler
+from src.reid_handler import ReIDStore
+
+
+def test_failed_load_is_not_retried_immediately(monkeypatch):
+    calls = []
+
+    def failing_read(since):
+        calls.append(since)
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(reid_handler, 'get_person_features', failing_read)
+    store = ReIDStore(persist=False)
+    store.load()
+    store.load()
+    assert len(calls) == 1
+
+
+def test_moving_person_drops_empty_stream():
+    store = ReIDStore(persist=False)
+    store._loaded = True
+    store.update(1, [{'id': 'p1'}])
+    store.update(2, [{'id': 'p1'}])
+    assert store.stats()['streams'] == 1
+    assert store.get_recent(2)[0]['id'] == 'p1'
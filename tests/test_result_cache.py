@@ -0,0 +1,9 @@
+from src import result_cache
+
+
+def test_shared_cache_follows_config_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, 'CACHE_DB_PATH', str(tmp_path / 'analysis_cache.db'))
+    monkeypatch.setattr(result_cache, '_cache', None)
+    cache = result_cache.get_result_cache(3, 3600, 5000)
+    assert result_cache.get_result_cache(5, 60, 100) is cache
+    assert (cache.max_distance, cache.ttl_seconds, cache.max_entries) == (5, 60, 100)
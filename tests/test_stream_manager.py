@@ -0,0 +1,19 @@
+import pytest
+
+from src import stream_manager
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.saved = []
+
+    def save_analysis_result(self, stream_id, analysis_result):
+        self.saved.append((stream_id, analysis_result))
+
+
+@pytest.mark.parametrize('prompt_type, saved', [('safety', 1), ('DEFAULT_PROMPT_TEMPLATE', 0)])
+def test_only_safety_results_are_saved(monkeypatch, prompt_type, saved):
+    writer = RecordingWriter()
+    monkeypatch.setattr(stream_manager, 'get_db_writer', lambda: writer)
+    stream_manager.handle_analysis_result('{"violation_detected": false}', 'frame.jpg', 'Stream: test', 1, prompt_type)
+    assert len(writer.saved) == saved
@@ -0,0 +1,27 @@
+from src.stream_supervisor import StreamSupervisor
+
+
+class DeadStreams:
+    def __init__(self):
+        self.streams = {1: 'rtsp://camera'}
+        self.frame_buffers = {}
+        self.restarted = []
+
+    def is_capture_alive(self, stream_id):
+        return False
+
+    def restart_stream(self, stream_id):
+        self.restarted.append(stream_id)
+
+
+def test_restart_counts_survive_stop():
+    manager = DeadStreams()
+    supervisor = StreamSupervisor(manager, backoff_base=0)
+    supervisor.check()  # 发现采集已退出，安排重启
+    supervisor.check()  # 退避为 0，立即重启
+    assert manager.restarted == [1]
+    assert supervisor.stats()['restarts'] == {1: 1}
+    supervisor.stop()
+    assert supervisor.stats()['restarts'] == {1: 1}
+    supervisor.forget(1)
+    assert supervisor.stats()['restarts'] == {}
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from src.ai_interface import AIInterface, get_engine
+from src.streaming import StreamingResponse, ViolationDetector
+
+
+def detect(text, chunk_size):
+    fired = []
+    detector = ViolationDetector(fired.append)
+    for offset in range(0, len(text), chunk_size):
+        detector.feed(text[offset:offset + chunk_size])
+    return fired
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1000])
+@pytest.mark.parametrize('text, expected', [
+    ('{"violation_detected": true, "description": "x"}', [None]),
+    ('```json\n{"violation_detected": false, "安全隐患": []}\n```', []),
+    ('{"安全隐患": ["未戴安全帽"]}', [None]),
+    ('{"description": "\\"violation_detected\\": true"}', []),
+    ('{"image_1": {"violation_detected": false}, "image_2": {"violation_detected": true}}', ['image_2']),
+    ('[{"image_id": "image_1", "violation_detected": true}]', ['image_1']),
+    ('[{"violation_detected": true, "image_id": "image_2"}]', ['image_2']),
+    ('{"results": [{"violation_detected": false}, {"安全隐患": ["x"]}]}', ['image_2']),
+    ('{"violation_detected": true} {"violation_detected": true}', [None]),
+])
+def test_violation_detector(text, expected, chunk_size):
+    assert detect(text, chunk_size) == expected
+
+
+def test_streaming_response_fires_once_across_retries():
+    alerts = []
+    response = StreamingResponse(alerts.append)
+    for _ in range(2):
+        response.start()
+        response.feed('data: ' + json.dumps({'choices': [{'delta': {'content': '{"violation_detected": true}'}}]}))
+    response.feed('data: [DONE]')
+    assert response.done
+    assert response.text == '{"violation_detected": true}'
+    assert alerts == [None]
+
+
+def test_streaming_response_finish_reason_completes():
+    response = StreamingResponse()
+    response.start()
+    response.feed(': keep-alive')
+    response.feed('data: ' + json.dumps({'choices': [{'delta': {'content': '{}'}, 'finish_reason': 'stop'}]}))
+    assert response.done and response.text == '{}'
+
+
+def send(server, on_alert=None):
+    interface = AIInterface('mock-key', server.url, 'mock-model', stream_id=1, streaming=True)
+    return get_engine().run(interface.send_request_async('prompt', 'AAAA', on_alert))
+
+
+def test_sse_request_alerts_before_completion(mock_server, ai_config):
+    server = mock_server(result={'violation_detected': True, 'description': 'x' * 50}, token_delay=0.01)
+    ai_config(server.url)
+    alerts = []
+    assert json.loads(send(server, alerts.append)) == server.result
+    assert alerts == [None]
+
+
+def test_sse_stream_without_done_is_retried(mock_server, ai_config):
+    server = mock_server(truncate_streams=1)
+    ai_config(server.url)
+    assert json.loads(send(server)) == server.result
+    assert server.stats()['requests'] == 2
+
+
+def test_sse_stream_truncated_on_every_attempt_fails(mock_server, ai_config):
+    server = mock_server(truncate_streams=10)
+    ai_config(server.url)
+    assert send(server) is None
+    assert server.stats()['requests'] == 3